@@ -89,10 +89,11 @@ class Task:
             return False
 
 class TaskAllocation:
-    def __init__(self, allocation_id: str, job_id: str, task_group: str):
+    def __init__(self, allocation_id: str, job_id: str, task_group: str, index: int = 0):
         self.id = allocation_id
         self.job_id = job_id
         self.task_group = task_group
+        self.index = index  # 任务组内的实例序号
         self.status = AllocationStatus.PENDING
         self.start_time = None
         self.end_time = None
@@ -143,6 +144,12 @@ class NodeAgent:
         self.ip_address = self._get_local_ip()
         self.healthy = True
         self.heartbeat_interval = 5  # 心跳间隔（秒）
+        self.full_resync_every = 12  # 每隔多少个增量心跳发送一次全量心跳
+        self.heartbeat_seq = 0  # 最近发送的心跳序号
+        self.acked_seq = None  # 服务器最近确认的心跳序号
+        self._acked_allocations: Dict[str, Dict] = {}  # 服务器已确认的分配状态快照
+        self._heartbeats_since_full = 0
+        self._resync_requested = True  # 启动后第一个心跳为全量心跳
         self.agent_port = agent_port
         self.allocations: Dict[str, TaskAllocation] = {}  # 存储分配ID到分配对象的映射
         self.task_monitor_thread = threading.Thread(target=self._monitor_tasks, daemon=True)
@@ -208,7 +215,8 @@ class NodeAgent:
             allocation = TaskAllocation(
                 data["allocation_id"],
                 data["job_id"],
-                task_group_data["name"]
+                task_group_data["name"],
+                data.get("index", 0)
             )
             
             # 为每个任务创建Task对象
@@ -256,6 +264,7 @@ class NodeAgent:
                 "allocation_id": allocation.id,
                 "job_id": allocation.job_id,
                 "task_group": allocation.task_group,
+                "index": allocation.index,
                 "status": allocation.status.value,
                 "start_time": allocation.start_time,
                 "end_time": allocation.end_time,
@@ -280,6 +289,16 @@ class NodeAgent:
                 "message": f"Allocation {allocation_id} stopped and removed"
             }), 200
 
+    @staticmethod
+    def _task_environment(allocation: TaskAllocation) -> Dict[str, str]:
+        """传给任务的环境变量，任务可据此区分同一任务组的不同实例"""
+        return {
+            "NOMAD_JOB_ID": allocation.job_id,
+            "NOMAD_GROUP_NAME": allocation.task_group,
+            "NOMAD_ALLOC_ID": allocation.id,
+            "NOMAD_ALLOC_INDEX": str(allocation.index)
+        }
+
     def execute_task(self, allocation: TaskAllocation, task: Task):
         """执行单个任务"""
         try:
@@ -303,7 +322,8 @@ class NodeAgent:
                         ports={f"{task.config['port']}/tcp": task.config['port']} if "port" in task.config else None,
                         mem_limit=f"{task.resources['memory']}m",
                         cpu_quota=int(task.resources['cpu'] * 1000),  # 转换为微秒配额
-                        cpu_period=100000  # 默认的CPU周期为100ms
+                        cpu_period=100000,  # 默认的CPU周期为100ms
+                        environment=self._task_environment(allocation)
                     )
                     task.process = container.id
                     task.message = f"容器ID: {container.id}"  # 添加容器ID到message
@@ -328,7 +348,8 @@ class NodeAgent:
                     task.config["command"],
                     shell=True,
                     stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
+                    stderr=subprocess.PIPE,
+                    env=dict(os.environ, **self._task_environment(allocation))
                 )
                 task.process = process.pid
                 task.message = f"进程ID: {process.pid}"  # 添加进程ID到message
@@ -400,38 +421,72 @@ class NodeAgent:
             print(f"[Agent] 注册错误: {e}")
             return False
 
-    def send_heartbeat(self):
-        """发送心跳信息"""
-        # 收集所有分配的状态信息
-        allocations_status = {}
-        for allocation_id, allocation in self.allocations.items():
-            tasks_status = {}
-            for task_name, task in allocation.tasks.items():
-                tasks_status[task_name] = {
-                    "status": task.status.value,
-                    "start_time": task.start_time,
-                    "end_time": task.end_time,
-                    "message": task.message  # 添加message字段
-                }
-                print(f"[Agent] 心跳 - 任务状态: allocation_id={allocation_id}, task={task_name}, status={task.status.value}, message={task.message}")
-            
-            allocations_status[allocation_id] = {
+    def _allocation_snapshot(self) -> Dict[str, Dict]:
+        """收集所有分配及其任务的当前状态"""
+        snapshot = {}
+        for allocation_id, allocation in list(self.allocations.items()):
+            snapshot[allocation_id] = {
                 "status": allocation.status.value,
                 "start_time": allocation.start_time,
                 "end_time": allocation.end_time,
-                "tasks": tasks_status
+                "tasks": {
+                    task_name: {
+                        "status": task.status.value,
+                        "start_time": task.start_time,
+                        "end_time": task.end_time,
+                        "message": task.message
+                    } for task_name, task in allocation.tasks.items()
+                }
             }
-            print(f"[Agent] 心跳 - 分配状态: allocation_id={allocation_id}, status={allocation.status.value}")
+        return snapshot
 
+    @staticmethod
+    def _allocation_delta(snapshot: Dict[str, Dict], acked: Dict[str, Dict]) -> Dict[str, Dict]:
+        """返回相对已确认快照发生变化的分配，每个分配只包含变化的任务"""
+        delta = {}
+        for allocation_id, allocation_status in snapshot.items():
+            previous = acked.get(allocation_id)
+            if previous is None:
+                delta[allocation_id] = allocation_status
+                continue
+            changed_tasks = {
+                task_name: task_status
+                for task_name, task_status in allocation_status["tasks"].items()
+                if previous["tasks"].get(task_name) != task_status
+            }
+            allocation_changed = any(
+                previous[field] != allocation_status[field] for field in ("status", "start_time", "end_time")
+            )
+            if allocation_changed or changed_tasks:
+                delta[allocation_id] = dict(allocation_status, tasks=changed_tasks)
+        return delta
+
+    def send_heartbeat(self):
+        """发送心跳信息
+
+        只发送自服务器最近确认的心跳以来发生变化的分配和任务；启动时、服务器要求时
+        以及每隔full_resync_every个增量心跳发送一次全量心跳。
+        """
+        snapshot = self._allocation_snapshot()
+        full = self._resync_requested or self._heartbeats_since_full >= self.full_resync_every
+        allocations_status = snapshot if full else self._allocation_delta(snapshot, self._acked_allocations)
+        for allocation_id, allocation_status in allocations_status.items():
+            print(f"[Agent] 心跳 - 分配状态: allocation_id={allocation_id}, status={allocation_status['status']}, "
+                  f"变化的任务={list(allocation_status['tasks'])}")
+
+        self.heartbeat_seq += 1
         heartbeat_data = {
             "node_id": self.node_id,
             "resources": self.get_resources(),
             "healthy": self.healthy,
             "timestamp": time.time(),
+            "seq": self.heartbeat_seq,
+            "base_seq": self.acked_seq,
+            "full": full,
             "allocations": allocations_status
         }
         
-        print(f"[Agent] 发送心跳: node_id={self.node_id}, healthy={self.healthy}")
+        print(f"[Agent] 发送心跳: node_id={self.node_id}, healthy={self.healthy}, seq={self.heartbeat_seq}, full={full}")
         
         try:
             response = requests.post(
@@ -440,8 +495,24 @@ class NodeAgent:
             )
             if response.status_code != 200:
                 print(f"[Agent] 心跳发送失败: {response.status_code}")
-            else:
-                print(f"[Agent] 心跳发送成功")
+                return
+
+            ack = response.json()
+            if ack.get("resync"):
+                # 服务器与本地的序号不一致，下一个心跳发送全量状态
+                print(f"[Agent] 服务器要求全量同步")
+                self._resync_requested = True
+                return
+            if ack.get("ack_seq") != self.heartbeat_seq:
+                # 心跳未被确认（例如时间戳乱序被丢弃），保持原有的确认点
+                print(f"[Agent] 心跳未被确认: seq={self.heartbeat_seq}")
+                return
+
+            self.acked_seq = self.heartbeat_seq
+            self._acked_allocations = snapshot
+            self._resync_requested = False
+            self._heartbeats_since_full = 0 if full else self._heartbeats_since_full + 1
+            print(f"[Agent] 心跳发送成功")
         except Exception as e:
             print(f"[Agent] 心跳错误: {e}")
 
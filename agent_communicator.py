@@ -37,6 +37,7 @@ class AgentCommunicator:
                 "allocation_id": allocation.id,
                 "job_id": allocation.job_id,
                 "task_group": task_group_data,
+                "index": allocation.index,
                 "status": allocation.status.value
             }
             
@@ -1,18 +1,40 @@
 import threading
-import time
-import queue
-from typing import List
-from models import Allocation, AllocationStatus
+from typing import Dict, List, Optional
+from models import Allocation, AllocationStatus, DEFAULT_JOB_PRIORITY, JobStatus, RESOURCE_DIMENSIONS
 from agent_communicator import AgentCommunicator
-import sqlite3
+from priority_queue import AGING_RATE, PriorityQueue
+
+class PlanResult:
+    """计划的应用结果，计划处理完成后wait返回True"""
+
+    def __init__(self):
+        self.created: List[Allocation] = []   # 复核通过并已执行的分配
+        self.rejected: List[Allocation] = []  # 复核时容量不足而被拒绝的分配
+        self.preempted: List[Dict] = []       # 被抢占而停止的分配（allocation_id, job_id, node_id, priority, resources）
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def set_done(self):
+        self._done.set()
 
 class AllocationExecutor:
-    def __init__(self, node_manager):
+    """分配执行器，同时是唯一的计划应用者
+
+    多个调度工作线程基于各自的节点快照乐观地生成计划，计划按作业优先级（带老化）出队并在这里串行应用：
+    先执行删除，再按最新的已分配资源台账逐个复核新分配所在节点的容量，
+    满足的分配立即执行并计入台账，不满足的分配被拒绝，由调度器重新评估。
+    计划中被抢占的分配只在所在节点的新分配确定创建时才停止，过时的或被拒绝的计划不会抢占。
+    """
+
+    def __init__(self, node_manager, aging_rate: float = AGING_RATE):
         self.node_manager = node_manager
         self.agent_communicator = AgentCommunicator()
         self.node_manager.agent_client = self.agent_communicator  # 暂时保留用于兼容性，后续应该修改node_manager
-        self.plan_queue = queue.Queue()
+        self.plan_queue = PriorityQueue(aging_rate)
         self.is_running = False
+        self.stats = {"plans": 0, "committed": 0, "rejected": 0, "partial_plans": 0, "preempted": 0}
         
         # 启动计划处理线程
         self.plan_thread = threading.Thread(target=self.process_plans, daemon=True)
@@ -24,14 +46,22 @@ class AllocationExecutor:
         """注册agent的endpoint"""
         self.agent_communicator.register_agent(node_id, endpoint)
 
-    def submit_plan(self, plan: List[Allocation], allocations_to_delete: List[str] = None):
-        """将完整计划（包括要创建和要删除的分配）加入队列"""
+    def submit_plan(self, plan: List[Allocation], allocations_to_delete: List[str] = None,
+                    priority: int = DEFAULT_JOB_PRIORITY, preemptions: List[Dict] = None) -> PlanResult:
+        """将完整计划（包括要创建、要删除和要抢占的分配）按作业优先级加入队列
+
+        Returns:
+            PlanResult: 计划处理完成后可读取被执行和被拒绝的分配
+        """
         complete_plan = {
             "create": plan,
-            "delete": allocations_to_delete or []
+            "delete": allocations_to_delete or [],
+            "preempt": preemptions or [],
+            "result": PlanResult()
         }
-        self.plan_queue.put(complete_plan)
+        self.plan_queue.put(complete_plan, priority)
         print(f"[AllocationExecutor] 已将分配计划加入队列: 创建 {len(plan)} 个, 删除 {len(allocations_to_delete or [])} 个")
+        return complete_plan["result"]
 
     def stop_allocation(self, allocation_id: str) -> bool:
         """停止分配并从数据库中删除
@@ -57,46 +87,110 @@ class AllocationExecutor:
         return True
 
     def process_plans(self):
-        """处理计划队列中的计划"""
+        """处理计划队列中的计划：阻塞等待新计划，队列关闭且已取空时退出"""
         while True:
+            plan = self.plan_queue.get()
+            if plan is None:
+                return
             try:
-                if not self.plan_queue.empty():
-                    plan = self.plan_queue.get()
-                    allocations_to_create = plan["create"]
-                    allocations_to_delete = plan["delete"]
-                    
-                    # 1. 首先处理要删除的分配
-                    if allocations_to_delete:
-                        print(f"[AllocationExecutor] 删除 {len(allocations_to_delete)} 个旧分配: {allocations_to_delete}")
-                        for allocation_id in allocations_to_delete:
-                            self.stop_allocation(allocation_id)
-                    
-                    # 2. 然后处理要创建的分配
-                    if allocations_to_create:
-                        print(f"[AllocationExecutor] 正在执行分配计划: {[alloc.id for alloc in allocations_to_create]}")
-                        for allocation in allocations_to_create:
-                            try:
-                                # 更新分配状态为运行中
-                                allocation.status = AllocationStatus.RUNNING
-                                
-                                # 发送分配计划到agent
-                                result = self.agent_communicator.send_allocation(allocation)
-                                if result:
-                                    # 更新本地状态
-                                    self.node_manager.update_allocation(allocation)
-                                    print(f"[AllocationExecutor] 已创建分配 {allocation.id}, 节点: {allocation.node_id}")
-                                else:
-                                    # 分配失败
-                                    allocation.status = AllocationStatus.FAILED
-                                    self.node_manager.update_allocation(allocation)
-                                    print(f"[AllocationExecutor] 分配失败 {allocation.id}")
-                            except Exception as e:
-                                print(f"[AllocationExecutor] 处理分配时出错: {e}")
-                                allocation.status = AllocationStatus.FAILED
-                                self.node_manager.update_allocation(allocation)
+                self._apply_plan(plan)
             except Exception as e:
                 print(f"[AllocationExecutor] 处理计划时出错: {e}")
-            time.sleep(1)
+            finally:
+                plan["result"].set_done()
+
+    def _apply_plan(self, plan: dict):
+        """先删除旧分配，再复核容量并创建新分配；被抢占的分配只在需要它的新分配确定创建时才停止"""
+        allocations_to_create = plan["create"]
+        allocations_to_delete = plan["delete"]
+        plan_result: PlanResult = plan["result"]
+        self.stats["plans"] += 1
+
+        # 0. 评估期间作业已被停止的，计划已过时，不再创建分配，也不抢占
+        if allocations_to_create:
+            job = self.node_manager.get_job(allocations_to_create[0].job_id)
+            if job is None or job["status"] == JobStatus.DEAD.value:
+                print(f"[AllocationExecutor] 作业 {allocations_to_create[0].job_id} 已停止，丢弃 {len(allocations_to_create)} 个待创建的分配"
+                      f"和 {len(plan['preempt'])} 个抢占")
+                allocations_to_create = []
+        # 节点 -> 尚未停止的被抢占分配（按规划器选取的顺序）
+        pending_victims: Dict[str, List[Dict]] = {}
+        if allocations_to_create:
+            for victim in plan["preempt"]:
+                pending_victims.setdefault(victim["node_id"], []).append(victim)
+
+        # 1. 首先处理要删除的分配
+        if allocations_to_delete:
+            print(f"[AllocationExecutor] 删除 {len(allocations_to_delete)} 个旧分配: {allocations_to_delete}")
+            for allocation_id in allocations_to_delete:
+                self.stop_allocation(allocation_id)
+
+        # 2. 然后处理要创建的分配
+        if allocations_to_create:
+            print(f"[AllocationExecutor] 正在执行分配计划: {len(allocations_to_create)} 个分配")
+            for allocation in allocations_to_create:
+                # 按最新状态复核容量，计划生成后被其他计划占用的资源不会被重复分配；
+                # 容量不足时计入本节点上被抢占分配腾出的资源，放得下才停止这些分配
+                victims = self._victims_to_stop(allocation, pending_victims.get(allocation.node_id, []))
+                if victims is None:
+                    print(f"[AllocationExecutor] 节点 {allocation.node_id} 容量不足，拒绝分配 {allocation.id}")
+                    plan_result.rejected.append(allocation)
+                    continue
+                if victims:
+                    self._preempt(victims, plan_result)
+                    del pending_victims[allocation.node_id][:len(victims)]
+                plan_result.created.append(allocation)
+                try:
+                    # 更新分配状态为运行中
+                    allocation.status = AllocationStatus.RUNNING
+
+                    # 发送分配计划到agent
+                    result = self.agent_communicator.send_allocation(allocation)
+                    if result:
+                        # 更新本地状态
+                        self.node_manager.update_allocation(allocation)
+                        print(f"[AllocationExecutor] 已创建分配 {allocation.id}, 节点: {allocation.node_id}")
+                    else:
+                        # 分配失败
+                        allocation.status = AllocationStatus.FAILED
+                        self.node_manager.update_allocation(allocation)
+                        print(f"[AllocationExecutor] 分配失败 {allocation.id}")
+                except Exception as e:
+                    print(f"[AllocationExecutor] 处理分配时出错: {e}")
+                    allocation.status = AllocationStatus.FAILED
+                    self.node_manager.update_allocation(allocation)
+
+        if plan_result.preempted:
+            self.node_manager.mark_preempted(dict.fromkeys(victim["job_id"] for victim in plan_result.preempted))
+        unused = sum(len(victims) for victims in pending_victims.values())
+        if unused:
+            print(f"[AllocationExecutor] {unused} 个计划抢占的分配未被停止（对应的新分配未创建）")
+
+        self.stats["committed"] += len(plan_result.created)
+        self.stats["rejected"] += len(plan_result.rejected)
+        if plan_result.rejected:
+            self.stats["partial_plans"] += 1
+
+    def _victims_to_stop(self, allocation: Allocation, victims: List[Dict]) -> Optional[List[Dict]]:
+        """放下新分配需要停止的被抢占分配（victims的前缀），不需要抢占时为空列表，抢占后仍放不下时返回None"""
+        required = allocation.task_group.get_total_resources()
+        freed = dict.fromkeys(RESOURCE_DIMENSIONS, 0)
+        for count in range(len(victims) + 1):
+            if count:
+                for dimension, amount in victims[count - 1]["resources"].items():
+                    freed[dimension] = freed.get(dimension, 0) + amount
+            needed = {dimension: required.get(dimension, 0) - freed[dimension] for dimension in RESOURCE_DIMENSIONS}
+            if self.node_manager.node_has_capacity(allocation.node_id, needed):
+                return victims[:count]
+        return None
+
+    def _preempt(self, victims: List[Dict], plan_result: PlanResult):
+        """停止被抢占的分配，腾出的资源供新分配使用；被抢占的作业等待重新调度"""
+        print(f"[AllocationExecutor] 抢占 {len(victims)} 个低优先级分配")
+        for victim in victims:
+            self.stop_allocation(victim["allocation_id"])
+            plan_result.preempted.append(victim)
+        self.stats["preempted"] += len(victims)
 
     def start(self):
         """启动分配执行器服务"""
@@ -109,6 +203,7 @@ class AllocationExecutor:
         """停止分配执行器服务"""
         self.is_running = False
         if self.plan_thread:
+            self.plan_queue.close()
             self.plan_thread.join()
         print("[AllocationExecutor] 服务已停止")
 
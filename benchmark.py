@@ -0,0 +1,802 @@
+"""myNomad 性能基准测试
+
+用法:
+    python benchmark.py heartbeat [--nodes 200] [--allocs-per-node 5] [--rounds 5]
+    python benchmark.py reads [--nodes 200] [--allocs-per-node 5] [--rounds 200]
+    python benchmark.py plan [--nodes 5000] [--rounds 20] [--groups 1]
+    python benchmark.py heartbeat-load [--nodes 1000] [--allocs-per-node 5] [--senders 8] [--interval 0.1] [--duration 5]
+    python benchmark.py evals [--sizes 1000,10000,50000] [--groups 4] [--rounds 10]
+    python benchmark.py packing [--nodes 100] [--jobs 2000] [--scorers binpack,spread,worst-fit] [--seed 0]
+    python benchmark.py count [--nodes 2000] [--instances 500,10000] [--rounds 3]
+    python benchmark.py batch [--nodes 1000] [--jobs 1000]
+    python benchmark.py blocked [--nodes 100] [--jobs 1000] [--releases 50]
+    python benchmark.py priority [--nodes 200] [--flood 5000] [--probes 20]
+    python benchmark.py node-failure [--nodes 100] [--rack-size 20] [--jobs 2000] [--count 4] [--rate 200] [--burst 50]
+    python benchmark.py preemption [--nodes 100] [--allocs-per-node 12] [--seed 0]
+"""
+from typing import Dict, List
+import argparse
+import contextlib
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from blocked_evals import BlockedEvals
+from cluster_snapshot import ClusterSnapshot
+from models import Allocation, AllocationStatus, Job, TriggerEvent
+from node_manager import NodeManager
+from heartbeat_pipeline import HeartbeatPipeline
+from metrics import percentile
+from scheduler_planner import SchedulerPlanner
+from models import RESOURCE_DIMENSIONS
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽组件的日志输出，避免print本身影响测量结果"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def _make_cluster(node_manager: NodeManager, nodes: int, allocs_per_node: int) -> List[Dict]:
+    """直接向数据库写入节点、作业和分配记录并重建内存状态，返回每个节点的心跳模板"""
+    heartbeats = []
+    with node_manager.storage.transaction() as cursor:
+        for _ in range(nodes):
+            node_id = str(uuid.uuid4())
+            allocations = {}
+            for _ in range(allocs_per_node):
+                allocation_id = str(uuid.uuid4())
+                job_id = str(uuid.uuid4())
+                task_groups = [{"name": "group", "tasks": [{"name": "task", "resources": {"cpu": 10, "memory": 16}}]}]
+                cursor.execute('''
+                    INSERT INTO jobs (job_id, task_groups, constraints, status)
+                    VALUES (?, ?, ?, ?)
+                ''', (job_id, json.dumps(task_groups), json.dumps({}), "running"))
+                cursor.execute('''
+                    INSERT INTO allocations (allocation_id, job_id, node_id, task_group, status)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (allocation_id, job_id, node_id, "group", "running"))
+                allocations[allocation_id] = {
+                    "status": "running",
+                    "start_time": time.time(),
+                    "end_time": None,
+                    "tasks": {"task": {"status": "running", "start_time": time.time(), "end_time": None, "message": None}}
+                }
+            cursor.execute('''
+                INSERT INTO nodes (node_id, ip_address, cpu, memory, healthy, last_heartbeat)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (node_id, "127.0.0.1", 1000, 4096, 1, time.time()))
+            heartbeats.append({
+                "node_id": node_id,
+                "resources": {"cpu": 1000, "memory": 4096, "cpu_used": 0, "memory_used": 0},
+                "healthy": True,
+                "timestamp": time.time(),
+                "allocations": allocations
+            })
+    node_manager.state.load(node_manager.storage)
+    return heartbeats
+
+def _legacy_update_heartbeat(db_path: str, heartbeat_data: Dict):
+    """重构前的心跳写入路径：每次新建连接，默认回滚日志模式"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    resources = heartbeat_data["resources"]
+    cursor.execute('UPDATE nodes SET cpu = ?, memory = ?, healthy = ?, last_heartbeat = ? WHERE node_id = ?', (
+        resources["cpu"], resources["memory"], 1, heartbeat_data["timestamp"], heartbeat_data["node_id"]))
+    for allocation_id, allocation_status in heartbeat_data["allocations"].items():
+        cursor.execute('UPDATE allocations SET status = ?, start_time = ?, end_time = ?, last_update = ? WHERE allocation_id = ?', (
+            allocation_status["status"], allocation_status["start_time"], allocation_status["end_time"],
+            heartbeat_data["timestamp"], allocation_id))
+        for task_name, task_status in allocation_status["tasks"].items():
+            cursor.execute('''
+                INSERT OR REPLACE INTO task_status
+                (allocation_id, task_name, status, start_time, end_time, error, exit_code, last_update, message)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (allocation_id, task_name, task_status["status"], task_status["start_time"], task_status["end_time"],
+                  None, None, heartbeat_data["timestamp"], task_status["message"]))
+    conn.commit()
+    conn.close()
+
+def _rate(count: int, elapsed: float) -> float:
+    return count / elapsed if elapsed > 0 else float("inf")
+
+def bench_heartbeat(args) -> Dict:
+    """对比每次新建连接(before)与共享WAL连接层(after)的心跳吞吐"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # before: 独立的回滚日志数据库
+        legacy_path = os.path.join(tmp, "legacy.db")
+        with quiet():
+            legacy_manager = NodeManager(legacy_path)
+            heartbeats = _make_cluster(legacy_manager, args.nodes, args.allocs_per_node)
+        legacy_manager.journal.close()
+        legacy_manager.storage.close()
+        legacy_conn = sqlite3.connect(legacy_path)
+        legacy_conn.execute("PRAGMA journal_mode=DELETE")
+        legacy_conn.close()
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for heartbeat in heartbeats:
+                _legacy_update_heartbeat(legacy_path, heartbeat)
+        results["before_heartbeats_per_sec"] = _rate(args.rounds * len(heartbeats), time.perf_counter() - start)
+
+        # after: NodeManager + Storage
+        with quiet():
+            node_manager = NodeManager(os.path.join(tmp, "nomad.db"))
+            heartbeats = _make_cluster(node_manager, args.nodes, args.allocs_per_node)
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                for heartbeat in heartbeats:
+                    node_manager.update_heartbeat(heartbeat)
+            # 包含写后日志落盘的时间
+            node_manager.flush()
+            elapsed = time.perf_counter() - start
+        results["after_heartbeats_per_sec"] = _rate(args.rounds * len(heartbeats), elapsed)
+        node_manager.journal.close()
+        node_manager.storage.close()
+
+    results["speedup"] = results["after_heartbeats_per_sec"] / results["before_heartbeats_per_sec"]
+    return results
+
+def _legacy_reads(db_path: str) -> Dict:
+    """重构前的读取路径：每次新建连接查询SQLite并解析JSON列"""
+    def get_healthy_nodes():
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute('SELECT node_id, ip_address, cpu, memory, healthy, last_heartbeat FROM nodes WHERE healthy = 1').fetchall()
+        conn.close()
+        return [{"node_id": r[0], "ip_address": r[1], "resources": {"cpu": r[2], "memory": r[3]},
+                 "healthy": bool(r[4]), "last_heartbeat": r[5]} for r in rows]
+
+    def get_job(job_id):
+        conn = sqlite3.connect(db_path)
+        row = conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        conn.close()
+        return {"job_id": row[0], "task_groups": json.loads(row[1]), "constraints": json.loads(row[2]), "status": row[3]}
+
+    def get_job_allocations(job_id):
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute('SELECT allocation_id, node_id, task_group, status FROM allocations WHERE job_id = ?', (job_id,)).fetchall()
+        conn.close()
+        return [{"allocation_id": r[0], "node_id": r[1], "task_group": r[2], "status": r[3]} for r in rows]
+
+    return {"get_healthy_nodes": get_healthy_nodes, "get_job": get_job, "get_job_allocations": get_job_allocations}
+
+def _time_call(func, rounds: int, *args) -> float:
+    """返回单次调用的平均耗时(微秒)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(*args)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+def bench_reads(args) -> Dict:
+    """对比SQLite读取(before)与内存状态读取(after)的单次调用耗时"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, quiet():
+        node_manager = NodeManager(os.path.join(tmp, "nomad.db"))
+        _make_cluster(node_manager, args.nodes, args.allocs_per_node)
+        job_id = next(iter(node_manager.state.jobs))
+        legacy = _legacy_reads(node_manager.db_path)
+        for name, legacy_func, func, call_args in (
+            ("get_healthy_nodes", legacy["get_healthy_nodes"], node_manager.get_healthy_nodes, ()),
+            ("get_job", legacy["get_job"], node_manager.get_job, (job_id,)),
+            ("get_job_allocations", legacy["get_job_allocations"], node_manager.get_job_allocations, (job_id,)),
+        ):
+            results[name] = {
+                "before_us": _time_call(legacy_func, args.rounds, *call_args),
+                "after_us": _time_call(func, args.rounds, *call_args)
+            }
+        node_manager.journal.close()
+        node_manager.storage.close()
+    return results
+
+class _NoAllocations:
+    """只提供评估所需的状态读取，隔离数据库开销：没有现有分配，也没有可抢占的分配"""
+
+    def get_job_allocations(self, job_id):
+        return []
+
+    def preemptible_allocations(self, node_ids, max_priority, exclude_job_id=None):
+        return {}
+
+class _LegacyPlanner(SchedulerPlanner):
+    """重构前的节点准备方式：资源为JSON字符串，每次评估对每个节点做JSON往返深拷贝并解析资源"""
+
+    def _cluster_snapshot(self):
+        copies = []
+        for node_data in self.original_nodes_snapshot:
+            copied_node_data = json.loads(json.dumps(node_data))
+            copied_node_data['resources'] = json.loads(copied_node_data['resources'])
+            copies.append(copied_node_data)
+        return ClusterSnapshot(copies)
+
+def _eval_peak_kib(planner) -> float:
+    """单次评估分配内存的峰值(KiB)"""
+    tracemalloc.start()
+    try:
+        planner.process(_NoAllocations())
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+def bench_plan(args) -> Dict:
+    """单次评估的耗时和内存峰值：JSON资源深拷贝(before)、每次评估复制节点列表(copy)、共享集群快照(after)"""
+    task_groups = [{"name": f"group-{index}", "tasks": [{"name": "nginx", "resources": {"cpu": 100, "memory": 256}, "config": {}}]}
+                   for index in range(args.groups)]
+    results = {"nodes": args.nodes}
+    nodes = [{
+        "node_id": str(uuid.uuid4()),
+        "ip_address": "127.0.0.1",
+        "resources": {"cpu": 1000 + i % 7, "memory": 4096, "cpu_used": 0, "memory_used": 0},
+        "healthy": True,
+        "last_heartbeat": time.time()
+    } for i in range(args.nodes)]
+    legacy_nodes = [dict(node, resources=json.dumps(node["resources"])) for node in nodes]
+    snapshot = ClusterSnapshot(nodes, version=1)
+    job = Job(str(uuid.uuid4()), task_groups, {})
+
+    variants = (
+        ("before", _LegacyPlanner, lambda: legacy_nodes),
+        # 每次评估复制一份节点列表并重建容量矩阵（快照共享之前的做法）
+        ("copy", SchedulerPlanner, lambda: [dict(node, resources=dict(node["resources"])) for node in nodes]),
+        ("after", SchedulerPlanner, lambda: snapshot),
+    )
+    with quiet():
+        for name, planner_class, snapshot_for_eval in variants:
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                planner_class(str(uuid.uuid4()), TriggerEvent.JOB_SUBMIT, job, snapshot_for_eval()).process(_NoAllocations())
+            results[f"{name}_eval_ms"] = (time.perf_counter() - start) / args.rounds * 1e3
+            results[f"{name}_peak_kib"] = _eval_peak_kib(
+                planner_class(str(uuid.uuid4()), TriggerEvent.JOB_SUBMIT, job, snapshot_for_eval()))
+    results["speedup"] = results["before_eval_ms"] / results["after_eval_ms"]
+    return results
+
+class _LoopPlanner(SchedulerPlanner):
+    """容量矩阵之前的节点选择：逐节点检查约束和资源，再对全部可行节点排序"""
+
+    def select_node(self, task_group, metric=None):
+        required = task_group.get_total_resources()
+        constraints = self.constraints_for(task_group)
+        feasible = [
+            node for node in self.nodes_in_evaluation
+            if node.get("healthy", False) and all(constraint.matches_node(node) for constraint in constraints)
+            and self._fits(node.get("resources", {}), required)
+        ]
+        # 按剩余资源(cpu, memory)降序排列，同值保持快照中的顺序
+        ranked = sorted(feasible, key=lambda node: tuple(node["resources"].get(dimension, 0)
+                                                         for dimension in RESOURCE_DIMENSIONS), reverse=True)
+        return ranked[0] if ranked else None
+
+def bench_evals(args) -> Dict:
+    """不同集群规模下逐节点循环(before)与容量矩阵(after)的评估吞吐(evals/sec)"""
+    task_groups = [{
+        "name": f"group-{index}",
+        "constraints": [{"attribute": "ip_address", "operator": "regex", "value": r"^10\."}] if index % 2 else [],
+        "tasks": [{"name": "task", "resources": {"cpu": 100, "memory": 256}, "config": {}}]
+    } for index in range(args.groups)]
+    job = Job(str(uuid.uuid4()), task_groups, {})
+    results = {}
+    for size in (int(value) for value in args.sizes.split(",")):
+        nodes = [{
+            "node_id": str(uuid.uuid4()),
+            "ip_address": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+            "resources": {"cpu": 1000 + i % 7, "memory": 4096 - i % 5, "cpu_used": 0, "memory_used": 0},
+            "healthy": True,
+            "last_heartbeat": time.time()
+        } for i in range(size)]
+        result = {}
+        with quiet():
+            for name, planner_class in (("before", _LoopPlanner), ("after", SchedulerPlanner)):
+                placements = None
+                start = time.perf_counter()
+                for _ in range(args.rounds):
+                    # 与逐节点循环的排序方式一致，才能比较两者的放置结果
+                    plan = planner_class(str(uuid.uuid4()), TriggerEvent.JOB_SUBMIT, job, nodes,
+                                         scoring="worst-fit").process(_NoAllocations())["plan"]
+                    placements = [allocation.node_id for allocation in plan]
+                result[f"{name}_evals_per_sec"] = _rate(args.rounds, time.perf_counter() - start)
+                result[f"{name}_placements"] = placements
+        result["identical_placements"] = result.pop("before_placements") == result.pop("after_placements")
+        result["speedup"] = result["after_evals_per_sec"] / result["before_evals_per_sec"]
+        results[size] = result
+    return results
+
+def _packing_workload(jobs: int, seed: int) -> List[Job]:
+    """随机作业流：1~3个任务组，小任务组居多，夹杂少量接近整节点的大任务组"""
+    rng = random.Random(seed)
+    workload = []
+    for index in range(jobs):
+        task_groups = []
+        for group in range(rng.randint(1, 3)):
+            if rng.random() < 0.1:
+                resources = {"cpu": rng.choice([2000, 3000]), "memory": rng.choice([4096, 6144])}
+            else:
+                resources = {"cpu": rng.choice([100, 250, 500, 1000]), "memory": rng.choice([256, 512, 1024, 2048])}
+            task_groups.append({"name": f"group-{group}", "tasks": [{"name": "task", "resources": resources, "config": {}}]})
+        workload.append(Job(f"job-{index}", task_groups, {}))
+    return workload
+
+def _packing_snapshot(free: Dict[str, Dict], capacity: Dict, probe: Dict) -> Dict:
+    """集群利用率和碎片率：碎片率为剩余CPU中位于放不下一个大任务组(probe)的节点上的比例"""
+    total_cpu = capacity["cpu"] * len(free)
+    total_memory = capacity["memory"] * len(free)
+    free_cpu = sum(resources["cpu"] for resources in free.values())
+    stranded_cpu = sum(resources["cpu"] for resources in free.values()
+                       if any(resources[dimension] < probe[dimension] for dimension in RESOURCE_DIMENSIONS))
+    return {
+        "cpu_utilization": 1 - free_cpu / total_cpu,
+        "memory_utilization": 1 - sum(resources["memory"] for resources in free.values()) / total_memory,
+        "fragmentation": stranded_cpu / free_cpu if free_cpu else 0.0,
+        "empty_nodes": sum(1 for resources in free.values() if resources == capacity)
+    }
+
+def bench_packing(args) -> Dict:
+    """固定集群上依次提交同一作业流，对比各评分策略的装箱效率
+
+    first_blocked为第一个作业被阻塞（无法放置）时的已放置作业数和集群状态，
+    final为整个作业流提交完毕后的结果，被阻塞的作业跳过、后续作业继续提交。
+    """
+    capacity = {"cpu": 4000, "memory": 8192}
+    probe = {"cpu": 2000, "memory": 4096}
+    workload = _packing_workload(args.jobs, args.seed)
+    results = {"nodes": args.nodes, "jobs": args.jobs}
+    for scoring in args.scorers.split(","):
+        free = {f"node-{i}": dict(capacity) for i in range(args.nodes)}
+        placed = 0
+        first_blocked = None
+        start = time.perf_counter()
+        with quiet():
+            for job in workload:
+                nodes = [{"node_id": node_id, "resources": dict(resources), "capacity": capacity, "healthy": True}
+                         for node_id, resources in free.items()]
+                result = SchedulerPlanner(str(uuid.uuid4()), TriggerEvent.JOB_SUBMIT, job, nodes,
+                                          scoring=scoring).process(_NoAllocations())
+                if not result["success"]:
+                    if first_blocked is None:
+                        first_blocked = dict(_packing_snapshot(free, capacity, probe), jobs_placed=placed)
+                    continue
+                placed += 1
+                for allocation in result["plan"]:
+                    required = allocation.task_group.get_total_resources()
+                    for dimension in RESOURCE_DIMENSIONS:
+                        free[allocation.node_id][dimension] -= required.get(dimension, 0)
+        elapsed = time.perf_counter() - start
+        results[scoring] = {
+            "first_blocked": first_blocked,
+            "final": dict(_packing_snapshot(free, capacity, probe), jobs_placed=placed, jobs_blocked=args.jobs - placed),
+            "evals_per_sec": _rate(args.jobs, elapsed)
+        }
+    return results
+
+def bench_count(args) -> Dict:
+    """N个实例的放置耗时：N个count=1的任务组(before) 对比 一个count=N的任务组(after)"""
+    nodes = [{
+        "node_id": f"node-{i}",
+        "ip_address": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+        "resources": {"cpu": 4000 + i % 7, "memory": 16384 - i % 5},
+        "healthy": True
+    } for i in range(args.nodes)]
+    snapshot = ClusterSnapshot(nodes, version=1)
+    task = {"name": "task", "resources": {"cpu": 50, "memory": 64}, "config": {}}
+    results = {"nodes": args.nodes}
+    for instances in (int(value) for value in args.instances.split(",")):
+        jobs = (
+            ("before", Job(str(uuid.uuid4()), [{"name": f"group-{i}", "tasks": [task]} for i in range(instances)], {})),
+            ("after", Job(str(uuid.uuid4()), [{"name": "group", "count": instances, "tasks": [task]}], {})),
+        )
+        result = {}
+        with quiet():
+            for name, job in jobs:
+                start = time.perf_counter()
+                for _ in range(args.rounds):
+                    plan = SchedulerPlanner(str(uuid.uuid4()), TriggerEvent.JOB_SUBMIT, job, snapshot).process(_NoAllocations())["plan"]
+                result[f"{name}_eval_ms"] = (time.perf_counter() - start) / args.rounds * 1e3
+                result[f"{name}_placed"] = len(plan)
+        result["speedup"] = result["before_eval_ms"] / result["after_eval_ms"]
+        results[instances] = result
+    return results
+
+def bench_batch(args) -> Dict:
+    """逐个POST /jobs(before) 与 POST /jobs/batch(after) 的作业提交吞吐(jobs/sec)，包括日志落盘
+
+    在本地端口上运行server中的Flask应用，通过HTTP调用接口。不设置分配执行器，
+    工作线程取出评估后直接跳过，只测量提交路径本身。
+    """
+    import requests
+    from werkzeug.serving import make_server
+    # werkzeug为每个请求输出一行访问日志，影响测量结果
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # server在当前目录创建nomad.db
+        try:
+            with quiet():
+                import server
+                server.scheduler.set_executor(None)
+                for i in range(args.nodes):
+                    server.node_manager.register_node({
+                        "node_id": f"node-{i}",
+                        "ip_address": f"10.0.{i // 256}.{i % 256}",
+                        "resources": {"cpu": 4000, "memory": 16384},
+                        "healthy": True
+                    })
+            http_server = make_server("127.0.0.1", 0, server.app, threaded=True)
+            threading.Thread(target=http_server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{http_server.server_port}"
+            session = requests.Session()
+            spec = {"task_groups": [{"name": "web", "count": 2, "tasks": [
+                {"name": "nginx", "resources": {"cpu": 100, "memory": 128}, "config": {"image": "nginx"}}]}], "constraints": {}}
+            result = {"jobs": args.jobs}
+            with quiet():
+                start = time.perf_counter()
+                for _ in range(args.jobs):
+                    session.post(f"{url}/jobs", json=spec).raise_for_status()
+                server.node_manager.journal.flush()
+                result["before_jobs_per_sec"] = _rate(args.jobs, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                submitted = 0
+                for offset in range(0, args.jobs, server.JOBS_BATCH_MAX_SIZE):
+                    size = min(server.JOBS_BATCH_MAX_SIZE, args.jobs - offset)
+                    submitted += session.post(f"{url}/jobs/batch", json=[spec] * size).json()["submitted"]
+                server.node_manager.journal.flush()
+                result["after_jobs_per_sec"] = _rate(args.jobs, time.perf_counter() - start)
+
+                http_server.shutdown()
+                server.scheduler.stop()
+                server.allocation_executor.stop()
+                server.node_manager.journal.close()
+                server.node_manager.storage.close()
+            result["after_submitted"] = submitted
+            result["speedup"] = result["after_jobs_per_sec"] / result["before_jobs_per_sec"]
+            return result
+        finally:
+            os.chdir(cwd)
+
+def bench_blocked(args) -> Dict:
+    """集群占满后逐个释放分配：每次容量变化重试全部被阻塞作业(before) 对比 BlockedEvals(after) 的重新评估数"""
+    def task_groups(cpu):
+        return [{"name": "group", "tasks": [{"name": "task", "resources": {"cpu": cpu, "memory": 64}, "config": {}}]}]
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as workdir, quiet():
+        node_manager = NodeManager(os.path.join(workdir, "nomad.db"))
+        allocation_ids = []
+        for i in range(args.nodes):
+            node_id = f"node-{i}"
+            node_manager.register_node({"node_id": node_id, "ip_address": f"10.0.{i // 256}.{i % 256}",
+                                        "resources": {"cpu": 1000, "memory": 4096}, "healthy": True})
+            for slot in range(4):
+                allocation = Allocation(str(uuid.uuid4()), f"filler-{i}-{slot}", node_id,
+                                        Job("filler", task_groups(250), {}).task_groups[0])
+                allocation.status = AllocationStatus.RUNNING
+                node_manager.update_allocation(allocation)
+                allocation_ids.append(allocation.id)
+        tracker = BlockedEvals(node_manager, lambda evaluations: None, coalesce_interval=3600)
+        snapshot = node_manager.get_cluster_snapshot()
+        for index in range(args.jobs):
+            planner = SchedulerPlanner(str(uuid.uuid4()), TriggerEvent.JOB_SUBMIT,
+                                       Job(f"job-{index}", task_groups(rng.choice([250, 500])), {}), snapshot)
+            planner.process(_NoAllocations())
+            tracker.block(planner)
+
+        unblocked = 0
+        samples = []
+        for allocation_id in rng.sample(allocation_ids, args.releases):
+            node_manager.delete_allocation(allocation_id, notify_agent=False)
+            start = time.perf_counter()
+            unblocked += len(tracker.check())
+            samples.append(time.perf_counter() - start)
+        tracker.close()
+        node_manager.journal.close()
+        node_manager.storage.close()
+    return {
+        "blocked_jobs": args.jobs,
+        "releases": args.releases,
+        "freed_cpu": args.releases * 250,
+        "before_reevaluations": args.jobs * args.releases,
+        "after_reevaluations": unblocked,
+        "check_p50_ms": percentile(samples, 50) * 1e3
+    }
+
+def _priority_probe_latency(args, flood_priority: int) -> Dict:
+    """提交大批低价值作业后，每隔一段时间提交一个优先级90的作业，测量其提交到运行的耗时"""
+    from allocation_executor import AllocationExecutor
+    from scheduler import Scheduler
+
+    def spec(priority):
+        return {"task_groups": [{"name": "web", "tasks": [
+            {"name": "task", "resources": {"cpu": 10, "memory": 16}, "config": {}}]}], "constraints": {}, "priority": priority}
+
+    with tempfile.TemporaryDirectory() as workdir, quiet():
+        node_manager = NodeManager(os.path.join(workdir, "nomad.db"))
+        for i in range(args.nodes):
+            node_manager.register_node({"node_id": f"node-{i}", "ip_address": f"10.0.{i // 256}.{i % 256}",
+                                        "resources": {"cpu": 100000, "memory": 1000000}, "healthy": True})
+        scheduler = Scheduler(node_manager, workers=4)
+        executor = AllocationExecutor(node_manager)
+        executor.agent_communicator.send_allocation = lambda allocation: {"status": "ok"}
+        scheduler.set_executor(executor)
+        scheduler.create_evaluations([spec(flood_priority)] * args.flood)
+        # 每10毫秒提交一个探测作业，不等待前一个运行
+        submitted_at = {}
+        latencies = []
+        next_probe = time.perf_counter()
+        while len(latencies) < args.probes:
+            if len(submitted_at) + len(latencies) < args.probes and time.perf_counter() >= next_probe:
+                submitted_at[scheduler.create_evaluation(spec(90)).job.id] = time.perf_counter()
+                next_probe += 0.01
+            for job_id in [job_id for job_id in submitted_at if node_manager.get_job(job_id)["status"] == "running"]:
+                latencies.append(time.perf_counter() - submitted_at.pop(job_id))
+            time.sleep(0.0005)
+        backlog = scheduler.eval_broker.ready_count()
+        bands = scheduler.eval_broker.metrics.summary()
+        scheduler.stop()
+        executor.stop()
+        node_manager.journal.close()
+        node_manager.storage.close()
+    return {
+        "probe_latency_p50_ms": percentile(latencies, 50) * 1e3,
+        "probe_latency_max_ms": max(latencies) * 1e3,
+        "backlog_after_probes": backlog,
+        "eval_wait_p50_ms": {band: stats["wait_seconds_p50"] * 1e3 for band, stats in bands.items() if stats["dequeued"]}
+    }
+
+def bench_priority(args) -> Dict:
+    """大批低价值作业之后提交的高优先级作业：FIFO(before，所有作业同一优先级) 对比 优先级队列(after，批量作业优先级10)"""
+    return {"nodes": args.nodes, "flood": args.flood, "probes": args.probes,
+            "before": _priority_probe_latency(args, flood_priority=90),
+            "after": _priority_probe_latency(args, flood_priority=10)}
+
+def _rack_failure(args, batched: bool) -> Dict:
+    """在spread分布的集群上让一个机架的节点同时失联，测量重新调度的评估数、队列峰值和恢复耗时"""
+    from allocation_executor import AllocationExecutor
+    from scheduler import Scheduler
+    spec = {"task_groups": [{"name": "web", "count": args.count, "tasks": [
+        {"name": "task", "resources": {"cpu": 20, "memory": 64}, "config": {}}]}], "constraints": {}, "scoring": "spread"}
+    with tempfile.TemporaryDirectory() as workdir, quiet():
+        node_manager = NodeManager(os.path.join(workdir, "nomad.db"))
+        for i in range(args.nodes):
+            node_manager.register_node({"node_id": f"node-{i}", "ip_address": f"10.0.{i // 256}.{i % 256}",
+                                        "resources": {"cpu": 4000, "memory": 16384}, "healthy": True})
+        scheduler = Scheduler(node_manager, workers=4, reschedule_rate=args.rate, reschedule_burst=args.burst)
+        executor = AllocationExecutor(node_manager)
+        executor.agent_communicator.send_allocation = lambda allocation: {"status": "ok"}
+        scheduler.set_executor(executor)
+        scheduler.create_evaluations([spec] * args.jobs)
+        while scheduler.eval_broker.ready_count() or scheduler.eval_broker.inflight_count():
+            time.sleep(0.01)
+
+        rack = {f"node-{i}" for i in range(args.rack_size)}
+        now = time.time()
+        node_manager.update_heartbeats([{"node_id": f"node-{i}", "timestamp": now + 60, "healthy": True,
+                                         "resources": {"cpu": 4000, "memory": 16384}}
+                                        for i in range(args.rack_size, args.nodes)])
+        node_manager.mark_unhealthy_nodes(now + 30)
+        lost = node_manager.mark_lost_allocations()
+        enqueued_before = scheduler.eval_broker.stats["enqueued"]
+        if batched:
+            scheduler.reschedule_lost(lost)
+        else:
+            # 每个丢失的分配立即创建一个评估
+            for node_id in rack:
+                scheduler.recovery_metrics.node_failed(node_id, {(a["job_id"], a["task_group"], a["alloc_index"])
+                                                                 for a in lost if a["node_id"] == node_id})
+            scheduler._reschedule_jobs([allocation["job_id"] for allocation in lost])
+        peak_depth = 0
+        deadline = time.time() + 120
+        while scheduler.recovery_metrics.summary()["recovering_nodes"] and time.time() < deadline:
+            peak_depth = max(peak_depth, scheduler.eval_broker.ready_count())
+            time.sleep(0.001)
+        summary = scheduler.recovery_metrics.summary()
+        scheduler.stop()
+        executor.stop()
+        node_manager.journal.close()
+        node_manager.storage.close()
+    return {
+        "lost_allocations": len(lost),
+        "evaluations": scheduler.eval_broker.stats["enqueued"] - enqueued_before,
+        "peak_queue_depth": peak_depth,
+        "recovered_nodes": summary["recovered_nodes"],
+        "recovery_p50_s": summary["recovery_seconds_p50"],
+        "recovery_max_s": summary["recovery_seconds_max"]
+    }
+
+def bench_node_failure(args) -> Dict:
+    """一个机架的节点失联：每个丢失分配立即一个评估(before) 对比 按作业去重、限速成批的重新调度(after)"""
+    before = _rack_failure(args, batched=False)
+    after = _rack_failure(args, batched=True)
+    return {"nodes": args.nodes, "rack_size": args.rack_size, "jobs": args.jobs, "rate": args.rate,
+            "burst": args.burst, "before": before, "after": after}
+
+def _brute_force_victims(need, victims: List[Dict]):
+    """枚举全部子集，返回(最高优先级, 个数)最小的可行集合"""
+    import numpy as np
+    vectors = [np.array([victim["resources"][dimension] for dimension in RESOURCE_DIMENSIONS], dtype=float) for victim in victims]
+    best = None
+    for size in range(1, len(victims) + 1):
+        for subset in itertools.combinations(range(len(victims)), size):
+            if np.all(sum(vectors[index] for index in subset) >= need):
+                key = (max(victims[index]["priority"] for index in subset), size)
+                if best is None or key < best:
+                    best = key
+    return best
+
+def bench_preemption(args) -> Dict:
+    """每个节点上选择抢占对象：枚举全部子集(before) 对比 按优先级和体积排序后的贪心选择(after)"""
+    import numpy as np
+    rng = random.Random(args.seed)
+    cases = []
+    for _ in range(args.nodes):
+        victims = [{"priority": rng.choice([10, 20, 30, 40]),
+                    "resources": {"cpu": rng.choice([50, 100, 200, 400]), "memory": rng.choice([64, 128, 256, 512])}}
+                   for _ in range(args.allocs_per_node)]
+        victims.sort(key=lambda victim: (victim["priority"], -victim["resources"]["cpu"]))
+        total = sum(victim["resources"]["cpu"] for victim in victims)
+        cases.append((np.array([rng.uniform(0.1, 0.5) * total, 0.0]), victims))
+
+    start = time.perf_counter()
+    optimal = [_brute_force_victims(need, victims) for need, victims in cases]
+    before = time.perf_counter() - start
+    start = time.perf_counter()
+    selected = [SchedulerPlanner._select_victims(need, victims) for need, victims in cases]
+    after = time.perf_counter() - start
+    keys = [(max(victim["priority"] for victim in victims), len(victims)) if victims else None for victims in selected]
+    return {
+        "nodes": args.nodes,
+        "allocs_per_node": args.allocs_per_node,
+        "before_ms_per_node": before / args.nodes * 1e3,
+        "after_ms_per_node": after / args.nodes * 1e3,
+        "speedup": before / after,
+        "same_max_priority": sum(key is not None and key[0] == best[0] for key, best in zip(keys, optimal)) / args.nodes,
+        "extra_victims_avg": sum(key[1] - best[1] for key, best in zip(keys, optimal) if key is not None) / args.nodes
+    }
+
+def bench_heartbeat_load(args) -> Dict:
+    """多个发送线程模拟大量节点持续发送心跳，测量流水线的持续吞吐和提交延迟
+
+    每个节点每隔interval秒发送一次心跳，interval为0时不限速。
+    """
+    with tempfile.TemporaryDirectory() as tmp, quiet():
+        node_manager = NodeManager(os.path.join(tmp, "nomad.db"))
+        heartbeats = _make_cluster(node_manager, args.nodes, args.allocs_per_node)
+        pipeline = HeartbeatPipeline(node_manager)
+        latencies: List[List[float]] = [[] for _ in range(args.senders)]
+        begin = time.perf_counter()
+        deadline = begin + args.duration
+
+        def sender(index: int):
+            own = heartbeats[index::args.senders]
+            samples = latencies[index]
+            rounds = 0
+            while time.perf_counter() < deadline:
+                delay = begin + rounds * args.interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                rounds += 1
+                for heartbeat in own:
+                    heartbeat = dict(heartbeat, timestamp=time.time())
+                    start = time.perf_counter()
+                    pipeline.submit(heartbeat)
+                    samples.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=sender, args=(i,)) for i in range(args.senders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pipeline.flush()
+        node_manager.flush()
+        elapsed = time.perf_counter() - begin
+        pipeline.close()
+        node_manager.journal.close()
+        node_manager.storage.close()
+
+    samples = [sample for per_sender in latencies for sample in per_sender]
+    stats = pipeline.stats
+    return {
+        "nodes": args.nodes,
+        "senders": args.senders,
+        "submitted_per_sec": _rate(len(samples), elapsed),
+        "applied_per_sec": _rate(stats["applied"], elapsed),
+        "coalesced": stats["coalesced"],
+        "rejected": stats["rejected"],
+        "batches": stats["batches"],
+        "avg_batch_size": stats["applied"] / stats["batches"] if stats["batches"] else 0,
+        "submit_p50_us": percentile(samples, 50) * 1e6,
+        "submit_p99_us": percentile(samples, 99) * 1e6
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="myNomad 性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    heartbeat_parser = subparsers.add_parser("heartbeat", help="心跳写入吞吐 (before/after)")
+    heartbeat_parser.add_argument("--nodes", type=int, default=200)
+    heartbeat_parser.add_argument("--allocs-per-node", type=int, default=5)
+    heartbeat_parser.add_argument("--rounds", type=int, default=5)
+    heartbeat_parser.set_defaults(func=bench_heartbeat)
+
+    reads_parser = subparsers.add_parser("reads", help="状态读取耗时 (SQLite/内存)")
+    reads_parser.add_argument("--nodes", type=int, default=200)
+    reads_parser.add_argument("--allocs-per-node", type=int, default=5)
+    reads_parser.add_argument("--rounds", type=int, default=200)
+    reads_parser.set_defaults(func=bench_reads)
+
+    plan_parser = subparsers.add_parser("plan", help="单次评估耗时和内存 (JSON深拷贝/复制节点列表/共享快照)")
+    plan_parser.add_argument("--nodes", type=int, default=5000)
+    plan_parser.add_argument("--rounds", type=int, default=20)
+    plan_parser.add_argument("--groups", type=int, default=1, help="作业的任务组数量")
+    plan_parser.set_defaults(func=bench_plan)
+
+    load_parser = subparsers.add_parser("heartbeat-load", help="心跳流水线持续负载")
+    load_parser.add_argument("--nodes", type=int, default=1000)
+    load_parser.add_argument("--allocs-per-node", type=int, default=5)
+    load_parser.add_argument("--senders", type=int, default=8)
+    load_parser.add_argument("--interval", type=float, default=0.1, help="每个节点的心跳间隔(秒)，0表示不限速")
+    load_parser.add_argument("--duration", type=float, default=5)
+    load_parser.set_defaults(func=bench_heartbeat_load)
+
+    evals_parser = subparsers.add_parser("evals", help="不同集群规模下的评估吞吐 (逐节点循环/容量矩阵)")
+    evals_parser.add_argument("--sizes", default="1000,10000,50000", help="逗号分隔的节点数")
+    evals_parser.add_argument("--groups", type=int, default=4, help="作业的任务组数量")
+    evals_parser.add_argument("--rounds", type=int, default=10)
+    evals_parser.set_defaults(func=bench_evals)
+
+    packing_parser = subparsers.add_parser("packing", help="固定集群上各评分策略的装箱效率")
+    packing_parser.add_argument("--nodes", type=int, default=100)
+    packing_parser.add_argument("--jobs", type=int, default=2000)
+    packing_parser.add_argument("--scorers", default="binpack,spread,worst-fit", help="逗号分隔的评分策略")
+    packing_parser.add_argument("--seed", type=int, default=0)
+    packing_parser.set_defaults(func=bench_packing)
+
+    count_parser = subparsers.add_parser("count", help="多实例任务组的放置耗时 (逐个任务组/count批量放置)")
+    count_parser.add_argument("--nodes", type=int, default=2000)
+    count_parser.add_argument("--instances", default="500,10000", help="逗号分隔的实例数")
+    count_parser.add_argument("--rounds", type=int, default=3)
+    count_parser.set_defaults(func=bench_count)
+
+    batch_parser = subparsers.add_parser("batch", help="作业提交吞吐 (逐个POST /jobs/批量POST /jobs/batch)")
+    batch_parser.add_argument("--nodes", type=int, default=1000)
+    batch_parser.add_argument("--jobs", type=int, default=1000)
+    batch_parser.set_defaults(func=bench_batch)
+
+    blocked_parser = subparsers.add_parser("blocked", help="容量释放后的重新评估数 (全部重试/BlockedEvals)")
+    blocked_parser.add_argument("--nodes", type=int, default=100)
+    blocked_parser.add_argument("--jobs", type=int, default=1000)
+    blocked_parser.add_argument("--releases", type=int, default=50)
+    blocked_parser.set_defaults(func=bench_blocked)
+
+    priority_parser = subparsers.add_parser("priority", help="低优先级作业洪峰下高优先级作业的提交到运行耗时 (FIFO/优先级队列)")
+    priority_parser.add_argument("--nodes", type=int, default=200)
+    priority_parser.add_argument("--flood", type=int, default=5000)
+    priority_parser.add_argument("--probes", type=int, default=20)
+    priority_parser.set_defaults(func=bench_priority)
+
+    failure_parser = subparsers.add_parser("node-failure", help="机架失联后的重新调度 (逐分配评估/去重限速批量)")
+    failure_parser.add_argument("--nodes", type=int, default=100)
+    failure_parser.add_argument("--rack-size", type=int, default=20)
+    failure_parser.add_argument("--jobs", type=int, default=2000)
+    failure_parser.add_argument("--count", type=int, default=4)
+    failure_parser.add_argument("--rate", type=float, default=200)
+    failure_parser.add_argument("--burst", type=int, default=50)
+    failure_parser.set_defaults(func=bench_node_failure)
+
+    preemption_parser = subparsers.add_parser("preemption", help="抢占对象选择耗时 (枚举子集/排序贪心)")
+    preemption_parser.add_argument("--nodes", type=int, default=100)
+    preemption_parser.add_argument("--allocs-per-node", type=int, default=12)
+    preemption_parser.add_argument("--seed", type=int, default=0)
+    preemption_parser.set_defaults(func=bench_preemption)
+
+    args = parser.parse_args()
+    print(json.dumps(args.func(args), indent=2))
+
+if __name__ == "__main__":
+    main()
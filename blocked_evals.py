@@ -0,0 +1,212 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import threading
+import time
+import numpy as np
+from constraints import Constraint
+from models import RESOURCE_DIMENSIONS
+
+class _Shape:
+    """一类被阻塞的放置需求：单个实例的资源需求和编译后的约束"""
+
+    __slots__ = ("required", "vector", "constraints", "jobs")
+
+    def __init__(self, required: Dict[str, int], constraints: List[Constraint]):
+        self.required = required
+        self.vector = np.array([required.get(dimension, 0) for dimension in RESOURCE_DIMENSIONS], dtype=float)
+        self.constraints = constraints
+        self.jobs: Dict[str, None] = {}  # 按阻塞的先后顺序
+
+class BlockedEvals:
+    """被阻塞评估的跟踪器（参考Nomad的blocked evals）
+
+    评估因没有节点能放下某个任务组而失败时，按失败任务组的形状（单个实例的资源需求和约束）
+    记录下来，并记录每种形状还差的实例数。状态存储在节点可用资源可能增加时（节点注册或恢复健康、
+    上报资源增加、分配释放资源）通知本跟踪器，后台线程合并coalesce_interval内的通知，只对发生
+    变化的节点检查，把现在能放下的评估交给unblock回调重新入队。
+
+    每个作业最多跟踪一个被阻塞的评估（新的替换旧的），被解除阻塞的评估在再次失败前不会重复入队；
+    只有变化节点的剩余资源能容纳作业每种形状全部剩余的实例时才解除阻塞，并按解除的作业依次扣减
+    它的全部需求，因此容量变化不会引起成批的无效重新评估。
+    """
+
+    def __init__(self, node_manager, unblock: Callable[[List[Any]], None], coalesce_interval: float = 0.05):
+        self.node_manager = node_manager
+        self.coalesce_interval = coalesce_interval
+        self._unblock = unblock
+        self._condition = threading.Condition()
+        self._blocked: Dict[str, Tuple[Any, Dict[Tuple, int]]] = {}  # job_id -> (评估, 形状键 -> 还差的实例数)
+        self._shapes: Dict[Tuple, _Shape] = {}
+        self._changed: Dict[str, None] = {}  # 可用资源可能增加、尚未检查的节点
+        self._recheck: Dict[str, None] = {}  # 阻塞前已错过容量变化、需对整个集群检查的作业
+        self._freed_index = 0  # 最近一次容量增加时状态的cluster_index
+        self._running = True
+        self.stats = {"blocked": 0, "replaced": 0, "unblocked": 0, "untracked": 0}
+        node_manager.add_capacity_listener(self._capacity_freed)
+        self._thread = threading.Thread(target=self._run, name="blocked-evals", daemon=True)
+        self._thread.start()
+
+    def block(self, evaluation) -> bool:
+        """跟踪失败的评估，评估没有记录被阻塞的任务组时返回False"""
+        task_groups = evaluation.blocked_task_groups
+        if not task_groups:
+            return False
+        shapes = {}
+        counts: Dict[Tuple, int] = {}  # 形状键 -> 还差的实例数
+        for task_group in task_groups:
+            required = task_group.get_total_resources()
+            constraints = evaluation.constraints_for(task_group)
+            key = (tuple(required.get(dimension, 0) for dimension in RESOURCE_DIMENSIONS),
+                   tuple(sorted(constraint.key for constraint in constraints)))
+            shapes[key] = (required, constraints)
+            metric = evaluation.alloc_metrics.get(task_group.name)
+            missing = metric.instances - metric.placed if metric is not None else task_group.count
+            counts[key] = counts.get(key, 0) + missing
+        job_id = evaluation.job.id
+        snapshot_version = evaluation.snapshot.version if evaluation.snapshot is not None else -1
+        with self._condition:
+            if job_id in self._blocked:
+                self._untrack(job_id)
+                self.stats["replaced"] += 1
+            for key, (required, constraints) in shapes.items():
+                shape = self._shapes.get(key)
+                if shape is None:
+                    shape = self._shapes[key] = _Shape(required, constraints)
+                shape.jobs[job_id] = None
+            self._blocked[job_id] = (evaluation, counts)
+            self.stats["blocked"] += 1
+            if self._freed_index > snapshot_version:
+                # 评估所用快照之后已有容量释放，相应的通知可能已被处理过
+                self._recheck[job_id] = None
+                self._condition.notify()
+        print(f"[BlockedEvals] 作业 {job_id} 的评估 {evaluation.id} 被阻塞 ({len(shapes)} 种放置需求)")
+        return True
+
+    def untrack(self, job_id: str):
+        """不再跟踪作业被阻塞的评估（作业被更新、停止或删除）"""
+        with self._condition:
+            if job_id in self._blocked:
+                self._untrack(job_id)
+                self.stats["untracked"] += 1
+
+    def _untrack(self, job_id: str):
+        """调用方需持有锁"""
+        _, keys = self._blocked.pop(job_id)
+        self._recheck.pop(job_id, None)
+        for key in keys:
+            shape = self._shapes[key]
+            shape.jobs.pop(job_id, None)
+            if not shape.jobs:
+                del self._shapes[key]
+
+    def blocked_jobs(self) -> List[str]:
+        with self._condition:
+            return list(self._blocked)
+
+    def blocked_evaluation(self, job_id: str) -> Optional[Any]:
+        """作业当前被跟踪的评估，作业未被阻塞时返回None"""
+        with self._condition:
+            entry = self._blocked.get(job_id)
+            return entry[0] if entry is not None else None
+
+    def _capacity_freed(self, node_id: str, cluster_index: int):
+        """状态存储的容量回调，在持有状态锁时调用，只记录节点"""
+        with self._condition:
+            self._freed_index = cluster_index
+            if self._blocked:
+                self._changed[node_id] = None
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._changed and not self._recheck:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                # 合并短时间内的多次容量变化，一次检查
+                deadline = time.time() + self.coalesce_interval
+                while self._running and time.time() < deadline:
+                    self._condition.wait(deadline - time.time())
+                if not self._running:
+                    return
+            try:
+                evaluations = self.check()
+                if evaluations:
+                    self._unblock(evaluations)
+            except Exception as e:
+                print(f"[BlockedEvals] 检查被阻塞的评估时出错: {e}")
+
+    def check(self) -> List[Any]:
+        """对已记录的容量变化检查被阻塞的评估，返回解除阻塞的评估（不再跟踪）"""
+        with self._condition:
+            changed = list(self._changed)
+            self._changed.clear()
+            recheck = list(self._recheck)
+            self._recheck.clear()
+            if not self._blocked:
+                return []
+        # 获取快照需要状态锁，不能在持有本跟踪器的锁时进行（回调的加锁顺序相反）
+        snapshot = self.node_manager.get_cluster_snapshot()
+        rows = [row for row in (snapshot.row(node_id) for node_id in changed) if row is not None]
+        free: Dict[int, np.ndarray] = {}  # 行 -> 扣减已解除的作业后的剩余资源
+        unblocked: Dict[str, None] = {}
+        with self._condition:
+            for job_id in recheck:
+                entry = self._blocked.get(job_id)
+                if entry is not None and self._fits(snapshot, entry[1], free, lambda key: np.flatnonzero(
+                        snapshot.matrix.feasible_mask(self._shapes[key].required, self._shapes[key].constraints))):
+                    unblocked[job_id] = None
+            candidates: Dict[Tuple, List[int]] = {}
+            for key, shape in self._shapes.items():
+                candidates[key] = [row for row in rows
+                                   if all(constraint.matches_node(snapshot.nodes[row]) for constraint in shape.constraints)]
+            exhausted: Dict[Tuple, int] = {}  # 形状键 -> 已放不下的最少实例数
+            for job_id, (_, counts) in self._blocked.items():
+                if job_id in unblocked or any(not candidates[key] or count >= exhausted.get(key, count + 1)
+                                              for key, count in counts.items()):
+                    continue
+                if self._fits(snapshot, counts, free, candidates.get):
+                    unblocked[job_id] = None
+                elif len(counts) == 1:
+                    # 剩余资源只会继续减少，同一形状需要同样多或更多实例的作业也放不下
+                    (key, count), = counts.items()
+                    exhausted[key] = min(count, exhausted.get(key, count))
+            evaluations = []
+            for job_id in unblocked:
+                evaluations.append(self._blocked[job_id][0])
+                self._untrack(job_id)
+            self.stats["unblocked"] += len(evaluations)
+        if evaluations:
+            print(f"[BlockedEvals] {len(changed)} 个节点的容量变化解除了 {len(evaluations)} 个评估的阻塞，"
+                  f"仍有 {len(self._blocked)} 个被阻塞")
+        return evaluations
+
+    def _fits(self, snapshot, counts: Dict[Tuple, int], free: Dict[int, np.ndarray],
+              candidates: Callable[[Tuple], List[int]]) -> bool:
+        """候选节点能否容纳作业每种形状全部剩余的实例，能容纳时从free中扣减全部需求"""
+        trial: Dict[int, np.ndarray] = {}
+        for key, count in counts.items():
+            vector = self._shapes[key].vector
+            needed = vector > 0
+            for row in candidates(key):
+                available = trial.get(row)
+                if available is None:
+                    available = free.get(row)
+                    available = trial[row] = (available.copy() if available is not None
+                                              else snapshot.matrix.available_at(row).astype(float))
+                fitting = count if not needed.any() else min(count, int(np.min(available[needed] // vector[needed])))
+                if fitting > 0:
+                    available -= fitting * vector
+                    count -= fitting
+                if count == 0:
+                    break
+            if count > 0:
+                return False
+        free.update(trial)
+        return True
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=5)
@@ -0,0 +1,226 @@
+from typing import Dict, List, Optional, Tuple
+import heapq
+import numpy as np
+from constraints import Constraint
+from metrics import AllocMetric
+from models import RESOURCE_DIMENSIONS
+from scoring import NodeScorer, WorstFitScorer
+
+class NodeCapacityMatrix:
+    """评估内节点容量的数组表示
+
+    每个节点对应一行，列为RESOURCE_DIMENSIONS中的资源维度。资源过滤和节点
+    选择以NumPy向量运算完成；约束条件对所有节点的判断结果按
+    (属性, 操作符, 取值)缓存为布尔掩码，多个任务组使用相同约束时只计算一次。
+    "="和"!="约束通过属性倒排索引(属性值 -> 行号)得到掩码，无需逐节点比较。
+
+    候选节点由评分插件（scoring.NodeScorer）选出，同分时取快照中靠前的节点。
+    不指定插件时使用worst-fit，即按(cpu, memory)降序逐维比较；规划器总是传入评估的插件（默认binpack）。
+    评分所需的节点总容量取节点视图中的capacity，缺省时为剩余资源加上报的已用资源。
+
+    available、capacity、healthy等基础数组创建后不再修改。deduct把扣减记录在
+    按行号的预留覆盖层中（写时复制），fork得到共享基础数组和各类缓存、覆盖层为空的
+    新矩阵，多个评估可以基于同一个矩阵并发进行，每个评估只为触及的节点付出开销。
+    """
+
+    _default_scorer = WorstFitScorer()
+
+    def __init__(self, nodes: List[Dict]):
+        self.nodes = nodes
+        self.rows: Dict[str, int] = {node["node_id"]: row for row, node in enumerate(nodes)}
+        self.available = np.array(
+            [[node.get("resources", {}).get(dimension, 0) for dimension in RESOURCE_DIMENSIONS] for node in nodes],
+            dtype=np.float64
+        ).reshape(len(nodes), len(RESOURCE_DIMENSIONS))
+        self.capacity = np.array(
+            [[self._node_capacity(node, dimension) for dimension in RESOURCE_DIMENSIONS] for node in nodes],
+            dtype=np.float64
+        ).reshape(len(nodes), len(RESOURCE_DIMENSIONS))
+        np.maximum(self.capacity, self.available, out=self.capacity)
+        self.available.setflags(write=False)
+        self.capacity.setflags(write=False)
+        self.healthy = np.fromiter((bool(node.get("healthy", False)) for node in nodes), dtype=bool, count=len(nodes))
+        self.healthy_count = int(self.healthy.sum())
+        # 每个维度最大的节点容量，用于计算任务组的主导资源占比
+        self.largest_capacity: Dict[str, float] = dict(zip(RESOURCE_DIMENSIONS, self.capacity.max(axis=0, initial=0).tolist()))
+        self._reserved: Dict[int, np.ndarray] = {}  # 行号 -> 本矩阵上已扣减的资源（覆盖层）
+        self._constraint_masks: Dict[Tuple, np.ndarray] = {}
+        self._attribute_index: Dict[str, Tuple[Dict[str, np.ndarray], np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def fork(self) -> "NodeCapacityMatrix":
+        """O(1)创建共享基础数组、约束掩码和属性索引缓存的矩阵，覆盖层为空"""
+        forked = object.__new__(NodeCapacityMatrix)
+        forked.__dict__.update(self.__dict__)
+        forked._reserved = {}
+        return forked
+
+    def available_at(self, row: int) -> np.ndarray:
+        """行的剩余资源（基础数组减去覆盖层中的扣减）"""
+        reserved = self._reserved.get(row)
+        return self.available[row] if reserved is None else self.available[row] - reserved
+
+    @staticmethod
+    def _node_capacity(node: Dict, dimension: str) -> float:
+        capacity = node.get("capacity")
+        if capacity and dimension in capacity:
+            return capacity[dimension]
+        resources = node.get("resources", {})
+        return resources.get(dimension, 0) + resources.get(f"{dimension}_used", 0)
+
+    @staticmethod
+    def _required_vector(required: Dict) -> np.ndarray:
+        return np.array([required.get(dimension, 0) for dimension in RESOURCE_DIMENSIONS], dtype=np.float64)
+
+    def attribute_index(self, attribute: str) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """属性的倒排索引：(字符串形式的属性值 -> 行号数组, 具有该属性的节点掩码)，每个属性只构建一次"""
+        index = self._attribute_index.get(attribute)
+        if index is None:
+            rows_by_value: Dict[str, List[int]] = {}
+            present = np.zeros(len(self.nodes), dtype=bool)
+            for row, node in enumerate(self.nodes):
+                node_value = node.get(attribute)
+                if node_value is None:
+                    continue
+                present[row] = True
+                rows_by_value.setdefault(str(node_value), []).append(row)
+            index = ({value: np.array(rows, dtype=np.intp) for value, rows in rows_by_value.items()}, present)
+            self._attribute_index[attribute] = index
+        return index
+
+    def constraint_mask(self, constraint: Constraint) -> np.ndarray:
+        """编译后约束对应的节点布尔掩码（按约束缓存）"""
+        mask = self._constraint_masks.get(constraint.key)
+        if mask is None:
+            if constraint.operator in ("=", "!="):
+                rows_by_value, present = self.attribute_index(constraint.attribute)
+                mask = np.zeros(len(self.nodes), dtype=bool)
+                mask[rows_by_value.get(str(constraint.value), [])] = True
+                if constraint.operator == "!=":
+                    mask = present & ~mask
+            else:
+                mask = np.fromiter((constraint.matches_node(node) for node in self.nodes),
+                                   dtype=bool, count=len(self.nodes))
+            self._constraint_masks[constraint.key] = mask
+        return mask
+
+    def feasible_mask(self, required: Dict, constraints: List[Constraint] = (),
+                      metric: Optional[AllocMetric] = None) -> np.ndarray:
+        """健康、满足全部约束且剩余资源足够的节点掩码
+
+        传入metric时记录各约束过滤掉的节点数和各资源维度不足的节点数。
+        """
+        required_vector = self._required_vector(required)
+        short = self.available < required_vector  # 各节点各维度是否不足
+        for row, reserved in self._reserved.items():
+            short[row] = self.available[row] - reserved < required_vector
+        fits = ~short.any(axis=1)
+        if metric is not None:
+            return self._record_filtering(metric, short, fits, constraints)
+        mask = self.healthy & fits
+        for constraint in constraints:
+            mask &= self.constraint_mask(constraint)
+        return mask
+
+    def _record_filtering(self, metric: AllocMetric, short: np.ndarray, fits: np.ndarray,
+                          constraints: List[Constraint]) -> np.ndarray:
+        """按健康 -> 各约束 -> 资源的顺序过滤并记录每一步过滤掉的节点数，返回可行节点掩码"""
+        remaining = self.healthy.copy()
+        metric.nodes_evaluated = self.healthy_count
+        metric.constraint_filtered = {}
+        for constraint in constraints:
+            constraint_mask = self.constraint_mask(constraint)
+            filtered = int(np.count_nonzero(remaining & ~constraint_mask))
+            if filtered:
+                metric.constraint_filtered[str(constraint)] = filtered
+            remaining &= constraint_mask
+        metric.nodes_filtered = self.healthy_count - int(np.count_nonzero(remaining))
+        exhausted = remaining & ~fits
+        metric.nodes_exhausted = int(np.count_nonzero(exhausted))
+        metric.dimension_exhausted = {
+            dimension: count for dimension, count in zip(RESOURCE_DIMENSIONS, short[exhausted].sum(axis=0).tolist()) if count
+        }
+        return remaining & fits
+
+    def _record_scores(self, metric: AllocMetric, candidates: np.ndarray, scores: np.ndarray):
+        """记录候选节点中分数最高的几个，同分时行号小的在前"""
+        top = np.lexsort((candidates, -scores))[:AllocMetric.TOP_SCORES]
+        metric.record_scores([self.nodes[row]["node_id"] for row in candidates[top].tolist()], scores[top].tolist())
+
+    def select(self, mask: np.ndarray, required: Optional[Dict] = None,
+               scorer: Optional[NodeScorer] = None, metric: Optional[AllocMetric] = None) -> Optional[int]:
+        """由评分插件在掩码内选出节点行号，没有候选时返回None；传入metric时记录最高的几个分数"""
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            if metric is not None:
+                metric.scores = []
+            return None
+        free_after = self.available[candidates]
+        if self._reserved:
+            rows = np.fromiter(self._reserved, dtype=np.intp, count=len(self._reserved))
+            positions = np.searchsorted(candidates, rows)
+            for row, position in zip(rows.tolist(), positions.tolist()):
+                if position < len(candidates) and candidates[position] == row:
+                    free_after[position] -= self._reserved[row]
+        if required is not None:
+            free_after = free_after - self._required_vector(required)
+        scorer = scorer or self._default_scorer
+        capacity = self.capacity[candidates]
+        if metric is not None:
+            self._record_scores(metric, candidates, scorer.score(free_after, capacity))
+        return scorer.select(candidates, free_after, capacity)
+
+    def select_many(self, mask: np.ndarray, required: Dict, count: int,
+                    scorer: Optional[NodeScorer] = None, metric: Optional[AllocMetric] = None) -> List[int]:
+        """为count个相同需求的实例依次选出节点行号，结果与count次select+deduct相同
+
+        候选节点放入按排序键（scorer.rank）组织的堆中。节点第一次被选中时，一次性计算它
+        继续接收第2、3……个实例时的排序键，之后每放置一个实例只需一次堆操作，
+        复杂度为O(候选节点数 + count·log候选节点数)。
+        不修改覆盖层，调用方对返回的每个行号自行扣减；节点不足时返回的行号少于count。
+        传入metric时记录放置第一个实例时最高的几个分数。
+        """
+        scorer = scorer or self._default_scorer
+        required_vector = self._required_vector(required)
+        candidates = np.flatnonzero(mask)
+        free = self.available[candidates]
+        for position, row in enumerate(candidates.tolist()):
+            reserved = self._reserved.get(row)
+            if reserved is not None:
+                free[position] -= reserved
+        fits = np.all(free >= required_vector, axis=1)
+        candidates, free = candidates[fits], free[fits]
+        capacity = self.capacity[candidates]
+        if metric is not None:
+            self._record_scores(metric, candidates, scorer.score(free - required_vector, capacity))
+        # 堆元素为(取反的排序键..., 行号, 候选位置, 该节点上的第几个实例)，同分时行号小的节点优先
+        heap = [(*rank, row, position, 1) for position, (row, rank) in
+                enumerate(zip(candidates.tolist(), (-scorer.rank(free - required_vector, capacity)).tolist()))]
+        heapq.heapify(heap)
+        positive = required_vector > 0
+        rows: List[int] = []
+        successive: Dict[int, List] = {}  # 候选位置 -> 放置第2、3……个实例时的排序键
+        while heap and len(rows) < count:
+            *_, row, position, placed = heapq.heappop(heap)
+            rows.append(row)
+            if placed == 1:
+                limit = count - len(rows) + 1
+                if positive.any():
+                    limit = min(limit, int(np.min(free[position][positive] // required_vector[positive])))
+                steps = np.arange(2, limit + 1, dtype=np.float64)[:, None]
+                free_after = free[position] - steps * required_vector
+                successive[position] = (-scorer.rank(free_after, np.repeat(capacity[position:position + 1], len(steps), axis=0))).tolist()
+            ranks = successive[position]
+            if placed <= len(ranks):
+                heapq.heappush(heap, (*ranks[placed - 1], row, position, placed + 1))
+        return rows
+
+    def deduct(self, node_id: str, resources: Dict):
+        """从节点的剩余资源中扣减（负数表示加回），只记录在覆盖层中"""
+        row = self.rows.get(node_id)
+        if row is not None:
+            reserved = self._reserved.get(row)
+            vector = self._required_vector(resources)
+            self._reserved[row] = vector if reserved is None else reserved + vector
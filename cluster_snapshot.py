@@ -0,0 +1,34 @@
+from typing import Dict, Optional, Sequence
+from capacity_matrix import NodeCapacityMatrix
+
+class ClusterSnapshot:
+    """不可变、带版本号的集群快照，在多个评估之间共享
+
+    保存某一状态版本下的可调度节点视图及其容量矩阵（包括约束掩码和属性索引缓存）。
+    快照中的节点字典和矩阵的基础数组均按只读约定共享，评估对资源的预留
+    记录在各自的覆盖层中（见NodeCapacityMatrix.fork和SchedulerPlanner），
+    因此每个评估的准备开销只与它触及的节点数有关，而与集群规模无关。
+    """
+
+    def __init__(self, nodes: Sequence[Dict], version: int = 0):
+        self.version = version
+        self.nodes: Sequence[Dict] = tuple(nodes)
+        self.matrix = NodeCapacityMatrix(self.nodes)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def row(self, node_id: str) -> Optional[int]:
+        return self.matrix.rows.get(node_id)
+
+    def get_node(self, node_id: str) -> Optional[Dict]:
+        """快照中的节点视图（只读）"""
+        row = self.matrix.rows.get(node_id)
+        return None if row is None else self.nodes[row]
+
+    @classmethod
+    def of(cls, nodes) -> "ClusterSnapshot":
+        """已是快照时直接返回，节点列表则包装为一次性的快照（版本号0）"""
+        if isinstance(nodes, ClusterSnapshot):
+            return nodes
+        return cls(nodes if nodes is not None else [])
@@ -0,0 +1,45 @@
+"""测试共用的fixture"""
+import pytest
+from allocation_executor import AllocationExecutor
+from node_manager import NodeManager
+from scheduler import Scheduler
+from testutil import register_node
+
+@pytest.fixture
+def node_manager(tmp_path):
+    """临时数据库上没有节点的NodeManager，测试文件可以覆盖此fixture注册节点"""
+    manager = NodeManager(str(tmp_path / "nomad.db"))
+    yield manager
+    manager.journal.close()
+    manager.storage.close()
+
+@pytest.fixture
+def reopen(node_manager):
+    """关闭当前的NodeManager并在同一数据库上重新打开（模拟服务器重启），返回新的NodeManager"""
+    opened = [node_manager]
+
+    def _reopen(**kwargs):
+        previous = opened[-1]
+        previous.journal.close()
+        previous.storage.close()
+        manager = NodeManager(node_manager.db_path, **kwargs)
+        opened.append(manager)
+        return manager
+    yield _reopen
+    for manager in opened[1:]:
+        manager.journal.close()
+        manager.storage.close()
+
+@pytest.fixture
+def cluster(node_manager):
+    """在node-1（1000 cpu）上运行的调度器和分配执行器，Agent通信直接返回成功"""
+    register_node(node_manager, "node-1")
+    scheduler = Scheduler(node_manager, workers=2)
+    scheduler.blocked_evals.coalesce_interval = 0.01
+    executor = AllocationExecutor(node_manager)
+    executor.agent_communicator.send_allocation = lambda allocation: {"status": "ok"}
+    executor.agent_communicator.stop_allocation = lambda node_id, allocation_id: True
+    scheduler.set_executor(executor)
+    yield node_manager, scheduler, executor
+    scheduler.stop()
+    executor.stop()
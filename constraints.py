@@ -0,0 +1,87 @@
+from typing import Callable, Dict, List, Union
+from functools import lru_cache
+import re
+
+@lru_cache(maxsize=1024)
+def _compile_regex(pattern: str):
+    return re.compile(pattern)
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float))
+
+class Constraint:
+    """编译后的约束条件
+
+    创建时解析操作符、预先转换比较值并编译正则表达式，matches只做一次函数调用。
+    属性、操作符或取值缺失的约束不会被编译（忽略），未知操作符视为总是满足。
+    """
+
+    __slots__ = ("attribute", "operator", "value", "key", "_matches")
+
+    def __init__(self, attribute: str, operator: str, value):
+        self.attribute = attribute
+        self.operator = operator
+        self.value = value
+        # 等值比较统一按字符串进行，key也用于缓存约束对应的节点掩码
+        self.key = (attribute, operator, repr(value))
+        self._matches = self._resolve(operator, value)
+
+    @staticmethod
+    def _resolve(operator: str, value) -> Callable:
+        if operator == "=":
+            expected = str(value)
+            return lambda node_value: str(node_value) == expected
+        if operator == "!=":
+            expected = str(value)
+            return lambda node_value: str(node_value) != expected
+        if operator == ">":
+            if not _is_number(value):
+                return lambda node_value: False
+            return lambda node_value: _is_number(node_value) and node_value > value
+        if operator == "<":
+            if not _is_number(value):
+                return lambda node_value: False
+            return lambda node_value: _is_number(node_value) and node_value < value
+        if operator == "regex":
+            search = _compile_regex(str(value)).search
+            return lambda node_value: search(str(node_value)) is not None
+        return lambda node_value: True
+
+    def matches(self, node_value) -> bool:
+        """节点属性值是否满足约束，节点缺少该属性时不满足"""
+        return node_value is not None and self._matches(node_value)
+
+    def matches_node(self, node: Dict) -> bool:
+        return self.matches(node.get(self.attribute))
+
+    def __repr__(self) -> str:
+        return f"Constraint({self.attribute} {self.operator} {self.value!r})"
+
+    def __str__(self) -> str:
+        return f"{self.attribute} {self.operator} {self.value}"
+
+def normalize_constraints(constraints: Union[List[Dict], Dict, None]) -> List[Dict]:
+    """把作业/任务组的约束定义规整为约束字典列表
+
+    任务组使用列表形式；作业级constraints也接受同样的列表或单个约束字典。
+    不含attribute键的字典（例如{"region": "us-west"}）是旧版本的作业元数据，不参与调度。
+    """
+    if not constraints:
+        return []
+    if isinstance(constraints, dict):
+        return [constraints] if "attribute" in constraints else []
+    return list(constraints)
+
+def compile_constraints(*constraint_lists: Union[List[Dict], Dict, None]) -> List[Constraint]:
+    """编译若干组约束定义，忽略不完整的约束，相同的约束只保留一个"""
+    compiled: Dict[tuple, Constraint] = {}
+    for constraints in constraint_lists:
+        for constraint in normalize_constraints(constraints):
+            attribute = constraint.get("attribute")
+            operator = constraint.get("operator")
+            value = constraint.get("value")
+            if not all([attribute, operator, value]):
+                continue
+            item = Constraint(attribute, operator, value)
+            compiled.setdefault(item.key, item)
+    return list(compiled.values())
@@ -0,0 +1,102 @@
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from collections import deque
+import threading
+import time
+from metrics import PriorityBandMetrics
+from models import DEFAULT_JOB_PRIORITY
+from priority_queue import AGING_RATE, AgingHeap
+
+class EvalBroker:
+    """评估队列（参考Nomad的eval broker）
+
+    enqueue时唤醒等待中的工作线程，dequeue阻塞等待而不轮询。同一作业的评估
+    串行执行：作业有评估正在处理时，新的评估暂存在该作业的等待队列中，
+    直到处理中的评估被ack后才进入就绪队列。不同作业的就绪评估按评估的priority属性
+    （没有该属性时为默认优先级）从高到低被并发取走，等待越久有效优先级越高，
+    低优先级的评估不会被持续到来的高优先级评估饿死；优先级相同时按入队顺序。
+    """
+
+    def __init__(self, aging_rate: float = AGING_RATE):
+        self._condition = threading.Condition()
+        self._ready = AgingHeap(aging_rate)  # (job_id, 评估)
+        self._ready_jobs: Dict[str, None] = {}  # 就绪队列中的作业
+        # job_id -> 等待同一作业处理完成的(评估, 优先级, 入队时间)
+        self._waiting: Dict[str, Deque[Tuple[Any, int, float]]] = {}
+        self._inflight: Dict[str, float] = {}  # job_id -> 开始处理的时间
+        self._running = True
+        self.stats = {"enqueued": 0, "dequeued": 0, "acked": 0, "serialized": 0}
+        self.metrics = PriorityBandMetrics()  # 按优先级区间的队列长度和入队到出队的等待时间
+
+    def enqueue(self, job_id: str, evaluation: Any):
+        with self._condition:
+            if self._add(job_id, evaluation):
+                self._condition.notify()
+
+    def enqueue_many(self, items: List[Tuple[str, Any]]):
+        """按顺序加入一批(job_id, 评估)，只获取一次锁并一次唤醒所有工作线程"""
+        with self._condition:
+            ready = sum(self._add(job_id, evaluation) for job_id, evaluation in items)
+            if ready:
+                self._condition.notify_all()
+
+    def _add(self, job_id: str, evaluation: Any) -> bool:
+        """加入一个评估，进入就绪队列时返回True，调用方需持有锁"""
+        self.stats["enqueued"] += 1
+        priority = getattr(evaluation, "priority", DEFAULT_JOB_PRIORITY)
+        enqueued_at = time.monotonic()
+        self.metrics.enqueued(priority)
+        if job_id in self._inflight or job_id in self._waiting or job_id in self._ready_jobs:
+            # 同一作业已有评估在处理或排队，保持该作业内的先后顺序
+            self._waiting.setdefault(job_id, deque()).append((evaluation, priority, enqueued_at))
+            self.stats["serialized"] += 1
+            return False
+        self._ready.push((job_id, evaluation), priority, enqueued_at)
+        self._ready_jobs[job_id] = None
+        return True
+
+    def dequeue(self, timeout: Optional[float] = None) -> Optional[Tuple[str, Any]]:
+        """取出一个就绪评估并将其作业标记为处理中，超时或队列关闭时返回None"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._running and not self._ready:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if not self._running:
+                return None
+            (job_id, evaluation), priority, enqueued_at = self._ready.pop()
+            self.metrics.dequeued(priority, time.monotonic() - enqueued_at)
+            del self._ready_jobs[job_id]
+            self._inflight[job_id] = time.time()
+            self.stats["dequeued"] += 1
+            return job_id, evaluation
+
+    def ack(self, job_id: str):
+        """作业的评估处理完毕，放行该作业的下一个评估"""
+        with self._condition:
+            self._inflight.pop(job_id, None)
+            self.stats["acked"] += 1
+            waiting = self._waiting.get(job_id)
+            if waiting:
+                # 保留原来的入队时间，在作业内排队的时间也计入老化
+                evaluation, priority, enqueued_at = waiting.popleft()
+                self._ready.push((job_id, evaluation), priority, enqueued_at)
+                self._ready_jobs[job_id] = None
+                if not waiting:
+                    del self._waiting[job_id]
+                self._condition.notify()
+
+    def ready_count(self) -> int:
+        with self._condition:
+            return len(self._ready)
+
+    def inflight_count(self) -> int:
+        with self._condition:
+            return len(self._inflight)
+
+    def close(self):
+        """唤醒所有等待的工作线程并让dequeue返回None"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
@@ -0,0 +1,98 @@
+from typing import Dict, List, Optional
+from collections import OrderedDict
+import json
+import threading
+from storage import Storage
+
+class EvaluationStore:
+    """最近评估记录的有界存储
+
+    记录按评估ID保存在内存中，并按作业建立索引；写入和淘汰经写后日志同步到evaluations表，
+    重启后加载最近的记录。超过容量时按创建顺序淘汰最早的评估，同一评估的更新不改变其顺序。
+    记录是普通字典，读取时返回副本。
+    """
+
+    UPSERT_SQL = 'INSERT OR REPLACE INTO evaluations (evaluation_id, job_id, create_time, record) VALUES (?, ?, ?, ?)'
+    DELETE_SQL = 'DELETE FROM evaluations WHERE evaluation_id = ?'
+    DELETE_JOB_SQL = 'DELETE FROM evaluations WHERE job_id = ?'
+
+    def __init__(self, journal=None, capacity: int = 10000):
+        self.journal = journal
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[str, Dict]" = OrderedDict()
+        self._by_job: Dict[str, "OrderedDict[str, None]"] = {}
+
+    def load(self, storage: Storage):
+        """从数据库加载最近的capacity个评估，并删除更早的记录（启动时调用）"""
+        rows = storage.query('SELECT evaluation_id, record FROM evaluations ORDER BY create_time DESC, rowid DESC')
+        with self._lock:
+            self._records.clear()
+            self._by_job.clear()
+            for evaluation_id, record in reversed(rows[:self.capacity]):
+                self._index(json.loads(record))
+        if len(rows) > self.capacity:
+            with storage.transaction() as cursor:
+                cursor.executemany(self.DELETE_SQL, [(evaluation_id,) for evaluation_id, _ in rows[self.capacity:]])
+
+    def put(self, record: Dict):
+        """保存或更新评估记录，超出容量时淘汰最早创建的评估"""
+        self.put_many([record])
+
+    def put_many(self, records: List[Dict]):
+        """保存或更新一批评估记录，作为一条写操作追加到写后日志"""
+        with self._lock:
+            for record in records:
+                self._index(record)
+            evicted = []
+            while len(self._records) > self.capacity:
+                evaluation_id, evicted_record = self._records.popitem(last=False)
+                self._unindex(evicted_record)
+                evicted.append((evaluation_id,))
+            if self.journal is not None:
+                self.journal.append_many(self.UPSERT_SQL, [
+                    (record["evaluation_id"], record["job_id"], record["create_time"], json.dumps(record))
+                    for record in records
+                ])
+                if evicted:
+                    self.journal.append_many(self.DELETE_SQL, evicted)
+
+    def get(self, evaluation_id: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._records.get(evaluation_id)
+            return dict(record) if record is not None else None
+
+    def job_evaluations(self, job_id: str) -> List[Dict]:
+        """作业的评估记录，最新创建的在前"""
+        with self._lock:
+            return [dict(self._records[evaluation_id]) for evaluation_id in reversed(self._by_job.get(job_id, ()))]
+
+    def delete_job(self, job_id: str):
+        """删除作业的全部评估记录（作业被删除时调用）"""
+        with self._lock:
+            evaluation_ids = list(self._by_job.pop(job_id, ()))
+            for evaluation_id in evaluation_ids:
+                del self._records[evaluation_id]
+            if self.journal is not None:
+                self.journal.append(self.DELETE_JOB_SQL, (job_id,))
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._by_job.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    def _index(self, record: Dict):
+        evaluation_id = record["evaluation_id"]
+        self._records[evaluation_id] = record
+        self._by_job.setdefault(record["job_id"], OrderedDict())[evaluation_id] = None
+
+    def _unindex(self, record: Dict):
+        evaluation_ids = self._by_job.get(record["job_id"])
+        if evaluation_ids is not None:
+            evaluation_ids.pop(record["evaluation_id"], None)
+            if not evaluation_ids:
+                del self._by_job[record["job_id"]]
@@ -0,0 +1,150 @@
+from typing import Dict, List, Optional
+import threading
+import time
+from node_manager import NodeManager
+
+class HeartbeatPipeline:
+    """心跳写入流水线
+
+    请求线程只把心跳放入有界的待处理表后立即返回；后台写线程每隔几毫秒
+    取出一批，在一次加锁内更新内存状态，并把整批的节点、分配和任务写操作
+    各作为一条executemany交给写后日志，在一个事务中落盘。
+
+    待处理表按节点合并：同一节点尚未处理的旧心跳会被更新的心跳合并覆盖，
+    时间戳早于该节点已提交心跳的乱序心跳直接丢弃。待处理的节点数达到max_pending时拒绝新节点的心跳。
+
+    增量心跳协议：Agent为每个心跳附带递增的seq、所基于的已确认序号base_seq
+    以及是否为全量状态full。增量心跳只包含自base_seq以来发生变化的分配和任务。
+    base_seq与服务器记录的该节点已确认序号不一致（例如服务器重启）时，
+    只应用节点资源和存活信息，并要求Agent发送全量心跳。不带seq的心跳按全量处理。
+    心跳在放入待处理表时即被确认；所在批次未能全部应用时，撤销批次中各节点的已确认序号，
+    这些节点的下一个增量心跳将被要求全量同步，补回丢失的状态。
+    """
+
+    def __init__(self, node_manager: NodeManager, max_pending: int = 10000,
+                 flush_interval: float = 0.005):
+        self.node_manager = node_manager
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Dict] = {}  # node_id -> 最新心跳
+        self._latest: Dict[str, float] = {}  # node_id -> 已提交心跳的最大时间戳
+        self._acked_seq: Dict[str, int] = {}  # node_id -> 已确认的心跳序号
+        self._condition = threading.Condition()
+        self._submitted_seq = 0
+        self._applied_seq = 0
+        self._running = True
+        self.stats = {"accepted": 0, "coalesced": 0, "rejected": 0, "resyncs": 0, "applied": 0, "batches": 0}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, heartbeat_data: Dict) -> Optional[Dict]:
+        """提交心跳
+
+        Returns:
+            Optional[Dict]: 给Agent的确认信息 {"ack_seq": 已确认序号, "resync": 是否需要全量心跳}，
+            队列已满或流水线已关闭时返回None
+        """
+        node_id = heartbeat_data["node_id"]
+        seq = heartbeat_data.get("seq")
+        with self._condition:
+            if not self._running:
+                return None
+            acked_seq = self._acked_seq.get(node_id)
+            if heartbeat_data["timestamp"] < self._latest.get(node_id, float("-inf")):
+                self.stats["coalesced"] += 1
+                return {"ack_seq": acked_seq, "resync": False}
+
+            resync = False
+            if seq is not None and not heartbeat_data.get("full") and heartbeat_data.get("base_seq") != acked_seq:
+                # 序号不连续，丢弃增量部分，只保留节点信息
+                heartbeat_data = dict(heartbeat_data, allocations={})
+                resync = True
+
+            previous = self._pending.get(node_id)
+            if previous is not None:
+                self.stats["coalesced"] += 1
+                heartbeat_data = self._merge(previous, heartbeat_data)
+            elif len(self._pending) >= self.max_pending:
+                self.stats["rejected"] += 1
+                return None
+            self._pending[node_id] = heartbeat_data
+            self._latest[node_id] = heartbeat_data["timestamp"]
+            if resync:
+                self.stats["resyncs"] += 1
+            elif seq is not None:
+                acked_seq = self._acked_seq[node_id] = seq
+            self.stats["accepted"] += 1
+            self._submitted_seq += 1
+            self._condition.notify_all()
+        return {"ack_seq": acked_seq, "resync": resync}
+
+    @staticmethod
+    def _merge(previous: Dict, heartbeat_data: Dict) -> Dict:
+        """把同一节点的新心跳合并到尚未处理的旧心跳上，按分配、任务粒度以新值为准"""
+        allocations = {
+            allocation_id: dict(allocation_status, tasks=dict(allocation_status.get("tasks", {})))
+            for allocation_id, allocation_status in previous.get("allocations", {}).items()
+        }
+        for allocation_id, allocation_status in heartbeat_data.get("allocations", {}).items():
+            merged = allocations.setdefault(allocation_id, {"tasks": {}})
+            merged.update(allocation_status, tasks=merged["tasks"])
+            merged["tasks"].update(allocation_status.get("tasks", {}))
+        return dict(
+            heartbeat_data,
+            full=bool(previous.get("full") or heartbeat_data.get("full")),
+            allocations=allocations
+        )
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """阻塞直到目前已提交的心跳全部应用到内存状态"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            target = self._submitted_seq
+            self._condition.notify_all()
+            while self._applied_seq < target:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self):
+        """处理剩余心跳并停止写线程"""
+        self.flush(timeout=5)
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=5)
+
+    def _take_batch(self):
+        with self._condition:
+            while self._running and not self._pending:
+                self._condition.wait()
+            batch: List[Dict] = list(self._pending.values())
+            self._pending = {}
+            return batch, self._submitted_seq
+
+    def _run(self):
+        while True:
+            batch, seq = self._take_batch()
+            if not batch:
+                return
+            try:
+                applied = self.node_manager.update_heartbeats(batch)
+            except Exception as e:
+                applied = 0
+                print(f"[HeartbeatPipeline] 批量处理 {len(batch)} 个心跳时出错: {e}")
+            with self._condition:
+                if applied < len(batch):
+                    for heartbeat_data in batch:
+                        self._acked_seq.pop(heartbeat_data["node_id"], None)
+                self.stats["applied"] += applied
+                self.stats["batches"] += 1
+                self._applied_seq = seq
+                self._condition.notify_all()
+            # 留出时间积累下一批心跳，实现组提交
+            time.sleep(self.flush_interval)
@@ -0,0 +1,63 @@
+from typing import Callable, Dict, Set, Tuple
+from collections import OrderedDict
+import threading
+from models import Job
+
+class JobCache:
+    """已解析作业规范的LRU缓存
+
+    以(job_id, version)为键缓存models.Job对象，同一版本的作业规范只解析一次。
+    缓存的Job对象由服务器、调度器和评估共享，调用方只能读取，不能修改。
+    作业重新提交或删除时通过invalidate()移除该作业的所有版本。
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._entries: "OrderedDict[Tuple[str, int], Job]" = OrderedDict()
+        self._versions: Dict[str, Set[int]] = {}  # job_id -> 已缓存的版本
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, job_id: str, version: int, loader: Callable[[], Job]) -> Job:
+        """返回缓存的作业，未命中时调用loader解析并放入缓存"""
+        key = (job_id, version)
+        with self._lock:
+            job = self._entries.get(key)
+            if job is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return job
+            self.misses += 1
+
+        job = loader()
+        with self._lock:
+            self._entries[key] = job
+            self._entries.move_to_end(key)
+            self._versions.setdefault(job_id, set()).add(version)
+            while len(self._entries) > self.capacity:
+                (evicted_id, evicted_version), _ = self._entries.popitem(last=False)
+                self._discard_version(evicted_id, evicted_version)
+        return job
+
+    def invalidate(self, job_id: str):
+        """移除作业的所有缓存版本"""
+        with self._lock:
+            for version in self._versions.pop(job_id, ()):
+                self._entries.pop((job_id, version), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _discard_version(self, job_id: str, version: int):
+        versions = self._versions.get(job_id)
+        if versions is not None:
+            versions.discard(version)
+            if not versions:
+                del self._versions[job_id]
@@ -0,0 +1,185 @@
+from typing import Deque, Dict, Iterable, List, Set, Tuple
+from collections import deque
+import threading
+import time
+
+# 按优先级区间统计队列指标：(区间名, 区间的最低优先级)，从高到低
+PRIORITY_BANDS = (("high", 70), ("normal", 30), ("low", 0))
+
+def priority_band(priority: int) -> str:
+    for band, lowest in PRIORITY_BANDS:
+        if priority >= lowest:
+            return band
+    return PRIORITY_BANDS[-1][0]
+
+def percentile(samples: List[float], percent: float) -> float:
+    """样本的百分位数（最近秩法），没有样本时返回0"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+class NodeRecoveryMetrics:
+    """节点失联后工作负载的恢复耗时
+
+    节点被判定失联时记录其上丢失的实例（作业, 任务组, 实例序号），这些实例的替代分配
+    全部在其他节点上运行后，记录从判定失联到恢复完成的耗时。
+    """
+
+    # 保留最近的恢复耗时样本数
+    MAX_SAMPLES = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failed_at: Dict[str, float] = {}  # node_id -> 判定失联的时间
+        self._outstanding: Dict[str, Set[Tuple[str, str, int]]] = {}  # node_id -> 尚未恢复的实例
+        self._nodes_by_instance: Dict[Tuple[str, str, int], Set[str]] = {}
+        self._samples: List[float] = []
+        self.stats = {"failed_nodes": 0, "recovered_nodes": 0, "lost_instances": 0, "replaced_instances": 0}
+
+    def node_failed(self, node_id: str, instances: Iterable[Tuple[str, str, int]], failed_at: float = None):
+        """记录失联节点上丢失的实例，没有丢失实例的节点不计入"""
+        instances = set(instances)
+        if not instances:
+            return
+        with self._lock:
+            if node_id not in self._failed_at:
+                self._failed_at[node_id] = failed_at or time.time()
+                self.stats["failed_nodes"] += 1
+            self._outstanding.setdefault(node_id, set()).update(instances)
+            for instance in instances:
+                self._nodes_by_instance.setdefault(instance, set()).add(node_id)
+            self.stats["lost_instances"] += len(instances)
+
+    def instance_placed(self, job_id: str, task_group: str, index: int):
+        """实例的新分配已运行"""
+        self._resolve([(job_id, task_group, index)], replaced=True)
+
+    def discard_job(self, job_id: str):
+        """作业已停止或删除，其丢失的实例不再需要恢复"""
+        with self._lock:
+            instances = [instance for instance in self._nodes_by_instance if instance[0] == job_id]
+        self._resolve(instances, replaced=False)
+
+    def _resolve(self, instances: List[Tuple[str, str, int]], replaced: bool):
+        now = time.time()
+        with self._lock:
+            for instance in instances:
+                node_ids = self._nodes_by_instance.pop(instance, None)
+                if not node_ids:
+                    continue
+                if replaced:
+                    self.stats["replaced_instances"] += 1
+                for node_id in node_ids:
+                    outstanding = self._outstanding[node_id]
+                    outstanding.discard(instance)
+                    if not outstanding:
+                        del self._outstanding[node_id]
+                        self._samples.append(now - self._failed_at.pop(node_id))
+                        del self._samples[:-self.MAX_SAMPLES]
+                        self.stats["recovered_nodes"] += 1
+
+    def summary(self) -> Dict:
+        with self._lock:
+            samples = list(self._samples)
+            return dict(self.stats,
+                        recovering_nodes=len(self._outstanding),
+                        outstanding_instances=len(self._nodes_by_instance),
+                        recovery_seconds_p50=percentile(samples, 50),
+                        recovery_seconds_p99=percentile(samples, 99),
+                        recovery_seconds_max=max(samples, default=0.0),
+                        recovery_seconds_last=samples[-1] if samples else 0.0)
+
+class PriorityBandMetrics:
+    """优先级队列按优先级区间统计的队列长度和等待时间（入队到出队）"""
+
+    # 每个区间保留最近的等待时间样本数
+    MAX_SAMPLES = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._depth: Dict[str, int] = {band: 0 for band, _ in PRIORITY_BANDS}
+        self._dequeued: Dict[str, int] = {band: 0 for band, _ in PRIORITY_BANDS}
+        self._waits: Dict[str, Deque[float]] = {band: deque(maxlen=self.MAX_SAMPLES) for band, _ in PRIORITY_BANDS}
+
+    def enqueued(self, priority: int):
+        with self._lock:
+            self._depth[priority_band(priority)] += 1
+
+    def dequeued(self, priority: int, waited: float):
+        band = priority_band(priority)
+        with self._lock:
+            self._depth[band] -= 1
+            self._dequeued[band] += 1
+            self._waits[band].append(waited)
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            bands = {}
+            for band, _ in PRIORITY_BANDS:
+                samples = list(self._waits[band])
+                bands[band] = {
+                    "depth": self._depth[band],
+                    "dequeued": self._dequeued[band],
+                    "wait_seconds_p50": percentile(samples, 50),
+                    "wait_seconds_p99": percentile(samples, 99),
+                    "wait_seconds_max": max(samples, default=0.0)
+                }
+            return bands
+
+class AllocMetric:
+    """任务组一次放置尝试的指标（参考Nomad的AllocMetric）
+
+    节点依次经过健康、各约束条件和资源三步过滤：nodes_evaluated为参与过滤的健康节点数，
+    constraint_filtered为每个约束过滤掉的节点数（按约束顺序，节点只计入第一个不满足的约束），
+    nodes_exhausted为满足约束但剩余资源不足的节点数，dimension_exhausted为其中各资源维度
+    不足的节点数（一个节点可能在多个维度上不足）。scores为评分插件给可行节点的最高的
+    TOP_SCORES个分数（放置第一个实例时），allocation_time为过滤、评分和抢占的耗时(秒)。
+    """
+
+    # 保留的最高分节点数（与Nomad相同）
+    TOP_SCORES = 5
+
+    def __init__(self, task_group: str, instances: int):
+        self.task_group = task_group
+        self.instances = instances  # 需要放置的实例数
+        self.placed = 0
+        self.preempted = 0  # 为放置实例抢占的分配数
+        self.nodes_evaluated = 0
+        self.nodes_filtered = 0
+        self.constraint_filtered: Dict[str, int] = {}
+        self.nodes_exhausted = 0
+        self.dimension_exhausted: Dict[str, int] = {}
+        self.scores: List[Dict] = []
+        self.allocation_time = 0.0
+
+    def record_scores(self, node_ids: List[str], scores: List[float]):
+        """记录最高的TOP_SCORES个分数，参数已按分数降序排列"""
+        self.scores = [{"node_id": node_id, "score": score}
+                       for node_id, score in zip(node_ids[:self.TOP_SCORES], scores[:self.TOP_SCORES])]
+
+    def describe(self) -> str:
+        """日志中的一行摘要"""
+        parts = [f"评估 {self.nodes_evaluated} 个节点"]
+        if self.nodes_filtered:
+            reasons = ", ".join(f"{constraint}: {count}" for constraint, count in self.constraint_filtered.items())
+            parts.append(f"约束过滤 {self.nodes_filtered} 个（{reasons}）")
+        if self.nodes_exhausted:
+            reasons = ", ".join(f"{dimension}: {count}" for dimension, count in self.dimension_exhausted.items())
+            parts.append(f"资源不足 {self.nodes_exhausted} 个（{reasons}）")
+        return "，".join(parts)
+
+    def to_dict(self) -> Dict:
+        return {
+            "task_group": self.task_group,
+            "instances": self.instances,
+            "placed": self.placed,
+            "preempted": self.preempted,
+            "nodes_evaluated": self.nodes_evaluated,
+            "nodes_filtered": self.nodes_filtered,
+            "constraint_filtered": dict(self.constraint_filtered),
+            "nodes_exhausted": self.nodes_exhausted,
+            "dimension_exhausted": dict(self.dimension_exhausted),
+            "scores": list(self.scores),
+            "allocation_time": self.allocation_time
+        }
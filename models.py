@@ -1,10 +1,56 @@
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 from enum import Enum
+import hashlib
+import json
+
+# 调度时参与容量计算的资源维度，在数据库中以同名数值列存储(nodes、task_status)。
+# 新增维度时在此追加，并在NodeManager.SCHEMA_MIGRATIONS中添加增加对应列的迁移
+RESOURCE_DIMENSIONS = ("cpu", "memory")
+# 节点额外上报的资源使用量
+NODE_RESOURCE_FIELDS = RESOURCE_DIMENSIONS + ("cpu_used", "memory_used")
+
+def resource_values(resources: Dict, fields=RESOURCE_DIMENSIONS) -> Dict:
+    """按资源维度规整资源字典，缺失的维度记为0"""
+    return {field: resources.get(field, 0) for field in fields}
+
+# 作业优先级的取值范围和默认值（参考Nomad），优先级高的评估和计划先被处理
+MIN_JOB_PRIORITY = 1
+MAX_JOB_PRIORITY = 100
+DEFAULT_JOB_PRIORITY = 50
+
+def invalid_job_priority(priority) -> Optional[str]:
+    """校验作业的priority字段（可省略），无效时返回错误信息"""
+    if priority is None:
+        return None
+    if isinstance(priority, bool) or not isinstance(priority, int) \
+            or not MIN_JOB_PRIORITY <= priority <= MAX_JOB_PRIORITY:
+        return f"priority必须是{MIN_JOB_PRIORITY}到{MAX_JOB_PRIORITY}之间的整数: {priority!r}"
+    return None
+
+def invalid_task_group_count(task_groups: List[Dict]) -> Optional[str]:
+    """校验任务组的count字段（可省略，默认为1），无效时返回错误信息"""
+    for group in task_groups:
+        count = group.get("count", 1)
+        if isinstance(count, bool) or not isinstance(count, int) or count < 0:
+            return f"任务组 {group.get('name')} 的count必须是非负整数: {count!r}"
+    return None
+
+def job_spec_hash(task_groups: List[Dict], constraints: Dict, scoring=None,
+                  priority: int = DEFAULT_JOB_PRIORITY) -> str:
+    """作业规范的内容哈希，键顺序不影响结果（未指定评分策略、优先级为默认值时与旧版本的哈希相同）"""
+    spec = {"task_groups": task_groups, "constraints": constraints}
+    if scoring is not None:
+        spec["scoring"] = scoring
+    if priority != DEFAULT_JOB_PRIORITY:
+        spec["priority"] = priority
+    canonical = json.dumps(spec, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
 class EvaluationStatus(Enum):
     PENDING = "pending"
     COMPLETE = "complete"
     FAILED = "failed"
+    BLOCKED = "blocked"    # 没有节点能放下某个任务组，由BlockedEvals跟踪，容量释放后创建新的评估
 
 class JobStatus(Enum):
     PENDING = "pending"      # 作业已提交，但尚未被调度器处理
@@ -34,11 +80,42 @@ class AllocationStatus(Enum):
     LOST = "lost"         # 分配丢失（节点失联）
     STOPPED = "stopped"    # 分配被手动停止
 
+def derive_job_status(status_counts: Dict[str, int],
+                      has_capacity: Callable[[], bool]) -> Optional[JobStatus]:
+    """作业状态机：由作业各状态的分配数量推导作业状态
+
+    Args:
+        status_counts: 分配状态 -> 数量
+        has_capacity: 仅在全部分配都处于pending时调用，判断集群资源能否容纳该作业
+
+    Returns:
+        Optional[JobStatus]: 作业没有分配时返回None（保持原状态）
+    """
+    total = sum(status_counts.values())
+    if not total:
+        return None
+    running = status_counts.get("running", 0)
+    pending = status_counts.get("pending", 0)
+    failed = status_counts.get("failed", 0)
+    lost = status_counts.get("lost", 0)
+
+    if running:
+        return JobStatus.DEGRADED if failed or lost else JobStatus.RUNNING
+    if pending == total:
+        return JobStatus.PENDING if has_capacity() else JobStatus.BLOCKED
+    if pending:
+        return JobStatus.PENDING
+    # 剩余的分配均已结束
+    if status_counts.get("complete", 0) + status_counts.get("stopped", 0) == total:
+        return JobStatus.COMPLETE
+    return JobStatus.FAILED if failed else JobStatus.LOST
+
 class TriggerEvent(Enum):
     JOB_SUBMIT = "job_submit"
     JOB_UPDATE = "job_update"
     JOB_DEREGISTER = "job_deregister" # Todo: 作业取消，触发重新调度   
-    NODE_FAILURE = "node_failure" # Todo: 节点失联，触发重新调度
+    NODE_FAILURE = "node_failure" # 节点失联，重新放置丢失的分配
+    PREEMPTION = "preemption" # 分配被高优先级作业抢占，重新放置被抢占的分配
     NODE_JOIN = "node_join" # Todo: 节点加入，触发重新调度
 
 class Task:
@@ -50,23 +127,30 @@ class Task:
         self.task_type = TaskType.CONTAINER if config.get("image") else TaskType.PROCESS
 
 class TaskGroup:
-    def __init__(self, name: str, tasks: List[Task], constraints: List[Dict] = None):
+    def __init__(self, name: str, tasks: List[Task], constraints: List[Dict] = None, count: int = 1):
         self.name = name
         self.tasks = tasks
         self.constraints = constraints or []  # 任务组级别的约束条件
+        self.count = count  # 期望运行的实例数，每个实例是一个分配，实例序号为0..count-1
         self.status = JobStatus.PENDING
         
     def get_total_resources(self) -> Dict:
         """计算任务组所需的总资源"""
-        total_resources = {"cpu": 0, "memory": 0}
+        total_resources = dict.fromkeys(RESOURCE_DIMENSIONS, 0)
         for task in self.tasks:
-            total_resources["cpu"] += task.resources.get("cpu", 0)
-            total_resources["memory"] += task.resources.get("memory", 0)
+            for dimension in RESOURCE_DIMENSIONS:
+                total_resources[dimension] += task.resources.get(dimension, 0)
         return total_resources
 
 class Job:
-    def __init__(self, id: str, task_groups: List[Dict], constraints: Dict):
+    def __init__(self, id: str, task_groups: List[Dict], constraints: Dict,
+                 version: int = 1, spec_hash: Optional[str] = None, scoring=None,
+                 priority: int = DEFAULT_JOB_PRIORITY):
         self.id = id
+        self.version = version
+        self.scoring = scoring  # 作业的评分策略（名称或{名称: 权重}），None表示使用集群默认
+        self.priority = priority  # 作业的评估和计划按优先级出队
+        self.spec_hash = spec_hash or job_spec_hash(task_groups, constraints, scoring, priority)
         self.task_groups = [
             TaskGroup(
                 name=group["name"],
@@ -77,16 +161,18 @@ class Job:
                         config=task.get("config", {})
                     ) for task in group["tasks"]
                 ],
-                constraints=group.get("constraints", [])  # 从任务组定义中获取约束条件
+                constraints=group.get("constraints", []),  # 从任务组定义中获取约束条件
+                count=group.get("count", 1)
             ) for group in task_groups
         ]
         self.constraints = constraints
         self.status = JobStatus.PENDING
 
 class Allocation:
-    def __init__(self, id: str, job_id: str, node_id: str, task_group: TaskGroup):
+    def __init__(self, id: str, job_id: str, node_id: str, task_group: TaskGroup, index: int = 0):
         self.id = id
         self.job_id = job_id
         self.node_id = node_id
         self.task_group = task_group
+        self.index = index  # 任务组内的实例序号
         self.status = AllocationStatus.PENDING 
\ No newline at end of file
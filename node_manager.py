@@ -1,21 +1,121 @@
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
+import atexit
 import time
 import json
-import sqlite3
 import uuid
-from models import JobStatus, Allocation
+from models import Job, JobStatus, Allocation, derive_job_status, RESOURCE_DIMENSIONS, NODE_RESOURCE_FIELDS, resource_values, job_spec_hash, DEFAULT_JOB_PRIORITY
+from job_cache import JobCache
+from evaluation_store import EvaluationStore
+from storage import Storage
+from state_store import StateStore, WriteBehindJournal, ALLOCATED_STATUSES
+from cluster_snapshot import ClusterSnapshot
+
+# 资源以数值列存储，写入语句按资源维度展开
+NODE_UPSERT_SQL = f'''
+    INSERT OR REPLACE INTO nodes (node_id, ip_address, {", ".join(NODE_RESOURCE_FIELDS)}, healthy, last_heartbeat)
+    VALUES ({", ".join("?" * (len(NODE_RESOURCE_FIELDS) + 4))})
+'''
+NODE_HEARTBEAT_SQL = f'''
+    UPDATE nodes
+    SET {", ".join(f"{field} = ?" for field in NODE_RESOURCE_FIELDS)},
+        healthy = ?,
+        last_heartbeat = ?
+    WHERE node_id = ?
+'''
+TASK_STATUS_UPSERT_SQL = f'''
+    INSERT OR REPLACE INTO task_status
+    (allocation_id, task_name, {", ".join(RESOURCE_DIMENSIONS)}, config, status, start_time, end_time,
+     error, exit_code, last_update, message)
+    VALUES ({", ".join("?" * (len(RESOURCE_DIMENSIONS) + 10))})
+'''
+# 心跳、健康检查和删除路径上的写入语句，均按主键或索引定位行（见test_query_plans.py）
+ALLOCATION_HEARTBEAT_SQL = '''
+    UPDATE allocations
+    SET status = ?,
+        start_time = ?,
+        end_time = ?,
+        last_update = ?
+    WHERE allocation_id = ?
+'''
+NODE_UNHEALTHY_SQL = 'UPDATE nodes SET healthy = 0 WHERE node_id = ?'
+ALLOCATION_LOST_SQL = '''
+    UPDATE allocations
+    SET status = ?,
+        end_time = ?
+    WHERE allocation_id = ?
+'''
+TASK_STATUS_LOST_SQL = '''
+    UPDATE task_status
+    SET status = ?,
+        end_time = ?
+    WHERE allocation_id = ?
+    AND status NOT IN ('complete', 'failed')
+'''
+TASK_STATUS_DELETE_SQL = 'DELETE FROM task_status WHERE allocation_id = ?'
+ALLOCATION_DELETE_SQL = 'DELETE FROM allocations WHERE allocation_id = ?'
+JOB_ALLOCATIONS_DELETE_SQL = 'DELETE FROM allocations WHERE job_id = ?'
 
 class NodeManager:
-    def __init__(self, db_path: str = "nomad.db"):
+    # 心跳中决定任务状态是否变化的字段
+    HEARTBEAT_TASK_FIELDS = ("status", "start_time", "end_time", "error", "exit_code", "message")
+
+    # 数据库结构迁移：(版本号, 说明, 迁移方法名)
+    # 当前版本记录在 PRAGMA user_version 中，启动时按顺序执行尚未应用的迁移，
+    # 因此旧版本的nomad.db会被原地升级。结构变更只能追加新版本，不要修改已发布的迁移。
+    SCHEMA_MIGRATIONS = [
+        (1, "创建基础表结构", "_create_tables"),
+        (2, "为按作业删除分配添加索引", "_create_indexes"),
+        (3, "将节点和任务的JSON资源列拆分为数值列", "_split_resource_columns"),
+        (4, "为作业添加版本号和内容哈希", "_add_job_versions"),
+        (5, "为作业添加评分策略", "_add_job_scoring"),
+        (6, "为分配添加实例序号", "_add_allocation_index"),
+        (7, "为作业添加优先级", "_add_job_priority"),
+        (8, "创建评估记录表", "_create_evaluations_table"),
+    ]
+
+    def __init__(self, db_path: str = "nomad.db", evaluation_capacity: int = 10000):
         self.db_path = db_path
+        self.storage = Storage(db_path)
         self.setup_database()
+        # 内存状态是权威副本：读取全部走内存，写入先改内存再经写后日志异步落盘
+        self.state = StateStore()
+        self.state.load(self.storage)
+        self.journal = WriteBehindJournal(self.storage)
+        # 已解析作业规范的缓存，由服务器、调度器和评估共享
+        self.job_cache = JobCache()
+        # 最近evaluation_capacity个评估的状态、计划规模和分阶段耗时
+        self.evaluations = EvaluationStore(self.journal, evaluation_capacity)
+        self.evaluations.load(self.storage)
+        # 最近一次构建的集群快照，状态的cluster_index不变时在评估之间共享
+        self._cluster_snapshot: Optional[ClusterSnapshot] = None
+        atexit.register(self.journal.close)
+        print(f"[NodeManager] 已从数据库加载状态: {len(self.state.nodes)} 个节点, "
+              f"{len(self.state.jobs)} 个作业, {len(self.state.allocations)} 个分配")
         print("[NodeManager] 节点管理器已初始化")
 
     def setup_database(self):
-        """初始化数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        """初始化数据库，并将已有数据库升级到最新的结构版本"""
+        with self.storage.transaction() as cursor:
+            cursor.execute('PRAGMA user_version')
+            current_version = cursor.fetchone()[0]
+            for version, description, method_name in self.SCHEMA_MIGRATIONS:
+                if version <= current_version:
+                    continue
+                getattr(self, method_name)(cursor)
+                cursor.execute(f'PRAGMA user_version = {int(version)}')
+                print(f"[NodeManager] 已应用数据库迁移 v{version}: {description}")
+
+    @property
+    def schema_version(self) -> int:
+        """当前数据库的结构版本"""
+        return self.storage.query_one('PRAGMA user_version')[0]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待写后日志中已有的写操作全部落盘"""
+        return self.journal.flush(timeout)
+
+    def _create_tables(self, cursor):
+        """创建所有数据表"""
         # 创建节点表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS nodes (
@@ -84,9 +184,118 @@ class NodeManager:
                 updated_at REAL
             )
         ''')
-        
-        conn.commit()
-        conn.close()
+
+    def _create_indexes(self, cursor):
+        """为按作业删除分配创建索引
+
+        读取由内存状态存储提供，数据库只执行写后日志中的写入；其余写入都按主键定位，
+        每个索引都会增加写入开销，因此只保留JOB_ALLOCATIONS_DELETE_SQL需要的索引。
+        """
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_allocations_job ON allocations (job_id)')
+        # task_status按allocation_id的删除和更新由主键 (allocation_id, task_name) 的前缀覆盖
+
+    def _split_resource_columns(self, cursor):
+        """重建nodes和task_status表，把JSON格式的resources拆分为cpu、memory等数值列
+
+        本迁移的列是固定的；以后新增资源维度应另加迁移执行ALTER TABLE ADD COLUMN。
+        """
+        def parse(resources_json):
+            try:
+                resources = json.loads(resources_json) if resources_json else {}
+            except (TypeError, ValueError):
+                resources = {}
+            return resources if isinstance(resources, dict) else {}
+
+        cursor.execute('''
+            CREATE TABLE nodes_v3 (
+                node_id TEXT PRIMARY KEY,
+                ip_address TEXT,
+                cpu INTEGER NOT NULL DEFAULT 0,
+                memory INTEGER NOT NULL DEFAULT 0,
+                cpu_used INTEGER NOT NULL DEFAULT 0,
+                memory_used INTEGER NOT NULL DEFAULT 0,
+                healthy INTEGER,
+                last_heartbeat REAL
+            )
+        ''')
+        node_rows = []
+        for node_id, ip_address, resources_json, healthy, last_heartbeat in cursor.execute(
+                'SELECT node_id, ip_address, resources, healthy, last_heartbeat FROM nodes').fetchall():
+            resources = parse(resources_json)
+            node_rows.append((node_id, ip_address, resources.get("cpu", 0), resources.get("memory", 0),
+                              resources.get("cpu_used", 0), resources.get("memory_used", 0), healthy, last_heartbeat))
+        cursor.executemany('INSERT INTO nodes_v3 VALUES (?, ?, ?, ?, ?, ?, ?, ?)', node_rows)
+        cursor.execute('DROP TABLE nodes')
+        cursor.execute('ALTER TABLE nodes_v3 RENAME TO nodes')
+
+        cursor.execute('''
+            CREATE TABLE task_status_v3 (
+                allocation_id TEXT,
+                task_name TEXT,
+                cpu INTEGER NOT NULL DEFAULT 0,
+                memory INTEGER NOT NULL DEFAULT 0,
+                config TEXT,
+                status TEXT,
+                start_time REAL,
+                end_time REAL,
+                error TEXT,
+                exit_code INTEGER,
+                last_update REAL,
+                message TEXT,
+                PRIMARY KEY (allocation_id, task_name),
+                FOREIGN KEY(allocation_id) REFERENCES allocations(allocation_id)
+            )
+        ''')
+        task_rows = []
+        for row in cursor.execute('''
+            SELECT allocation_id, task_name, resources, config, status, start_time, end_time,
+                   error, exit_code, last_update, message
+            FROM task_status
+        ''').fetchall():
+            resources = parse(row[2])
+            task_rows.append(row[:2] + (resources.get("cpu", 0), resources.get("memory", 0)) + row[3:])
+        cursor.executemany('INSERT INTO task_status_v3 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', task_rows)
+        cursor.execute('DROP TABLE task_status')
+        cursor.execute('ALTER TABLE task_status_v3 RENAME TO task_status')
+
+    def _add_job_versions(self, cursor):
+        """jobs表增加version和spec_hash列，已有作业记为版本1并计算内容哈希"""
+        cursor.execute('ALTER TABLE jobs ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+        cursor.execute('ALTER TABLE jobs ADD COLUMN spec_hash TEXT')
+        rows = []
+        for job_id, task_groups, constraints in cursor.execute(
+                'SELECT job_id, task_groups, constraints FROM jobs').fetchall():
+            try:
+                spec_hash = job_spec_hash(json.loads(task_groups) if task_groups else [],
+                                          json.loads(constraints) if constraints else {})
+            except ValueError:
+                spec_hash = None
+            rows.append((spec_hash, job_id))
+        cursor.executemany('UPDATE jobs SET spec_hash = ? WHERE job_id = ?', rows)
+
+    def _add_job_scoring(self, cursor):
+        """jobs表增加scoring列（JSON），已有作业为NULL，即使用集群默认的评分策略"""
+        cursor.execute('ALTER TABLE jobs ADD COLUMN scoring TEXT')
+
+    def _add_allocation_index(self, cursor):
+        """allocations表增加alloc_index列（任务组内的实例序号），已有分配为实例0"""
+        cursor.execute('ALTER TABLE allocations ADD COLUMN alloc_index INTEGER NOT NULL DEFAULT 0')
+
+    def _add_job_priority(self, cursor):
+        """jobs表增加priority列，已有作业为默认优先级"""
+        cursor.execute(f'ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT {DEFAULT_JOB_PRIORITY}')
+
+    def _create_evaluations_table(self, cursor):
+        """evaluations表保存最近评估的记录（JSON），按作业查询"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS evaluations (
+                evaluation_id TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                create_time REAL NOT NULL,
+                record TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_evaluations_job ON evaluations (job_id)')
 
     def register_node(self, node_data: Dict) -> bool:
         """注册新节点"""
@@ -97,22 +306,22 @@ class NodeManager:
                 print(f"[NodeManager] 注册节点时缺少必要字段: {required_fields}")
                 return False
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO nodes (node_id, ip_address, resources, healthy, last_heartbeat)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                node_data["node_id"],
-                node_data["ip_address"],
-                json.dumps(node_data["resources"]),
-                1 if node_data["healthy"] else 0,
-                time.time()
-            ))
-            
-            conn.commit()
-            conn.close()
+            node = {
+                "node_id": node_data["node_id"],
+                "ip_address": node_data["ip_address"],
+                "resources": resource_values(node_data["resources"], NODE_RESOURCE_FIELDS),
+                "healthy": bool(node_data["healthy"]),
+                "last_heartbeat": time.time()
+            }
+            with self.state.lock:
+                self.state.upsert_node(node)
+                self.journal.append(NODE_UPSERT_SQL, (
+                    node["node_id"],
+                    node["ip_address"],
+                    *node["resources"].values(),
+                    1 if node["healthy"] else 0,
+                    node["last_heartbeat"]
+                ))
             print(f"[NodeManager] 节点 {node_data['node_id']} (IP: {node_data['ip_address']}) 注册成功")
             return True
         except Exception as e:
@@ -122,201 +331,445 @@ class NodeManager:
     def update_heartbeat(self, heartbeat_data: Dict) -> bool:
         """更新节点心跳信息"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 更新节点信息
-            cursor.execute('''
-                UPDATE nodes 
-                SET resources = ?, 
-                    healthy = ?,
-                    last_heartbeat = ?
-                WHERE node_id = ?
-            ''', (
-                json.dumps(heartbeat_data["resources"]),
-                1 if heartbeat_data["healthy"] else 0,
-                heartbeat_data["timestamp"],
-                heartbeat_data["node_id"]
-            ))
-            
-            # 更新分配状态
-            if "allocations" in heartbeat_data:
-                for allocation_id, allocation_status in heartbeat_data["allocations"].items():
-                    # 更新分配状态
-                    cursor.execute('''
-                        UPDATE allocations 
-                        SET status = ?,
-                            start_time = ?,
-                            end_time = ?,
-                            last_update = ?
-                        WHERE allocation_id = ?
-                    ''', (
-                        allocation_status["status"],
-                        allocation_status["start_time"],
-                        allocation_status["end_time"],
-                        heartbeat_data["timestamp"],
-                        allocation_id
-                    ))
-                    
-                    # 更新任务状态
-                    for task_name, task_status in allocation_status["tasks"].items():
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO task_status
-                            (allocation_id, task_name, status, start_time, end_time, error, exit_code, last_update, message)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            allocation_id,
-                            task_name,
-                            task_status["status"],
-                            task_status["start_time"],
-                            task_status["end_time"],
-                            task_status.get("error"),
-                            task_status.get("exit_code"),
-                            heartbeat_data["timestamp"],
-                            task_status.get("message")
-                        ))
-            
-            conn.commit()
-            conn.close()
+            self.update_heartbeats([heartbeat_data])
             return True
         except Exception as e:
             print(f"[NodeManager] 更新心跳时出错: {e}")
             return False
 
+    def update_heartbeats(self, heartbeats: List[Dict]) -> int:
+        """批量应用心跳：一次加锁更新内存，每类写操作合并为一条executemany
+
+        分配状态发生变化的作业随后按分配计数重新推导作业状态。
+
+        Returns:
+            int: 成功应用的心跳数量
+        """
+        node_rows = []
+        allocation_rows = []
+        task_rows = []
+        changed_job_ids = set()
+        applied = 0
+        with self.state.lock:
+            for heartbeat_data in heartbeats:
+                try:
+                    self._apply_heartbeat(heartbeat_data, node_rows, allocation_rows, task_rows, changed_job_ids)
+                    applied += 1
+                except Exception as e:
+                    print(f"[NodeManager] 更新节点 {heartbeat_data.get('node_id')} 心跳时出错: {e}")
+
+            self.journal.append_many(NODE_HEARTBEAT_SQL, node_rows)
+            self.journal.append_many(ALLOCATION_HEARTBEAT_SQL, allocation_rows)
+            self.journal.append_many(TASK_STATUS_UPSERT_SQL, task_rows)
+            for job_id in changed_job_ids:
+                self.update_job_status(job_id)
+        return applied
+
+    def _apply_heartbeat(self, heartbeat_data: Dict, node_rows: List, allocation_rows: List, task_rows: List,
+                         changed_job_ids: set):
+        """把一个心跳应用到内存状态，并收集对应的写操作参数和分配状态变化的作业（调用方需持有state.lock）"""
+        node_id = heartbeat_data["node_id"]
+        timestamp = heartbeat_data["timestamp"]
+
+        # 更新节点信息
+        node = self.state.get_node(node_id)
+        if node is not None:
+            resources = resource_values(heartbeat_data["resources"], NODE_RESOURCE_FIELDS)
+            self.state.upsert_node(dict(
+                node,
+                resources=resources,
+                healthy=bool(heartbeat_data["healthy"]),
+                last_heartbeat=timestamp
+            ))
+            node_rows.append((
+                *resources.values(),
+                1 if heartbeat_data["healthy"] else 0,
+                timestamp,
+                node_id
+            ))
+
+        # 更新分配状态，忽略服务器不认识的分配；状态未变化的分配和任务不产生写操作
+        for allocation_id, allocation_status in heartbeat_data.get("allocations", {}).items():
+            allocation = self.state.get_allocation(allocation_id)
+            if allocation is None:
+                continue
+            if "status" in allocation_status and (
+                allocation["status"], allocation["start_time"], allocation["end_time"]
+            ) != (allocation_status["status"], allocation_status["start_time"], allocation_status["end_time"]):
+                self.state.update_allocation(
+                    allocation_id,
+                    status=allocation_status["status"],
+                    start_time=allocation_status["start_time"],
+                    end_time=allocation_status["end_time"],
+                    last_update=timestamp
+                )
+                changed_job_ids.add(allocation["job_id"])
+                allocation_rows.append((
+                    allocation_status["status"],
+                    allocation_status["start_time"],
+                    allocation_status["end_time"],
+                    timestamp,
+                    allocation_id
+                ))
+
+            # 更新任务状态
+            task_states = self.state.allocation_task_states(allocation_id)
+            for task_name, task_status in allocation_status.get("tasks", {}).items():
+                previous = task_states.get(task_name, {})
+                if previous and all(previous.get(field) == task_status.get(field) for field in self.HEARTBEAT_TASK_FIELDS):
+                    continue
+                task = {
+                    "resources": previous.get("resources") or resource_values({}),
+                    "config": previous.get("config", {}),
+                    "status": task_status["status"],
+                    "start_time": task_status["start_time"],
+                    "end_time": task_status["end_time"],
+                    "error": task_status.get("error"),
+                    "exit_code": task_status.get("exit_code"),
+                    "last_update": timestamp,
+                    "message": task_status.get("message")
+                }
+                self.state.upsert_task_state(allocation_id, task_name, task)
+                task_rows.append(self._task_row(allocation_id, task_name, task))
+
+    @staticmethod
+    def _task_row(allocation_id: str, task_name: str, task: Dict) -> tuple:
+        """任务状态对应的task_status行（TASK_STATUS_UPSERT_SQL的参数）"""
+        return (
+            allocation_id,
+            task_name,
+            *(task["resources"].get(dimension, 0) for dimension in RESOURCE_DIMENSIONS),
+            json.dumps(task["config"]),
+            task["status"],
+            task["start_time"],
+            task["end_time"],
+            task["error"],
+            task["exit_code"],
+            task["last_update"],
+            task["message"]
+        )
+
+    @staticmethod
+    def _node_view(node: Dict) -> Dict:
+        """复制节点行，避免调用方修改内存状态"""
+        return {
+            "node_id": node["node_id"],
+            "ip_address": node["ip_address"],
+            "resources": dict(node["resources"]),
+            "healthy": node["healthy"],
+            "last_heartbeat": node["last_heartbeat"]
+        }
+
+    @staticmethod
+    def _job_view(job: Dict) -> Dict:
+        """复制作业行（task_groups/constraints按只读约定共享）"""
+        return {
+            "job_id": job["job_id"],
+            "task_groups": job["task_groups"],
+            "constraints": job["constraints"],
+            "status": job["status"],
+            "version": job["version"],
+            "spec_hash": job["spec_hash"],
+            "scoring": job["scoring"],
+            "priority": job["priority"]
+        }
+
+    @staticmethod
+    def _allocation_view(allocation: Dict) -> Dict:
+        return {
+            "allocation_id": allocation["allocation_id"],
+            "node_id": allocation["node_id"],
+            "task_group": allocation["task_group"],
+            "alloc_index": allocation["alloc_index"],
+            "status": allocation["status"],
+            "start_time": allocation["start_time"],
+            "end_time": allocation["end_time"]
+        }
+
     def get_healthy_nodes(self) -> List[Dict]:
         """获取所有健康的节点"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM nodes WHERE healthy = 1')
-            rows = cursor.fetchall()
-            
-            nodes = [{
-                "node_id": row[0],
-                "ip_address": row[1],
-                "resources": row[2],
-                "healthy": bool(row[3]),
-                "last_heartbeat": row[4]
-            } for row in rows]
-            
-            print(f"[NodeManager] 当前可用节点数量: {len(nodes)}")
-            for node in nodes:
-                print(f"[NodeManager] 节点 {node['node_id']} - IP: {node['ip_address']} - 资源: {node['resources']}")
-            
-            return nodes
-        finally:
-            conn.close()
+        nodes = [self._node_view(node) for node in self.state.list_nodes(healthy_only=True)]
+        print(f"[NodeManager] 当前可用节点数量: {len(nodes)}")
+        return nodes
+
+    def add_capacity_listener(self, listener: Callable[[str, int], None]):
+        """注册节点可用资源可能增加时的回调(node_id, cluster_index)，回调在持有状态锁时调用"""
+        self.state.capacity_listeners.append(listener)
+
+    def get_cluster_snapshot(self) -> ClusterSnapshot:
+        """获取调度用的集群快照：健康节点的视图，资源为节点上报资源减去已分配资源台账，capacity为节点总容量
+
+        快照按state.cluster_index缓存，节点资源、健康状态和台账未变化时所有评估共享同一个快照，
+        只在发生变化后的第一次请求时重建。快照及其节点视图是只读的。
+        """
+        with self.state.lock:
+            snapshot = self._cluster_snapshot
+            if snapshot is not None and snapshot.version == self.state.cluster_index:
+                return snapshot
+            nodes = []
+            for node in self.state.list_nodes(healthy_only=True):
+                view = self._node_view(node)
+                # 节点总容量 = 上报的剩余资源 + 上报的已用资源，供评分插件计算利用率
+                view["capacity"] = {
+                    dimension: node["resources"].get(dimension, 0) + node["resources"].get(f"{dimension}_used", 0)
+                    for dimension in RESOURCE_DIMENSIONS
+                }
+                view["resources"].update(self.state.available_resources(node))
+                nodes.append(view)
+            snapshot = ClusterSnapshot(nodes, version=self.state.cluster_index)
+            self._cluster_snapshot = snapshot
+            return snapshot
+
+    def get_job_resource_credits(self, job_id: str) -> Dict[str, Dict[str, int]]:
+        """作业自身已占用的资源（node_id -> 资源），作业更新时评估把它们加回，由评估重新规划现有分配"""
+        with self.state.lock:
+            credits: Dict[str, Dict[str, int]] = {}
+            for allocation in self.state.job_allocations(job_id):
+                if allocation["status"] not in ALLOCATED_STATUSES or not allocation.get("resources"):
+                    continue
+                credited = credits.setdefault(allocation["node_id"], dict.fromkeys(RESOURCE_DIMENSIONS, 0))
+                for dimension in RESOURCE_DIMENSIONS:
+                    credited[dimension] += allocation["resources"].get(dimension, 0)
+            return credits
+
+    def get_evaluation_view(self, job_id: str) -> Tuple[ClusterSnapshot, Dict[str, Dict[str, int]]]:
+        """同一状态版本下的集群快照和作业自身占用的资源"""
+        with self.state.lock:
+            return self.get_cluster_snapshot(), self.get_job_resource_credits(job_id)
+
+    def node_has_capacity(self, node_id: str, resources: Dict) -> bool:
+        """节点是否健康且剩余资源（上报资源减去已分配资源台账）满足需求"""
+        with self.state.lock:
+            node = self.state.get_node(node_id)
+            if node is None or not node["healthy"]:
+                return False
+            available = self.state.available_resources(node)
+            return all(available[dimension] >= resources.get(dimension, 0) for dimension in RESOURCE_DIMENSIONS)
+
+    def preemptible_allocations(self, node_ids: Iterable[str], max_priority: int,
+                                exclude_job_id: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """节点上可被抢占的分配：占用资源且所属作业优先级不高于max_priority
+
+        Returns:
+            Dict[str, List[Dict]]: node_id -> 分配（allocation_id, job_id, node_id, priority, resources），
+            按作业优先级升序、同优先级按占节点容量的主导份额降序排列；没有可抢占分配的节点不出现
+        """
+        candidates = {}
+        with self.state.lock:
+            for node_id in node_ids:
+                node = self.state.get_node(node_id)
+                if node is None:
+                    continue
+                victims = []
+                for allocation in self.state.node_allocations(node_id):
+                    if allocation["status"] not in ALLOCATED_STATUSES or allocation["job_id"] == exclude_job_id:
+                        continue
+                    job = self.state.get_job(allocation["job_id"])
+                    if job is None or job["priority"] > max_priority:
+                        continue
+                    resources = resource_values(allocation.get("resources") or {})
+                    share = max((resources[dimension] / node["resources"][dimension]
+                                 for dimension in RESOURCE_DIMENSIONS if node["resources"].get(dimension)), default=0.0)
+                    victims.append((job["priority"], -share, {
+                        "allocation_id": allocation["allocation_id"],
+                        "job_id": allocation["job_id"],
+                        "node_id": node_id,
+                        "priority": job["priority"],
+                        "resources": resources
+                    }))
+                if victims:
+                    victims.sort(key=lambda victim: victim[:2])
+                    candidates[node_id] = [victim for _, _, victim in victims]
+        return candidates
+
+    def mark_preempted(self, job_ids: Iterable[str]):
+        """被抢占的作业：仍有分配时按作业状态机更新，分配全部被抢占时置为pending，等待重新调度"""
+        for job_id in job_ids:
+            with self.state.lock:
+                job = self.state.get_job(job_id)
+                if job is None or job["status"] == JobStatus.DEAD.value:
+                    continue
+                if self.state.allocation_status_counts(job_id):
+                    self.update_job_status(job_id)
+                elif job["status"] != JobStatus.PENDING.value:
+                    self.set_job_status(job_id, JobStatus.PENDING.value)
 
     def get_job(self, job_id: str) -> Optional[Dict]:
         """获取作业信息"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return {
-                    "job_id": row[0],
-                    "task_groups": json.loads(row[1]),
-                    "constraints": json.loads(row[2]),
-                    "status": row[3]
-                }
+        with self.state.lock:
+            job = self.state.get_job(job_id)
+            return self._job_view(job) if job else None
+
+    def get_job_model(self, job_id: str) -> Optional[Job]:
+        """获取已解析的作业对象（按作业版本缓存，返回的对象只读）"""
+        with self.state.lock:
+            job = self.state.get_job(job_id)
+        if job is None:
             return None
-        finally:
-            conn.close()
+        return self.job_cache.get(job_id, job["version"], lambda: Job(
+            job_id, job["task_groups"], job["constraints"], job["version"], job["spec_hash"], job["scoring"],
+            job["priority"]))
+
+    def record_evaluations(self, records: List[Dict]):
+        """保存或更新评估记录（SchedulerPlanner.evaluation_record），一批记录作为一条写操作落盘"""
+        self.evaluations.put_many(records)
+
+    def get_evaluation(self, evaluation_id: str) -> Optional[Dict]:
+        return self.evaluations.get(evaluation_id)
+
+    def get_job_evaluations(self, job_id: str) -> List[Dict]:
+        """作业最近的评估记录，最新的在前"""
+        return self.evaluations.job_evaluations(job_id)
 
     def get_job_allocations(self, job_id: str) -> List[Dict]:
         """获取作业的所有分配"""
         print(f"[NodeManager] 获取作业 {job_id} 的所有分配")
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT allocation_id, node_id, task_group, status
-            FROM allocations
-            WHERE job_id = ?
-        ''', (job_id,))
-        allocations = cursor.fetchall()
-
-        conn.commit()
-        conn.close()
-        return [
-            {
-                "allocation_id": row[0],
-                "node_id": row[1],
-                "task_group": row[2],
-                "status": row[3]
-            }
-            for row in allocations
-        ]
+        with self.state.lock:
+            return [
+                {
+                    "allocation_id": allocation["allocation_id"],
+                    "node_id": allocation["node_id"],
+                    "task_group": allocation["task_group"],
+                    "alloc_index": allocation["alloc_index"],
+                    "status": allocation["status"]
+                }
+                for allocation in self.state.job_allocations(job_id)
+            ]
+
+    JOB_UPSERT_SQL = '''
+        INSERT OR REPLACE INTO jobs (job_id, task_groups, constraints, status, version, spec_hash, scoring, priority)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def _stage_job(self, job_data: Dict) -> Tuple[Dict, bool, Tuple]:
+        """在内存状态中写入作业，返回(作业, 是否更新, 持久化行)，调用方需持有state.lock
+
+        作业规范的内容哈希变化时版本号加1，重复提交相同的规范不改变版本号。
+        """
+        # 检查是否是现有作业的更新
+        job_id = job_data.get("job_id")
+        is_update = False
+        current_status = JobStatus.PENDING.value  # 默认为PENDING，用于新作业
+        constraints = job_data.get("constraints", {})
+        scoring = job_data.get("scoring")
+        priority = job_data.get("priority")
+        if priority is None:
+            priority = DEFAULT_JOB_PRIORITY
+        spec_hash = job_spec_hash(job_data["task_groups"], constraints, scoring, priority)
+        version = 1
+
+        if job_id:
+            # 检查作业是否存在
+            existing_job = self.state.get_job(job_id)
+            if existing_job:
+                is_update = True
+                current_status = existing_job["status"]  # 获取当前状态
+                version = existing_job["version"]
+                if existing_job["spec_hash"] != spec_hash:
+                    version += 1
+        else:
+            job_id = str(uuid.uuid4())
+
+        # 使用适当的状态：对于更新保留当前状态，对于新作业使用PENDING
+        job = {
+            "job_id": job_id,
+            "task_groups": job_data["task_groups"],
+            "constraints": constraints,
+            "status": current_status,
+            "version": version,
+            "spec_hash": spec_hash,
+            "scoring": scoring,
+            "priority": priority
+        }
+        self.state.upsert_job(job)
+        self.job_cache.invalidate(job_id)
+        row = (
+            job_id,
+            json.dumps(job["task_groups"]),
+            json.dumps(job["constraints"]),
+            current_status,
+            version,
+            spec_hash,
+            json.dumps(scoring) if scoring is not None else None,
+            priority
+        )
+        return job, is_update, row
 
     def submit_job(self, job_data: Dict) -> Tuple[str, bool]:
         """提交新作业或更新现有作业"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 检查是否是现有作业的更新
-            job_id = job_data.get("job_id")
-            is_update = False
-            current_status = JobStatus.PENDING.value  # 默认为PENDING，用于新作业
-            
-            if job_id:
-                # 检查作业是否存在
-                cursor.execute('SELECT status FROM jobs WHERE job_id = ?', (job_id,))
-                row = cursor.fetchone()
-                if row:
-                    is_update = True
-                    current_status = row[0]  # 获取当前状态
-            else:
-                job_id = str(uuid.uuid4())
-            
-            print(f"\n[NodeManager] {'更新' if is_update else '提交新'}作业，作业ID: {job_id}")
+            with self.state.lock:
+                job, is_update, row = self._stage_job(job_data)
+                self.journal.append(self.JOB_UPSERT_SQL, row)
+            print(f"\n[NodeManager] {'更新' if is_update else '提交新'}作业，作业ID: {job['job_id']}")
             print(f"[NodeManager] 作业详情: {json.dumps(job_data, indent=2, ensure_ascii=False)}")
-            
-            # 使用适当的状态：对于更新保留当前状态，对于新作业使用PENDING
-            status_to_use = current_status
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO jobs (job_id, task_groups, constraints, status)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                job_id,
-                json.dumps(job_data["task_groups"]),
-                json.dumps(job_data.get("constraints", {})),
-                status_to_use
-            ))
-            
-            conn.commit()
-            conn.close()
-            print(f"[NodeManager] 作业已{'更新' if is_update else '保存'}到数据库 (状态: {status_to_use})")
-            return job_id, is_update
+            print(f"[NodeManager] 作业已{'更新' if is_update else '保存'}到数据库 (状态: {job['status']}, 版本: {job['version']})")
+            return job["job_id"], is_update
         except Exception as e:
             print(f"[NodeManager] 提交作业时出错: {e}")
             return None, False
 
+    def submit_jobs(self, job_datas: List[Dict]) -> List[Tuple[str, bool]]:
+        """批量提交作业：一次获取状态锁，所有作业作为同一批写入日志，在一个事务中落盘
+
+        Returns:
+            List[Tuple[str, bool]]: 与输入顺序对应的(作业ID, 是否更新)
+        """
+        with self.state.lock:
+            staged = [self._stage_job(job_data) for job_data in job_datas]
+            self.journal.append_many(self.JOB_UPSERT_SQL, [row for _, _, row in staged])
+        print(f"[NodeManager] 批量提交 {len(staged)} 个作业")
+        return [(job["job_id"], is_update) for job, is_update, _ in staged]
+
     def update_allocation(self, allocation: Allocation) -> bool:
         """更新分配状态"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO allocations (allocation_id, job_id, node_id, task_group, status)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                allocation.id,
-                allocation.job_id,
-                allocation.node_id,
-                allocation.task_group.name,
-                allocation.status.value
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self.state.lock:
+                self.state.upsert_allocation({
+                    "allocation_id": allocation.id,
+                    "job_id": allocation.job_id,
+                    "node_id": allocation.node_id,
+                    "task_group": allocation.task_group.name,
+                    "alloc_index": allocation.index,
+                    "status": allocation.status.value,
+                    "resources": allocation.task_group.get_total_resources(),
+                    "start_time": None,
+                    "end_time": None,
+                    "last_update": None
+                })
+                self.journal.append('''
+                    INSERT OR REPLACE INTO allocations (allocation_id, job_id, node_id, task_group, alloc_index, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    allocation.id,
+                    allocation.job_id,
+                    allocation.node_id,
+                    allocation.task_group.name,
+                    allocation.index,
+                    allocation.status.value
+                ))
+
+                # 为新分配的任务记录资源需求，之后由心跳更新运行状态
+                task_states = self.state.allocation_task_states(allocation.id)
+                task_rows = []
+                for task in allocation.task_group.tasks:
+                    if task.name in task_states:
+                        continue
+                    task_state = {
+                        "resources": resource_values(task.resources),
+                        "config": task.config,
+                        "status": task.status.value,
+                        "start_time": None,
+                        "end_time": None,
+                        "error": None,
+                        "exit_code": None,
+                        "last_update": None,
+                        "message": None
+                    }
+                    self.state.upsert_task_state(allocation.id, task.name, task_state)
+                    task_rows.append(self._task_row(allocation.id, task.name, task_state))
+                self.journal.append_many(TASK_STATUS_UPSERT_SQL, task_rows)
             print(f"[NodeManager] 更新分配状态成功: {allocation.id}")
             
             # 更新作业状态
@@ -336,32 +789,37 @@ class NodeManager:
             Tuple[bool, Optional[str]]: 第一个元素表示操作是否成功，第二个元素是需要通知的节点ID（如果notify_agent为True）
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            node_id_to_notify = None
-            
-            # 先获取分配信息
-            cursor.execute('''
-                SELECT node_id, allocation_id
-                FROM allocations
-                WHERE allocation_id = ?
-            ''', (allocation_id,))
-            row = cursor.fetchone()
-            
-            if row and notify_agent:
-                node_id_to_notify = row[0]
-            
-            # 从数据库中删除分配
-            cursor.execute('DELETE FROM allocations WHERE allocation_id = ?', (allocation_id,))
-            conn.commit()
-            conn.close()
+            with self.state.lock:
+                node_id_to_notify = None
+
+                # 从内存中删除分配及其任务状态，并记录所在节点；丢失的分配所在节点已失联，无需通知
+                allocation = self.state.delete_allocation(allocation_id)
+                if allocation and notify_agent and allocation["status"] != "lost":
+                    node_id_to_notify = allocation["node_id"]
+
+                # 从数据库中删除分配
+                self.journal.append(TASK_STATUS_DELETE_SQL, (allocation_id,))
+                self.journal.append(ALLOCATION_DELETE_SQL, (allocation_id,))
             print(f"[NodeManager] 删除分配成功: {allocation_id}")
             return True, node_id_to_notify
         except Exception as e:
             print(f"[NodeManager] 删除分配时出错: {e}")
             return False, None
 
+    def set_job_status(self, job_id: str, status: str) -> bool:
+        """更新作业状态，作业不存在时返回False"""
+        with self.state.lock:
+            job = self.state.get_job(job_id)
+            if job is None:
+                return False
+            self.state.upsert_job(dict(job, status=status))
+            self.journal.append('''
+                UPDATE jobs 
+                SET status = ? 
+                WHERE job_id = ?
+            ''', (status, job_id))
+            return True
+
     def stop_job(self, job_id: str) -> Tuple[bool, List[Dict]]:
         """停止作业
         1. 获取作业的所有分配
@@ -380,16 +838,7 @@ class NodeManager:
                 print(f"[NodeManager] 作业 {job_id} 没有活跃的分配")
             
             # 更新作业状态为 DEAD
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE jobs 
-                SET status = ? 
-                WHERE job_id = ?
-            ''', (JobStatus.DEAD.value, job_id))
-            
-            conn.commit()
-            conn.close()
+            self.set_job_status(job_id, JobStatus.DEAD.value)
             
             print(f"[NodeManager] 作业 {job_id} 状态已更新为DEAD")
             # 返回所有分配信息，由调用者负责停止分配
@@ -399,101 +848,61 @@ class NodeManager:
             print(f"[NodeManager] 停止作业时出错: {e}")
             return False, []
 
+    def _job_details(self, jobs: List[Dict]) -> List[Dict]:
+        """一次遍历组装作业及其分配、任务状态（调用方需持有state.lock）"""
+        jobs_info = []
+        for job in jobs:
+            allocations_info = []
+            for allocation in self.state.job_allocations(job["job_id"]):
+                allocation_info = self._allocation_view(allocation)
+                allocation_info["tasks"] = {
+                    name: {
+                        "resources": task["resources"],
+                        "config": task["config"],
+                        "status": task["status"],
+                        "start_time": task["start_time"],
+                        "end_time": task["end_time"],
+                        "exit_code": task["exit_code"],
+                        "message": task["message"]
+                    }
+                    for name, task in self.state.allocation_task_states(allocation["allocation_id"]).items()
+                }
+                allocations_info.append(allocation_info)
+
+            job_info = self._job_view(job)
+            job_info["allocations"] = allocations_info
+            jobs_info.append(job_info)
+        return jobs_info
+
     def get_all_jobs(self):
         """获取所有作业信息"""
         try:
-            # 创建数据库连接
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 获取所有作业
-            cursor.execute("SELECT job_id, task_groups, constraints, status FROM jobs")
-            jobs = cursor.fetchall()
-            
-            jobs_info = []
-            for job in jobs:
-                job_id, task_groups, constraints, status = job
-                
-                # 获取作业的所有分配信息
-                cursor.execute("""
-                    SELECT allocation_id, node_id, task_group, status, start_time, end_time 
-                    FROM allocations 
-                    WHERE job_id = ?
-                """, (job_id,))
-                allocations = cursor.fetchall()
-                
-                allocations_info = []
-                for alloc in allocations:
-                    allocation_id, node_id, task_group, alloc_status, start_time, end_time = alloc
-                    
-                    # 获取分配的所有任务信息
-                    cursor.execute("""
-                        SELECT task_name, resources, config, status, start_time, end_time, exit_code, message
-                        FROM task_status
-                        WHERE allocation_id = ?
-                    """, (allocation_id,))
-                    tasks = cursor.fetchall()
-                    
-                    tasks_info = {}
-                    for task in tasks:
-                        name, resources, config, task_status, task_start, task_end, exit_code, message = task
-                        tasks_info[name] = {
-                            "resources": json.loads(resources) if resources else {},
-                            "config": json.loads(config) if config else {},
-                            "status": task_status,
-                            "start_time": task_start,
-                            "end_time": task_end,
-                            "exit_code": exit_code,
-                            "message": message
-                        }
-                    
-                    allocations_info.append({
-                        "allocation_id": allocation_id,
-                        "node_id": node_id,
-                        "task_group": task_group,
-                        "status": alloc_status,
-                        "start_time": start_time,
-                        "end_time": end_time,
-                        "tasks": tasks_info
-                    })
-                
-                jobs_info.append({
-                    "job_id": job_id,
-                    "task_groups": json.loads(task_groups),
-                    "constraints": json.loads(constraints),
-                    "status": status,
-                    "allocations": allocations_info
-                })
-            
-            conn.close()
-            return jobs_info
-            
+            with self.state.lock:
+                return self._job_details(self.state.list_jobs())
         except Exception as e:
             print(f"获取作业信息时出错: {str(e)}")
             return []
 
+    def list_jobs(self, limit: int = 100, cursor: Optional[str] = None,
+                  status: Optional[str] = None) -> Tuple[List[Dict], Optional[str], int]:
+        """分页获取作业信息（按job_id排序的游标分页）
+
+        Args:
+            limit: 每页最多返回的作业数
+            cursor: 上一页返回的游标，为空时从头开始
+            status: 只返回指定状态的作业
+
+        Returns:
+            Tuple[List[Dict], Optional[str], int]: (本页作业, 下一页游标或None, 符合条件的作业总数)
+        """
+        with self.state.lock:
+            jobs, next_cursor, total = self.state.page_jobs(limit, cursor, status)
+            return self._job_details(jobs), next_cursor, total
+
     def get_all_nodes(self) -> Optional[List[Dict]]:
         """获取所有节点信息"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT node_id, ip_address, resources, healthy, last_heartbeat 
-                FROM nodes
-            ''')
-            rows = cursor.fetchall()
-            conn.close()
-            
-            nodes = []
-            for row in rows:
-                nodes.append({
-                    "node_id": row[0],
-                    "ip_address": row[1],
-                    "resources": json.loads(row[2]),
-                    "healthy": bool(row[3]),
-                    "last_heartbeat": row[4]
-                })
-            return nodes
+            return [self._node_view(node) for node in self.state.list_nodes()]
         except Exception as e:
             print(f"[NodeManager] 获取所有节点信息时出错: {e}")
             return None
@@ -501,27 +910,19 @@ class NodeManager:
     def get_node_allocations(self, node_id: str) -> List[Dict]:
         """获取节点的所有分配"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT allocation_id, job_id, task_group, status, start_time, end_time
-                FROM allocations
-                WHERE node_id = ?
-            ''', (node_id,))
-            rows = cursor.fetchall()
-            conn.close()
-            
-            allocations = []
-            for row in rows:
-                allocations.append({
-                    "allocation_id": row[0],
-                    "job_id": row[1],
-                    "task_group": row[2],
-                    "status": row[3],
-                    "start_time": row[4],
-                    "end_time": row[5]
-                })
-            return allocations
+            with self.state.lock:
+                return [
+                    {
+                        "allocation_id": allocation["allocation_id"],
+                        "job_id": allocation["job_id"],
+                        "task_group": allocation["task_group"],
+                        "alloc_index": allocation["alloc_index"],
+                        "status": allocation["status"],
+                        "start_time": allocation["start_time"],
+                        "end_time": allocation["end_time"]
+                    }
+                    for allocation in self.state.node_allocations(node_id)
+                ]
         except Exception as e:
             print(f"[NodeManager] 获取节点分配信息时出错: {e}")
             return []
@@ -529,51 +930,16 @@ class NodeManager:
     def get_job_info(self, job_id: str) -> Optional[Dict]:
         """获取作业详细信息"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 获取作业基本信息
-            cursor.execute('''
-                SELECT job_id, task_groups, constraints, status 
-                FROM jobs 
-                WHERE job_id = ?
-            ''', (job_id,))
-            row = cursor.fetchone()
-            if not row:
-                conn.close()
-                return None
-                
-            job_info = {
-                "job_id": row[0],
-                "task_groups": json.loads(row[1]),
-                "constraints": json.loads(row[2]),
-                "status": row[3]
-            }
-            
-            # 获取作业的所有分配
-            cursor.execute('''
-                SELECT allocation_id, node_id, task_group, status, start_time, end_time
-                FROM allocations
-                WHERE job_id = ?
-            ''', (job_id,))
-            allocations = cursor.fetchall()
-            
-            # 处理分配信息
-            allocations_info = []
-            for alloc in allocations:
-                allocation_id, node_id, task_group, status, start_time, end_time = alloc
-                allocations_info.append({
-                    "allocation_id": allocation_id,
-                    "node_id": node_id,
-                    "task_group": task_group,
-                    "status": status,
-                    "start_time": start_time,
-                    "end_time": end_time
-                })
-            
-            job_info["allocations"] = allocations_info
-            conn.close()
-            return job_info
+            with self.state.lock:
+                job = self.state.get_job(job_id)
+                if not job:
+                    return None
+
+                job_info = self._job_view(job)
+                job_info["allocations"] = [
+                    self._allocation_view(allocation) for allocation in self.state.job_allocations(job_id)
+                ]
+                return job_info
             
         except Exception as e:
             print(f"[NodeManager] 获取作业信息时出错: {e}")
@@ -582,64 +948,20 @@ class NodeManager:
     def update_job_status(self, job_id: str) -> bool:
         """
         更新作业状态
-        根据作业的所有分配状态来确定作业的整体状态
+        由内存中维护的各状态分配计数经derive_job_status推导，不遍历作业的分配
         """
         try:
-            # 获取作业的所有分配
-            allocations = self.get_job_allocations(job_id)
-            if not allocations:
-                return True
-
-            # 统计各种状态的分配数量
-            status_counts = {
-                "pending": 0,
-                "running": 0,
-                "complete": 0,
-                "failed": 0,
-                "lost": 0,
-                "stopped": 0
-            }
-
-            for alloc in allocations:
-                status = alloc["status"].lower()
-                if status in status_counts:
-                    status_counts[status] += 1
-
-            total_allocations = len(allocations)
-            new_status = None
-
-            # 确定作业的新状态
-            if status_counts["lost"] == total_allocations:
-                new_status = JobStatus.LOST
-            elif status_counts["failed"] == total_allocations:
-                new_status = JobStatus.FAILED
-            elif status_counts["running"] > 0:
-                if status_counts["failed"] > 0 or status_counts["lost"] > 0:
-                    new_status = JobStatus.DEGRADED
-                else:
-                    new_status = JobStatus.RUNNING
-            elif status_counts["pending"] == total_allocations:
-                # 检查是否因资源不足而被阻塞
-                if not self._has_sufficient_resources(job_id):
-                    new_status = JobStatus.BLOCKED
-                else:
-                    new_status = JobStatus.PENDING
-            elif status_counts["complete"] + status_counts["stopped"] == total_allocations:
-                new_status = JobStatus.COMPLETE
-
-            if new_status:
-                # 更新数据库中的作业状态
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE jobs 
-                    SET status = ? 
-                    WHERE job_id = ?
-                ''', (new_status.value, job_id))
-                conn.commit()
-                conn.close()
-                print(f"[NodeManager] 作业 {job_id} 状态更新为: {new_status.value}")
-            
+            with self.state.lock:
+                job = self.state.get_job(job_id)
+                if job is None:
+                    return True
+                new_status = derive_job_status(self.state.allocation_status_counts(job_id),
+                                               lambda: self._has_sufficient_resources(job_id))
+                if new_status is None or new_status.value == job["status"]:
+                    return True
+                # 更新作业状态
+                self.set_job_status(job_id, new_status.value)
+            print(f"[NodeManager] 作业 {job_id} 状态更新为: {new_status.value}")
             return True
 
         except Exception as e:
@@ -649,85 +971,118 @@ class NodeManager:
     def _has_sufficient_resources(self, job_id: str) -> bool:
         """
         检查是否有足够的资源来运行作业
-        直接从数据库获取节点资源信息
+        由内存中的已分配资源台账判断，资源不足时打印阻塞的资源维度
         """
-        try:
-            # 获取作业信息
-            job_info = self.get_job_info(job_id)
-            if not job_info:
-                print(f"[NodeManager] 找不到作业 {job_id} 的信息")
+        report = self.explain_job_fit(job_id)
+        if report is None:
+            print(f"[NodeManager] 找不到作业 {job_id} 的信息")
+            return False
+        for task_group_name, fit in report.items():
+            if not fit["fits"]:
+                if not fit["nodes_evaluated"]:
+                    reason = "没有健康的节点"
+                elif fit["blocked_by"]:
+                    reason = f"所有节点的 {', '.join(fit['blocked_by'])} 不足"
+                else:
+                    reason = f"没有节点同时满足所有资源维度 {fit['dimension_exhausted']}"
+                print(f"[NodeManager] 作业 {job_id} 的任务组 {task_group_name} 资源需求无法满足 {fit['required']}：{reason}")
                 return False
+        return True
 
-            # 直接从数据库获取所有健康的节点
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT node_id, resources 
-                FROM nodes 
-                WHERE healthy = 1
-            ''')
-            healthy_nodes = cursor.fetchall()
-            conn.close()
-            
-            if not healthy_nodes:
-                print("[NodeManager] 没有健康的节点可用于资源检查")
-                return False
+    def explain_job_fit(self, job_id: str) -> Optional[Dict[str, Dict]]:
+        """按任务组说明作业能否放入当前健康节点（节点上报资源减去已分配资源台账）
 
-            # 检查每个任务组的资源需求
-            for task_group in job_info["task_groups"]:
-                total_cpu = 0
-                total_memory = 0
-                for task in task_group["tasks"]:
-                    total_cpu += task["resources"].get("cpu", 0)
-                    total_memory += task["resources"].get("memory", 0)
-
-                # 检查是否有节点满足资源要求
-                resource_satisfied = False
-                for node_id, resources_json in healthy_nodes:
-                    node_resources = json.loads(resources_json)
-                    # 计算节点可用资源 (简化逻辑，实际应考虑正在运行的分配)
-                    available_cpu = node_resources.get("cpu", 0)
-                    available_memory = node_resources.get("memory", 0)
-                    
-                    # 查询节点上运行的分配，计算已用资源
-                    conn = sqlite3.connect(self.db_path)
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        SELECT a.allocation_id, ts.resources
-                        FROM allocations a
-                        JOIN task_status ts ON a.allocation_id = ts.allocation_id
-                        WHERE a.node_id = ? AND a.status = 'running'
-                    ''', (node_id,))
-                    running_tasks = cursor.fetchall()
-                    conn.close()
-                    
-                    # 计算已使用的资源
-                    used_cpu = 0
-                    used_memory = 0
-                    for _, task_resources_json in running_tasks:
-                        if task_resources_json:
-                            task_resources = json.loads(task_resources_json)
-                            used_cpu += task_resources.get("cpu", 0)
-                            used_memory += task_resources.get("memory", 0)
-                    
-                    # 计算实际可用资源
-                    available_cpu -= used_cpu
-                    available_memory -= used_memory
-                    
-                    if (available_cpu >= total_cpu and available_memory >= total_memory):
-                        resource_satisfied = True
-                        break
-
-                if not resource_satisfied:
-                    print(f"[NodeManager] 作业 {job_id} 的任务组资源需求无法满足：CPU={total_cpu}, 内存={total_memory}")
-                    return False
+        Returns:
+            Optional[Dict[str, Dict]]: 任务组名 -> {
+                "fits": 是否存在可容纳一个实例的节点,
+                "required": 任务组每个实例的资源需求,
+                "count": 任务组的实例数,
+                "nodes_evaluated": 参与判断的健康节点数,
+                "dimension_exhausted": 资源维度 -> 该维度不足的节点数,
+                "blocked_by": 所有节点都不足的资源维度
+            }，作业不存在时返回None
+        """
+        job = self.get_job_model(job_id)
+        if job is None:
+            return None
+        report = {}
+        with self.state.lock:
+            available = [self.state.available_resources(node) for node in self.state.list_nodes(healthy_only=True)]
+        for task_group in job.task_groups:
+            required = task_group.get_total_resources()
+            exhausted = dict.fromkeys(RESOURCE_DIMENSIONS, 0)
+            fits = False
+            for resources in available:
+                short = [dimension for dimension in RESOURCE_DIMENSIONS if resources[dimension] < required[dimension]]
+                for dimension in short:
+                    exhausted[dimension] += 1
+                fits = fits or not short
+            report[task_group.name] = {
+                "fits": fits,
+                "required": required,
+                "count": task_group.count,
+                "nodes_evaluated": len(available),
+                "dimension_exhausted": {dimension: count for dimension, count in exhausted.items() if count},
+                "blocked_by": [dimension for dimension, count in exhausted.items() if available and count == len(available)]
+            }
+        return report
 
-            print(f"[NodeManager] 作业 {job_id} 的资源需求可以满足")
-            return True
+    def get_node_counts(self) -> Tuple[int, int]:
+        """获取节点总数和不健康节点数"""
+        with self.state.lock:
+            total_nodes = len(self.state.nodes)
+            return total_nodes, total_nodes - len(self.state.list_nodes(healthy_only=True))
 
-        except Exception as e:
-            print(f"[NodeManager] 检查资源时出错: {e}")
-            return False 
+    def mark_unhealthy_nodes(self, timeout_threshold: float) -> List[str]:
+        """将最后心跳早于阈值的健康节点标记为不健康，返回被标记的节点ID"""
+        with self.state.lock:
+            stale_node_ids = [
+                node["node_id"] for node in self.state.list_nodes(healthy_only=True)
+                if node["last_heartbeat"] < timeout_threshold
+            ]
+            for node_id in stale_node_ids:
+                self.state.set_node_health(node_id, False)
+            self.journal.append_many(NODE_UNHEALTHY_SQL, [(node_id,) for node_id in stale_node_ids])
+            return stale_node_ids
+
+    def mark_lost_allocations(self) -> List[Dict]:
+        """将不健康节点上仍处于活动状态的分配及其未结束的任务标记为lost
+
+        Returns:
+            List[Dict]: 被标记的分配（allocation_id, job_id, node_id, task_group, alloc_index）
+        """
+        finished_statuses = ('complete', 'failed', 'lost', 'stopped')
+        lost_allocations = []
+        with self.state.lock:
+            now = time.time()
+            for node in self.state.list_nodes():
+                if node["healthy"]:
+                    continue
+                for allocation in self.state.node_allocations(node["node_id"]):
+                    if allocation["status"] in finished_statuses:
+                        continue
+                    self.state.update_allocation(allocation["allocation_id"], status='lost', end_time=now)
+                    for task_name, task_state in list(self.state.allocation_task_states(allocation["allocation_id"]).items()):
+                        if task_state["status"] not in ('complete', 'failed'):
+                            self.state.upsert_task_state(allocation["allocation_id"], task_name,
+                                                         dict(task_state, status='lost', end_time=now))
+                    lost_allocations.append({
+                        "allocation_id": allocation["allocation_id"],
+                        "job_id": allocation["job_id"],
+                        "node_id": allocation["node_id"],
+                        "task_group": allocation["task_group"],
+                        "alloc_index": allocation["alloc_index"]
+                    })
+
+            self.journal.append_many(ALLOCATION_LOST_SQL,
+                                     [('lost', now, alloc["allocation_id"]) for alloc in lost_allocations])
+            self.journal.append_many(TASK_STATUS_LOST_SQL,
+                                     [('lost', now, alloc["allocation_id"]) for alloc in lost_allocations])
+        return lost_allocations
+
+    def get_allocation_status_counts(self, job_id: str) -> Dict[str, int]:
+        """统计作业各状态的分配数量"""
+        return self.state.allocation_status_counts(job_id)
 
     def delete_job(self, job_id: str) -> bool:
         """删除作业及其所有相关资源
@@ -740,37 +1095,10 @@ class NodeManager:
             
         # 兼容性逻辑 - 之前的方法依赖于stop_job，但现在stop_job不再执行实际操作
         # 因此需要手动处理数据库清理
-        try:
-            # 这个方法不再调用stop_job来删除allocation，而是直接从数据库中删除记录
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 获取所有相关的allocation_ids
-            cursor.execute('SELECT allocation_id FROM allocations WHERE job_id = ?', (job_id,))
-            allocation_ids = [row[0] for row in cursor.fetchall()]
-            
-            # 删除相关的task_status记录
-            for allocation_id in allocation_ids:
-                cursor.execute('DELETE FROM task_status WHERE allocation_id = ?', (allocation_id,))
-                print(f"[NodeManager] 删除allocation {allocation_id}的任务状态记录")
-            
-            # 删除allocation记录
-            cursor.execute('DELETE FROM allocations WHERE job_id = ?', (job_id,))
-            print(f"[NodeManager] 删除作业 {job_id} 的所有分配记录")
-            
-            # 删除job记录
-            cursor.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
-            print(f"[NodeManager] 删除作业 {job_id} 记录")
-            
-            conn.commit()
-            conn.close()
-            
+        if self.clean_job_data(job_id):
             print(f"[NodeManager] 作业 {job_id} 及其相关资源已完全删除")
             return True
-            
-        except Exception as e:
-            print(f"[NodeManager] 删除作业时出错: {e}")
-            return False 
+        return False
 
     def clean_job_data(self, job_id: str) -> bool:
         """清理作业相关的所有数据库记录
@@ -785,28 +1113,25 @@ class NodeManager:
             bool: 操作是否成功
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 获取所有相关的allocation_ids
-            cursor.execute('SELECT allocation_id FROM allocations WHERE job_id = ?', (job_id,))
-            allocation_ids = [row[0] for row in cursor.fetchall()]
-            
-            # 删除相关的task_status记录
-            for allocation_id in allocation_ids:
-                cursor.execute('DELETE FROM task_status WHERE allocation_id = ?', (allocation_id,))
-                print(f"[NodeManager] 删除allocation {allocation_id}的任务状态记录")
-            
-            # 删除allocation记录
-            cursor.execute('DELETE FROM allocations WHERE job_id = ?', (job_id,))
-            print(f"[NodeManager] 删除作业 {job_id} 的所有分配记录")
-            
-            # 删除job记录
-            cursor.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
-            print(f"[NodeManager] 删除作业 {job_id} 记录")
-            
-            conn.commit()
-            conn.close()
+            with self.state.lock:
+                # 获取所有相关的allocation_ids
+                allocation_ids = [alloc["allocation_id"] for alloc in self.state.job_allocations(job_id)]
+                self.state.delete_job(job_id)
+                self.job_cache.invalidate(job_id)
+                self.evaluations.delete_job(job_id)
+
+                # 删除相关的task_status记录
+                self.journal.append_many(TASK_STATUS_DELETE_SQL, [(allocation_id,) for allocation_id in allocation_ids])
+                for allocation_id in allocation_ids:
+                    print(f"[NodeManager] 删除allocation {allocation_id}的任务状态记录")
+
+                # 删除allocation记录
+                self.journal.append(JOB_ALLOCATIONS_DELETE_SQL, (job_id,))
+                print(f"[NodeManager] 删除作业 {job_id} 的所有分配记录")
+
+                # 删除job记录
+                self.journal.append('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+                print(f"[NodeManager] 删除作业 {job_id} 记录")
             
             print(f"[NodeManager] 作业 {job_id} 的所有数据库记录已清理")
             return True
@@ -831,25 +1156,20 @@ class NodeManager:
             template_id = str(uuid.uuid4())
             current_time = time.time()
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO job_templates 
-                (template_id, name, description, task_groups, constraints, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                template_id,
-                template_data["name"],
-                template_data.get("description", ""),
-                json.dumps(template_data["task_groups"]),
-                json.dumps(template_data.get("constraints", {})),
-                current_time,
-                current_time
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self.storage.transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO job_templates 
+                    (template_id, name, description, task_groups, constraints, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    template_id,
+                    template_data["name"],
+                    template_data.get("description", ""),
+                    json.dumps(template_data["task_groups"]),
+                    json.dumps(template_data.get("constraints", {})),
+                    current_time,
+                    current_time
+                ))
             
             print(f"[NodeManager] 成功创建作业模板: {template_id}")
             return True, template_id
@@ -861,8 +1181,7 @@ class NodeManager:
     def get_job_template(self, template_id: str) -> Optional[Dict]:
         """获取作业模板详情"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self.storage.connection().cursor()
             
             cursor.execute('''
                 SELECT template_id, name, description, task_groups, constraints, created_at, updated_at
@@ -871,7 +1190,6 @@ class NodeManager:
             ''', (template_id,))
             
             row = cursor.fetchone()
-            conn.close()
             
             if row:
                 return {
@@ -892,8 +1210,7 @@ class NodeManager:
     def list_job_templates(self) -> List[Dict]:
         """获取所有作业模板"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self.storage.connection().cursor()
             
             cursor.execute('''
                 SELECT template_id, name, description, created_at, updated_at
@@ -911,7 +1228,6 @@ class NodeManager:
                     "updated_at": row[4]
                 })
             
-            conn.close()
             return templates
             
         except Exception as e:
@@ -921,49 +1237,44 @@ class NodeManager:
     def update_job_template(self, template_id: str, template_data: Dict) -> bool:
         """更新作业模板"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 检查模板是否存在
-            cursor.execute('SELECT 1 FROM job_templates WHERE template_id = ?', (template_id,))
-            if not cursor.fetchone():
-                return False
-            
-            # 构建更新语句
-            update_fields = []
-            params = []
+            with self.storage.transaction() as cursor:
+                # 检查模板是否存在
+                cursor.execute('SELECT 1 FROM job_templates WHERE template_id = ?', (template_id,))
+                if not cursor.fetchone():
+                    return False
             
-            if "name" in template_data:
-                update_fields.append("name = ?")
-                params.append(template_data["name"])
+                # 构建更新语句
+                update_fields = []
+                params = []
             
-            if "description" in template_data:
-                update_fields.append("description = ?")
-                params.append(template_data["description"])
+                if "name" in template_data:
+                    update_fields.append("name = ?")
+                    params.append(template_data["name"])
             
-            if "task_groups" in template_data:
-                update_fields.append("task_groups = ?")
-                params.append(json.dumps(template_data["task_groups"]))
+                if "description" in template_data:
+                    update_fields.append("description = ?")
+                    params.append(template_data["description"])
             
-            if "constraints" in template_data:
-                update_fields.append("constraints = ?")
-                params.append(json.dumps(template_data["constraints"]))
+                if "task_groups" in template_data:
+                    update_fields.append("task_groups = ?")
+                    params.append(json.dumps(template_data["task_groups"]))
             
-            update_fields.append("updated_at = ?")
-            params.append(time.time())
+                if "constraints" in template_data:
+                    update_fields.append("constraints = ?")
+                    params.append(json.dumps(template_data["constraints"]))
             
-            # 添加模板ID到参数列表
-            params.append(template_id)
+                update_fields.append("updated_at = ?")
+                params.append(time.time())
             
-            # 执行更新
-            cursor.execute(f'''
-                UPDATE job_templates 
-                SET {", ".join(update_fields)}
-                WHERE template_id = ?
-            ''', params)
+                # 添加模板ID到参数列表
+                params.append(template_id)
             
-            conn.commit()
-            conn.close()
+                # 执行更新
+                cursor.execute(f'''
+                    UPDATE job_templates 
+                    SET {", ".join(update_fields)}
+                    WHERE template_id = ?
+                ''', params)
             
             print(f"[NodeManager] 成功更新作业模板: {template_id}")
             return True
@@ -975,13 +1286,8 @@ class NodeManager:
     def delete_job_template(self, template_id: str) -> bool:
         """删除作业模板"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM job_templates WHERE template_id = ?', (template_id,))
-            
-            conn.commit()
-            conn.close()
+            with self.storage.transaction() as cursor:
+                cursor.execute('DELETE FROM job_templates WHERE template_id = ?', (template_id,))
             
             print(f"[NodeManager] 成功删除作业模板: {template_id}")
             return True
@@ -991,52 +1297,59 @@ class NodeManager:
             return False 
 
     def clear_all_data(self) -> bool:
-        """清空所有数据库表并删除表结构
+        """清空所有数据库表并重建表结构
         
         注意：此方法会删除所有数据，包括：
         - 所有作业
         - 所有节点
         - 所有分配
         - 所有任务状态
-        - 所有作业模板
         
-        同时也会删除所有表结构，下次启动时会重新创建
+        作业模板会被保留。删除表结构后会立即按迁移重新创建，内存状态同步清空。
         
         Returns:
             bool: 操作是否成功
         """
         try:
             print("\n[NodeManager] 开始清空所有数据和表结构")
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 按照依赖关系顺序删除表
-            # 1. 先删除任务状态表（依赖于分配）
-            cursor.execute('DROP TABLE IF EXISTS task_status')
-            print("[NodeManager] 已删除任务状态表")
-            
-            # 2. 删除分配表（依赖于作业和节点）
-            cursor.execute('DROP TABLE IF EXISTS allocations')
-            print("[NodeManager] 已删除分配表")
-            
-            # 3. 删除作业表
-            cursor.execute('DROP TABLE IF EXISTS jobs')
-            print("[NodeManager] 已删除作业表")
-            
-            # 4. 删除节点表
-            cursor.execute('DROP TABLE IF EXISTS nodes')
-            print("[NodeManager] 已删除节点表")
-            
-            # # 5. 删除作业模板表
-            # cursor.execute('DROP TABLE IF EXISTS job_templates')
-            # print("[NodeManager] 已删除作业模板表")
-            
-            conn.commit()
-            conn.close()
+            with self.state.lock:
+                # 先让写后日志中的操作落盘，避免其写入已删除的表
+                self.journal.flush()
+                self.state.clear()
+                self.job_cache.clear()
+                self.evaluations.clear()
+                with self.storage.transaction() as cursor:
+                    # 按照依赖关系顺序删除表
+                    # 1. 先删除任务状态表（依赖于分配）
+                    cursor.execute('DROP TABLE IF EXISTS task_status')
+                    print("[NodeManager] 已删除任务状态表")
+
+                    # 2. 删除分配表（依赖于作业和节点）
+                    cursor.execute('DROP TABLE IF EXISTS allocations')
+                    print("[NodeManager] 已删除分配表")
+
+                    # 3. 删除作业表
+                    cursor.execute('DROP TABLE IF EXISTS jobs')
+                    print("[NodeManager] 已删除作业表")
+
+                    # 4. 删除节点表
+                    cursor.execute('DROP TABLE IF EXISTS nodes')
+                    print("[NodeManager] 已删除节点表")
+
+                    cursor.execute('DROP TABLE IF EXISTS evaluations')
+                    print("[NodeManager] 已删除评估记录表")
+
+                    # # 5. 删除作业模板表
+                    # cursor.execute('DROP TABLE IF EXISTS job_templates')
+                    # print("[NodeManager] 已删除作业模板表")
+
+                    # 重置结构版本，重新执行迁移
+                    cursor.execute('PRAGMA user_version = 0')
+                self.setup_database()
             
             print("[NodeManager] 所有数据和表结构已清空")
             return True
             
         except Exception as e:
             print(f"[NodeManager] 清空数据和表结构时出错: {e}")
-            return False 
\ No newline at end of file
+            return False 
@@ -1,12 +1,15 @@
 import axios from 'axios'
-import type { Job } from '../types'
+import type { BatchSubmitResponse, Evaluation, Job, JobsPage } from '../types'
 
 const API_BASE_URL = 'http://localhost:8500'
 
-// 获取所有作业
-export async function getAllJobs() {
+// 分页获取作业（按job_id排序，cursor为上一页返回的next_cursor）
+export async function getAllJobs(limit = 100, cursor: string | null = null, status: string | null = null) {
     console.log('开始获取作业列表...')
-    const response = await axios.get<{jobs: Job[], count: number}>(`${API_BASE_URL}/jobs`)
+    const params: Record<string, string | number> = { limit }
+    if (cursor) params.cursor = cursor
+    if (status) params.status = status
+    const response = await axios.get<JobsPage>(`${API_BASE_URL}/jobs`, { params })
     console.log('API 返回数据:', response.data)
     return response.data
 }
@@ -19,6 +22,18 @@ export async function getJobInfo(jobId: string) {
     return response.data
 }
 
+// 获取作业最近的评估记录（最新的在前）
+export async function getJobEvaluations(jobId: string) {
+    const response = await axios.get<{evaluations: Evaluation[], count: number}>(`${API_BASE_URL}/jobs/${jobId}/evaluations`)
+    return response.data
+}
+
+// 获取单个评估的状态和分阶段耗时
+export async function getEvaluation(evaluationId: string) {
+    const response = await axios.get<Evaluation>(`${API_BASE_URL}/evaluations/${evaluationId}`)
+    return response.data
+}
+
 // 停止作业
 export async function stopJob(jobId: string) {
     console.log(`开始停止作业 ${jobId}...`)
@@ -53,6 +68,19 @@ export async function submitJob(jobConfig: any) {
     }
 }
 
+// 批量提交作业（作业数组，或 {template_id, overrides}）
+export async function submitJobs(jobConfigs: any[] | { template_id: string, overrides: any[] }) {
+    try {
+        console.log('API: 开始批量提交作业...')
+        const response = await axios.post<BatchSubmitResponse>(`${API_BASE_URL}/jobs/batch`, jobConfigs)
+        console.log('API: 批量提交作业响应:', response.data)
+        return response.data
+    } catch (error) {
+        console.error('API: 批量提交作业请求失败:', error)
+        throw error
+    }
+}
+
 // 更新作业
 export async function updateJob(jobId: string, jobConfig: any) {
     try {
@@ -3,16 +3,24 @@ import { ref } from 'vue'
 import { getAllJobs, stopJob, deleteJob, restartJob, submitJob, updateJob } from '../api/jobs'
 import type { Job } from '../types'
 
+const PAGE_SIZE = 50
+const MAX_PAGE_SIZE = 1000
+
 export const useJobStore = defineStore('jobs', () => {
     const jobs = ref<Job[]>([])
     const loading = ref(false)
+    const nextCursor = ref<string | null>(null)
+    const total = ref(0)
 
-    // 获取所有作业
+    // 刷新已加载的作业（从第一页开始，保持已加载的数量）
     async function fetchJobs() {
         loading.value = true
         try {
-            const response = await getAllJobs()
+            const limit = Math.min(Math.max(PAGE_SIZE, jobs.value.length), MAX_PAGE_SIZE)
+            const response = await getAllJobs(limit)
             jobs.value = response.jobs
+            nextCursor.value = response.next_cursor
+            total.value = response.total
         } catch (error) {
             console.error('获取作业列表失败:', error)
         } finally {
@@ -20,6 +28,22 @@ export const useJobStore = defineStore('jobs', () => {
         }
     }
 
+    // 加载下一页作业
+    async function fetchMoreJobs() {
+        if (!nextCursor.value) return
+        loading.value = true
+        try {
+            const response = await getAllJobs(PAGE_SIZE, nextCursor.value)
+            jobs.value = jobs.value.concat(response.jobs)
+            nextCursor.value = response.next_cursor
+            total.value = response.total
+        } catch (error) {
+            console.error('加载更多作业失败:', error)
+        } finally {
+            loading.value = false
+        }
+    }
+
     // 提交新作业
     async function submitNewJob(jobConfig: any) {
         try {
@@ -90,7 +114,10 @@ export const useJobStore = defineStore('jobs', () => {
     return {
         jobs,
         loading,
+        nextCursor,
+        total,
         fetchJobs,
+        fetchMoreJobs,
         stopJob: stopJobById,
         deleteJob: deleteJobById,
         restartJob: restartJobById,
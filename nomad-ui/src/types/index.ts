@@ -37,6 +37,7 @@ export interface Task {
 
 export interface TaskGroup {
     name: string;
+    count?: number;
     tasks: Task[];
 }
 
@@ -44,6 +45,7 @@ export interface Allocation {
     allocation_id: string;
     node_id: string;
     task_group: string;
+    alloc_index: number;
     status: AllocationStatus;
     start_time: number | null;
     end_time: number | null;
@@ -56,6 +58,93 @@ export interface Job {
     constraints: {
         region: string;
     };
+    scoring?: string | Record<string, number> | null;
+    priority: number;
     status: JobStatus;
+    version: number;
+    spec_hash: string;
     allocations: Allocation[];
-} 
\ No newline at end of file
+    blocked_placement?: BlockedPlacement;
+}
+
+export interface JobsPage {
+    jobs: Job[];
+    count: number;
+    next_cursor: string | null;
+    total: number;
+}
+
+export interface BatchSubmitResult {
+    index: number;
+    job_id?: string;
+    evaluation_id?: string;
+    error?: string;
+}
+
+export interface BatchSubmitResponse {
+    results: BatchSubmitResult[];
+    submitted: number;
+    failed: number;
+}
+
+export interface NodeScore {
+    node_id: string;
+    score: number;
+}
+
+export interface AllocMetric {
+    task_group: string;
+    instances: number;
+    placed: number;
+    preempted: number;
+    nodes_evaluated: number;
+    nodes_filtered: number;
+    constraint_filtered: Record<string, number>;
+    nodes_exhausted: number;
+    dimension_exhausted: Record<string, number>;
+    scores: NodeScore[];
+    allocation_time: number;
+}
+
+export interface BlockedPlacement {
+    evaluation_id: string;
+    alloc_metrics: Record<string, AllocMetric>;
+}
+
+export enum EvaluationStatus {
+    PENDING = "pending",
+    COMPLETE = "complete",
+    FAILED = "failed",
+    BLOCKED = "blocked"
+}
+
+export interface Evaluation {
+    evaluation_id: string;
+    job_id: string;
+    job_version: number;
+    trigger_event: string;
+    status: EvaluationStatus;
+    priority: number;
+    attempt: number;
+    previous_evaluation: string | null;
+    create_time: number;
+    modify_time: number;
+    blocked_task_groups: string[];
+    plan: {
+        create: number;
+        delete: number;
+        preempt: number;
+        created?: number;
+        rejected?: number;
+        preempted?: number;
+    };
+    timings: {
+        queue_wait_seconds: number;
+        snapshot_seconds: number;
+        feasibility_seconds: number;
+        ranking_seconds: number;
+        preemption_seconds: number;
+        apply_seconds: number;
+    };
+    alloc_metrics: Record<string, AllocMetric>;
+}
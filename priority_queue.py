@@ -0,0 +1,73 @@
+from typing import Any, List, Optional, Tuple
+import heapq
+import itertools
+import threading
+import time
+from metrics import PriorityBandMetrics
+
+# 老化速率：每等待1秒有效优先级提高的点数，低优先级的条目最多等待(优先级差/速率)秒
+AGING_RATE = 1.0
+
+class AgingHeap:
+    """按有效优先级出队的堆，调用方负责加锁
+
+    有效优先级 = 优先级 + 老化速率 × 已等待时间。所有条目以相同速率老化，
+    比较有效优先级等价于比较 优先级 - 老化速率 × 入队时间，后者入队后不再变化，
+    因此老化不需要重新排序；有效优先级相同时先入队的先出队。
+    """
+
+    def __init__(self, aging_rate: float = AGING_RATE):
+        self.aging_rate = aging_rate
+        self._heap: List[Tuple[float, int, int, float, Any]] = []
+        self._sequence = itertools.count()
+
+    def push(self, item: Any, priority: int, enqueued_at: Optional[float] = None):
+        enqueued_at = time.monotonic() if enqueued_at is None else enqueued_at
+        key = self.aging_rate * enqueued_at - priority
+        heapq.heappush(self._heap, (key, next(self._sequence), priority, enqueued_at, item))
+
+    def pop(self) -> Tuple[Any, int, float]:
+        """取出有效优先级最高的条目，返回(条目, 优先级, 入队时间)"""
+        _, _, priority, enqueued_at, item = heapq.heappop(self._heap)
+        return item, priority, enqueued_at
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+class PriorityQueue:
+    """线程安全的阻塞优先级队列，带老化和按优先级区间统计的队列长度与等待时间"""
+
+    def __init__(self, aging_rate: float = AGING_RATE):
+        self._condition = threading.Condition()
+        self._heap = AgingHeap(aging_rate)
+        self._running = True
+        self.metrics = PriorityBandMetrics()
+
+    def put(self, item: Any, priority: int):
+        with self._condition:
+            self._heap.push(item, priority)
+            self.metrics.enqueued(priority)
+            self._condition.notify()
+
+    def get(self) -> Optional[Any]:
+        """阻塞等待并取出有效优先级最高的条目，队列关闭且已取空后返回None"""
+        with self._condition:
+            while self._running and not self._heap:
+                self._condition.wait()
+            if not self._heap:
+                return None
+            item, priority, enqueued_at = self._heap.pop()
+            self.metrics.dequeued(priority, time.monotonic() - enqueued_at)
+            return item
+
+    def qsize(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def empty(self) -> bool:
+        return not self.qsize()
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
@@ -0,0 +1,76 @@
+from typing import Callable, Dict, Iterable, List
+import threading
+import time
+
+class RescheduleQueue:
+    """节点失联后的重新调度队列
+
+    受影响的作业按job_id去重后排队，后台线程按令牌桶限速成批交给submit回调创建评估：
+    令牌以rate个/秒补充，最多积累burst个，每个作业消耗一个。一个机架的节点同时失联时，
+    重新调度的评估以受控的速率进入调度器，不会一次性挤占评估队列。
+    """
+
+    def __init__(self, submit: Callable[[List[str]], None], rate: float = 50.0, burst: int = 100):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._submit = submit
+        self._condition = threading.Condition()
+        self._pending: Dict[str, None] = {}  # 按加入顺序
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._running = True
+        self.stats = {"added": 0, "deduplicated": 0, "submitted": 0, "batches": 0}
+        self._thread = threading.Thread(target=self._run, name="reschedule-queue", daemon=True)
+        self._thread.start()
+
+    def add(self, job_ids: Iterable[str]):
+        with self._condition:
+            for job_id in job_ids:
+                if job_id in self._pending:
+                    self.stats["deduplicated"] += 1
+                    continue
+                self._pending[job_id] = None
+                self.stats["added"] += 1
+            self._condition.notify()
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _take(self) -> List[str]:
+        """按可用令牌取出一批作业，令牌不足时等待补充，队列关闭时返回空列表"""
+        with self._condition:
+            while self._running:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                if self._tokens < 1:
+                    self._condition.wait((1 - self._tokens) / self.rate)
+                    continue
+                batch = list(self._pending)[:int(self._tokens)]
+                for job_id in batch:
+                    del self._pending[job_id]
+                self._tokens -= len(batch)
+                self.stats["submitted"] += len(batch)
+                self.stats["batches"] += 1
+                return batch
+            return []
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            try:
+                self._submit(batch)
+            except Exception as e:
+                print(f"[RescheduleQueue] 提交重新调度的作业时出错: {e}")
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=5)
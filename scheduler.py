@@ -1,24 +1,45 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import threading
 import time
 import uuid
-import queue
-from models import Job, TriggerEvent
+from blocked_evals import BlockedEvals
+from eval_broker import EvalBroker
+from metrics import NodeRecoveryMetrics
+from models import AllocationStatus, JobStatus, TriggerEvent
+from reschedule_queue import RescheduleQueue
 from scheduler_planner import SchedulerPlanner, EvaluationStatus
 from node_manager import NodeManager
+from priority_queue import AGING_RATE
 # Forward declaration for type hint
 # from typing import TYPE_CHECKING
 # if TYPE_CHECKING:
 #     from allocation_executor import AllocationExecutor 
 
 class Scheduler:
-    def __init__(self, node_manager: NodeManager):
+    # 等待分配执行器应用计划的最长时间(秒)，超时后放行同一作业的下一个评估
+    PLAN_APPLY_TIMEOUT = 60
+    # 计划被部分拒绝后最多重新评估的次数
+    MAX_PLAN_ATTEMPTS = 3
+
+    def __init__(self, node_manager: NodeManager, workers: int = 4, scoring=None,
+                 reschedule_rate: float = 50.0, reschedule_burst: int = 100, aging_rate: float = AGING_RATE):
         self.node_manager = node_manager
+        self.scoring = scoring  # 集群默认的评分策略，None表示scoring.DEFAULT_SCORING
         self.allocation_executor = None  # 将在之后通过set_executor设置
-        self.evaluation_queue = queue.Queue()
-        print("[Scheduler] 调度器已初始化")
-        self.scheduling_thread = threading.Thread(target=self._scheduling_loop, daemon=True)
-        self.scheduling_thread.start()
+        self.eval_broker = EvalBroker(aging_rate)
+        # 因容量不足失败的评估，在节点容量增加后重新入队
+        self.blocked_evals = BlockedEvals(node_manager, self._unblock_evaluations)
+        # 节点失联后丢失分配的作业，按令牌桶限速成批创建NODE_FAILURE评估
+        self.recovery_metrics = NodeRecoveryMetrics()
+        self.rescheduler = RescheduleQueue(self._reschedule_jobs, reschedule_rate, reschedule_burst)
+        self.workers = max(1, workers)
+        print(f"[Scheduler] 调度器已初始化 ({self.workers} 个调度工作线程)")
+        self.scheduling_threads = [
+            threading.Thread(target=self._scheduling_loop, name=f"scheduler-worker-{index}", daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self.scheduling_threads:
+            thread.start()
 
     def set_executor(self, allocation_executor):
         """设置分配执行器引用，解决循环依赖问题"""
@@ -50,21 +71,33 @@ class Scheduler:
             existing_job = None
 
         print(f"[Scheduler] 开始为作业 {job_id} 创建{'更新' if existing_job else '新'}评估")
-        job = Job(job_id, job_data["task_groups"], job_data.get("constraints", {}))
+        # 新的评估取代作业被阻塞的评估
+        self.blocked_evals.untrack(job_id)
         
         # 在创建评估时就持久化作业的基础状态 - 无论是新作业还是更新
         job_data_to_save = {
             "job_id": job_id,
             "task_groups": job_data["task_groups"],
-            "constraints": job_data.get("constraints", {})
+            "constraints": job_data.get("constraints", {}),
+            "scoring": job_data.get("scoring"),
+            "priority": job_data.get("priority")
             # 对于新作业，默认状态为PENDING；对于更新，保留现有状态
         }
         self.node_manager.submit_job(job_data_to_save)
+        if existing_job and existing_job["status"] == JobStatus.DEAD.value:
+            # 重启或更新已停止的作业；执行器会丢弃仍为dead的作业的过时计划
+            self.node_manager.set_job_status(job_id, JobStatus.PENDING.value)
         print(f"[Scheduler] 已{'更新' if existing_job else '初始化'}作业 {job_id} 的基础数据")
+        # 从共享缓存获取解析后的作业对象，同一版本只解析一次
+        job = self.node_manager.get_job_model(job_id)
+        if job is None:
+            print(f"[Scheduler] 错误：保存作业 {job_id} 失败")
+            return None
             
-        nodes = self.node_manager.get_healthy_nodes()
+        # 共享的集群快照，不复制节点；处理评估时会换成当时的最新快照
+        snapshot, resource_credits = self.node_manager.get_evaluation_view(job_id)
         
-        if not nodes:
+        if not len(snapshot):
             print("[Scheduler] 警告：没有可用的健康节点")
             return None
         
@@ -72,8 +105,10 @@ class Scheduler:
             id=str(uuid.uuid4()),
             trigger_event=TriggerEvent.JOB_UPDATE if existing_job else TriggerEvent.JOB_SUBMIT,
             job=job,
-            nodes=nodes,
-            existing_job=existing_job  # 传入现有作业信息
+            nodes=snapshot,
+            resource_credits=resource_credits,
+            existing_job=existing_job,  # 传入现有作业信息
+            scoring=self.scoring
         )
         
         print(f"[Scheduler] 创建评估成功，评估ID: {evaluation.id}")
@@ -83,14 +118,93 @@ class Scheduler:
         
         return evaluation
 
+    def create_evaluations(self, job_datas: List[Dict]) -> List[Optional[SchedulerPlanner]]:
+        """批量提交新作业并创建评估
+
+        所有作业在一个事务中持久化，共用同一个集群快照，评估一次性加入队列。
+        新作业没有已占用的资源，无需计算资源抵扣。
+
+        Returns:
+            List[Optional[SchedulerPlanner]]: 与输入顺序对应的评估；没有健康节点时全部为None，作业不会被保存
+        """
+        snapshot = self.node_manager.get_cluster_snapshot()
+        if not len(snapshot):
+            print(f"[Scheduler] 警告：没有可用的健康节点，{len(job_datas)} 个作业未保存")
+            return [None] * len(job_datas)
+        job_ids = self.node_manager.submit_jobs([{
+            "job_id": str(uuid.uuid4()),
+            "task_groups": job_data["task_groups"],
+            "constraints": job_data.get("constraints", {}),
+            "scoring": job_data.get("scoring"),
+            "priority": job_data.get("priority")
+        } for job_data in job_datas])
+
+        evaluations = [SchedulerPlanner(
+            id=str(uuid.uuid4()),
+            trigger_event=TriggerEvent.JOB_SUBMIT,
+            job=self.node_manager.get_job_model(job_id),
+            nodes=snapshot,
+            scoring=self.scoring
+        ) for job_id, _ in job_ids]
+        self._enqueue_many(evaluations)
+        print(f"[Scheduler] 已批量创建 {len(evaluations)} 个评估并加入内部队列")
+        return evaluations
+
+    def reschedule_lost(self, lost_allocations: List[Dict]):
+        """为失联节点上丢失的分配安排重新调度
+
+        Args:
+            lost_allocations: NodeManager.mark_lost_allocations返回的分配
+        """
+        instances_by_node: Dict[str, set] = {}
+        job_ids: Dict[str, None] = {}
+        for allocation in lost_allocations:
+            instances_by_node.setdefault(allocation["node_id"], set()).add(
+                (allocation["job_id"], allocation["task_group"], allocation["alloc_index"]))
+            job_ids[allocation["job_id"]] = None
+        for node_id, instances in instances_by_node.items():
+            self.recovery_metrics.node_failed(node_id, instances)
+        self.rescheduler.add(job_ids)
+        print(f"[Scheduler] {len(instances_by_node)} 个失联节点上的 {len(lost_allocations)} 个分配"
+              f"（{len(job_ids)} 个作业）等待重新调度")
+
+    def _reschedule_jobs(self, job_ids: List[str], trigger_event: TriggerEvent = TriggerEvent.NODE_FAILURE):
+        """为一批失去分配的作业（节点失联或被抢占）创建重新调度评估并一次性入队"""
+        evaluations = []
+        for job_id in job_ids:
+            job = self.node_manager.get_job_model(job_id)
+            existing_job = self.node_manager.get_job(job_id)
+            if job is None or existing_job is None or existing_job["status"] == JobStatus.DEAD.value:
+                self.recovery_metrics.discard_job(job_id)
+                continue
+            # 重新调度评估会放置作业所有缺失的实例，取代被阻塞的评估
+            self.blocked_evals.untrack(job_id)
+            evaluations.append(SchedulerPlanner(
+                id=str(uuid.uuid4()),
+                trigger_event=trigger_event,
+                job=job,
+                nodes=[],  # 处理时再获取最新的节点视图
+                existing_job=existing_job,
+                scoring=self.scoring
+            ))
+        if evaluations:
+            self._enqueue_many(evaluations)
+            print(f"[Scheduler] 已为 {len(evaluations)} 个作业创建重新调度评估 ({trigger_event.value})")
+
     def enqueue_evaluation(self, evaluation: SchedulerPlanner):
         """将评估加入调度器自己的队列"""
         if evaluation:
-            self.evaluation_queue.put(evaluation)
+            self.node_manager.record_evaluations([evaluation.evaluation_record()])
+            self.eval_broker.enqueue(evaluation.job.id, evaluation)
             print(f"[Scheduler] 已将评估 {evaluation.id} 加入内部队列")
         else:
             print(f"[Scheduler] 尝试加入空评估到内部队列，已忽略")
 
+    def _enqueue_many(self, evaluations: List[SchedulerPlanner]):
+        """保存评估记录（pending）并一次性入队"""
+        self.node_manager.record_evaluations([evaluation.evaluation_record() for evaluation in evaluations])
+        self.eval_broker.enqueue_many([(evaluation.job.id, evaluation) for evaluation in evaluations])
+
     def process_evaluation(self, evaluation: SchedulerPlanner):
         """处理单个评估"""
         print(f"\n[Scheduler] 开始处理评估 {evaluation.id}")
@@ -100,42 +214,147 @@ class Scheduler:
             print(f"[Scheduler] 错误：尚未设置分配执行器，无法处理评估 {evaluation.id}")
             return
             
-        # 执行评估并获取决策结果
+        # 乐观并发：基于开始处理时的最新状态生成计划，容量冲突由计划应用时的复核发现
+        with evaluation.timed("snapshot"):
+            evaluation.original_nodes_snapshot, evaluation.resource_credits = self.node_manager.get_evaluation_view(evaluation.job.id)
         evaluation_result = evaluation.process(self.node_manager)
         success = evaluation_result["success"]
         plan = evaluation_result["plan"]  # 新分配
         allocations_to_delete = evaluation_result["allocations_to_delete"]  # 要删除的分配
+        preemptions = evaluation_result["preemptions"]  # 要抢占的低优先级分配
         
         if success:
             print(f"[Scheduler] 评估 {evaluation.id} 成功，开始执行分配计划")
-            
-            # 更新作业状态 - 如有必要
-            # 注意：作业的初始状态已在create_evaluation中设置
-            # 如果需要更新作业状态，可以在这里添加逻辑
-            
-            # 提交完整分配计划（创建和删除）给allocation_executor执行
-            self.allocation_executor.submit_plan(plan, allocations_to_delete)
-            print(f"[Scheduler] 提交计划: 创建 {len(plan)} 个分配, 删除 {len(allocations_to_delete)} 个分配")
         else:
-            print(f"[Scheduler] 评估 {evaluation.id} 失败，无法为作业创建分配计划")
+            print(f"[Scheduler] 评估 {evaluation.id} 有任务组无法全部放置，提交已规划的部分，剩余实例等待容量")
+
+        rejected = False
+        if success or plan or allocations_to_delete or preemptions:
+            # 提交分配计划（创建、删除和抢占）给allocation_executor执行，部分放置的计划同样提交
+            plan_result = self.allocation_executor.submit_plan(plan, allocations_to_delete, priority=evaluation.priority,
+                                                               preemptions=preemptions)
+            print(f"[Scheduler] 提交计划: 创建 {len(plan)} 个分配, 删除 {len(allocations_to_delete)} 个分配, "
+                  f"抢占 {len(preemptions)} 个分配")
+            # 等待计划应用后再处理同一作业的下一个评估，使其看到本次计划产生的分配
+            with evaluation.timed("apply"):
+                applied = plan_result.wait(self.PLAN_APPLY_TIMEOUT)
+            if not applied:
+                print(f"[Scheduler] 警告：评估 {evaluation.id} 的计划在 {self.PLAN_APPLY_TIMEOUT} 秒内未应用完成")
+            else:
+                evaluation.apply_result = {"created": len(plan_result.created), "rejected": len(plan_result.rejected),
+                                           "preempted": len(plan_result.preempted)}
+                for allocation in plan_result.created:
+                    if allocation.status == AllocationStatus.RUNNING:
+                        self.recovery_metrics.instance_placed(evaluation.job.id, allocation.task_group.name, allocation.index)
+                if plan_result.preempted:
+                    self._reschedule_jobs(list(dict.fromkeys(victim["job_id"] for victim in plan_result.preempted)),
+                                          TriggerEvent.PREEMPTION)
+                if plan_result.rejected:
+                    rejected = True
+                    self._reevaluate(evaluation, len(plan_result.rejected))
+        # 计划被部分拒绝时由重新评估放置剩余实例，否则跟踪放不下的任务组
+        if not success and not rejected:
+            if self.blocked_evals.block(evaluation):
+                evaluation.status = EvaluationStatus.BLOCKED
+                job = self.node_manager.get_job(evaluation.job.id)
+                if job and job["status"] == JobStatus.PENDING.value:
+                    self.node_manager.set_job_status(evaluation.job.id, JobStatus.BLOCKED.value)
+
+    def blocked_placement(self, job_id: str) -> Optional[Dict]:
+        """作业被阻塞的评估及其放不下的任务组的放置指标，作业未被阻塞时返回None"""
+        evaluation = self.blocked_evals.blocked_evaluation(job_id)
+        if evaluation is None:
+            return None
+        return {
+            "evaluation_id": evaluation.id,
+            "alloc_metrics": {task_group.name: evaluation.alloc_metrics[task_group.name].to_dict()
+                              for task_group in evaluation.blocked_task_groups if task_group.name in evaluation.alloc_metrics}
+        }
+
+    def _unblock_evaluations(self, evaluations: List[SchedulerPlanner]):
+        """为解除阻塞的评估创建重新评估并一次性入队
+
+        沿用原评估的触发事件和作业的旧版本；原评估已提交部分计划时，按更新对照作业当前的分配，
+        只放置剩余的实例。
+        """
+        retries = []
+        for evaluation in evaluations:
+            job_id = evaluation.job.id
+            job = self.node_manager.get_job_model(job_id)
+            existing = self.node_manager.get_job(job_id)
+            if job is None or existing is None or existing["status"] == JobStatus.DEAD.value:
+                continue
+            if existing["status"] == JobStatus.BLOCKED.value:
+                self.node_manager.set_job_status(job_id, JobStatus.PENDING.value)
+            trigger_event, existing_job = evaluation.trigger_event, evaluation.existing_job
+            if evaluation.plan or evaluation.allocations_to_delete:
+                if not evaluation.reconciles_existing:
+                    trigger_event = TriggerEvent.JOB_UPDATE
+                existing_job = existing
+            retries.append(SchedulerPlanner(
+                id=str(uuid.uuid4()),
+                trigger_event=trigger_event,
+                job=job,
+                nodes=[],  # 处理时再获取最新的节点视图
+                existing_job=existing_job,
+                scoring=self.scoring,
+                previous_evaluation=evaluation.id
+            ))
+        if retries:
+            self._enqueue_many(retries)
+            print(f"[Scheduler] 容量变化后重新评估 {len(retries)} 个被阻塞的作业")
+
+    def _reevaluate(self, evaluation: SchedulerPlanner, rejected_count: int):
+        """计划被部分拒绝时，保留已执行的分配，为被拒绝的任务组重新评估"""
+        job_id = evaluation.job.id
+        if evaluation.attempt + 1 >= self.MAX_PLAN_ATTEMPTS:
+            print(f"[Scheduler] 作业 {job_id} 的计划已被拒绝 {evaluation.attempt + 1} 次，停止重新评估")
+            self.node_manager.update_job_status(job_id)
+            return
+        job = self.node_manager.get_job_model(job_id)
+        existing_job = self.node_manager.get_job(job_id)
+        if job is None or existing_job is None:
+            return
+        retry = SchedulerPlanner(
+            id=str(uuid.uuid4()),
+            trigger_event=TriggerEvent.JOB_UPDATE,  # 按更新处理，已执行的分配保持不变
+            job=job,
+            nodes=[],  # 处理时再获取最新的节点视图
+            existing_job=existing_job,
+            attempt=evaluation.attempt + 1,
+            scoring=self.scoring,
+            previous_evaluation=evaluation.id
+        )
+        print(f"[Scheduler] 评估 {evaluation.id} 有 {rejected_count} 个分配被拒绝，创建重新评估 {retry.id}")
+        self.enqueue_evaluation(retry)
 
     def _scheduling_loop(self):
-        """调度循环"""
-        print("[Scheduler] 调度循环已启动")
+        """调度工作线程：阻塞等待评估，同一作业的评估由EvalBroker保证串行"""
+        print(f"[Scheduler] 调度循环已启动 ({threading.current_thread().name})")
         while True:
-            if not self.evaluation_queue.empty():
-                evaluation = self.evaluation_queue.get()
-                print(f"[Scheduler] 从队列中获取评估 {evaluation.id} 进行处理")
-                try:
-                    self.process_evaluation(evaluation)
-                    # Set evaluation status here
-                    if evaluation: # Should always be true if taken from queue
-                        evaluation.status = EvaluationStatus.COMPLETE
-                        print(f"[Scheduler] 评估 {evaluation.id} 处理完成 (状态: {evaluation.status.value})")
-                except Exception as e:
-                    if evaluation: # Should always be true
-                        evaluation.status = EvaluationStatus.FAILED
-                    # Ensure evaluation ID is available even if evaluation object itself might be in a bad state from an error
-                    eval_id_for_log = evaluation.id if evaluation else "未知"
-                    print(f"[Scheduler] 评估 {eval_id_for_log} 处理失败: {e}")
-            time.sleep(1) 
\ No newline at end of file
+            item = self.eval_broker.dequeue()
+            if item is None:
+                return
+            job_id, evaluation = item
+            evaluation.timings["queue_wait"] = time.monotonic() - evaluation.created_at
+            print(f"[Scheduler] 从队列中获取评估 {evaluation.id} 进行处理")
+            try:
+                self.process_evaluation(evaluation)
+                # 规划器已标记为失败或被阻塞的评估保留其状态
+                if evaluation.status == EvaluationStatus.PENDING:
+                    evaluation.status = EvaluationStatus.COMPLETE
+                print(f"[Scheduler] 评估 {evaluation.id} 处理完成 (状态: {evaluation.status.value})")
+            except Exception as e:
+                evaluation.status = EvaluationStatus.FAILED
+                print(f"[Scheduler] 评估 {evaluation.id} 处理失败: {e}")
+            finally:
+                self.node_manager.record_evaluations([evaluation.evaluation_record()])
+                self.eval_broker.ack(job_id)
+
+    def stop(self):
+        """停止所有调度工作线程"""
+        self.rescheduler.close()
+        self.blocked_evals.close()
+        self.eval_broker.close()
+        for thread in self.scheduling_threads:
+            thread.join(timeout=5)
@@ -1,34 +1,68 @@
-from typing import List, Dict, Optional, Set
-import json
+from typing import List, Dict, Optional, Set, Union
+import contextlib
+import time
 import uuid
-from models import EvaluationStatus, Job, Allocation, TriggerEvent, TaskGroup
+import numpy as np
+from models import EvaluationStatus, Job, Allocation, TriggerEvent, TaskGroup, RESOURCE_DIMENSIONS, MIN_JOB_PRIORITY
+from capacity_matrix import NodeCapacityMatrix
+from cluster_snapshot import ClusterSnapshot
+from constraints import Constraint, compile_constraints
+from metrics import AllocMetric
+from scoring import make_scorer
 
 class SchedulerPlanner:
-    def __init__(self, id: str, trigger_event: TriggerEvent, job: Job, nodes: List[Dict], existing_job: Optional[Dict] = None):
+    # 只抢占优先级比本作业至少低这么多的作业的分配（参考Nomad）
+    PREEMPTION_PRIORITY_DELTA = 10
+    # 评估记录的分阶段耗时：入队到出队、获取快照、可行性过滤、节点评分选择、抢占、等待计划应用
+    TIMING_PHASES = ("queue_wait", "snapshot", "feasibility", "ranking", "preemption", "apply")
+
+    def __init__(self, id: str, trigger_event: TriggerEvent, job: Job, nodes: Union[ClusterSnapshot, List[Dict]],
+                 existing_job: Optional[Dict] = None, attempt: int = 0, scoring=None,
+                 resource_credits: Optional[Dict[str, Dict]] = None, previous_evaluation: Optional[str] = None):
         self.id = id
+        self.attempt = attempt  # 计划被部分拒绝后重新评估的次数
+        self.previous_evaluation = previous_evaluation  # 被阻塞或计划被拒绝后重新评估时，原评估的ID
+        self.create_time = time.time()
+        self.created_at = time.monotonic()  # 计算排队时间用
+        self.timings: Dict[str, float] = dict.fromkeys(self.TIMING_PHASES, 0.0)  # 各阶段耗时(秒)
+        self.apply_result: Dict[str, int] = {}  # 计划应用后的created/rejected/preempted数量
+        # 节点评分插件：作业指定的策略优先，其次为集群默认策略(scoring)
+        self.scorer = make_scorer(job.scoring if job.scoring is not None else scoring)
         self.status = EvaluationStatus.PENDING
         self.trigger_event = trigger_event
         self.job = job
-        # Store original nodes, but we'll use a mutable copy with parsed resources in process
+        # 共享的集群快照（或节点列表），评估过程中不修改
         self.original_nodes_snapshot = nodes
+        # 需要加回的资源：node_id -> 资源，作业更新时为作业自身现有分配占用的资源
+        self.resource_credits: Dict[str, Dict] = resource_credits or {}
         self.existing_job = existing_job
         self.plan: List[Allocation] = []  # 要创建的新分配
         self.allocations_to_delete: List[str] = []  # 要删除的分配ID
-        self.nodes_in_evaluation: List[Dict] = [] # Will hold nodes with mutable, parsed resources
+        self.preemptions: List[Dict] = []  # 为放置本作业而抢占的低优先级分配，在创建新分配前停止
+        self.snapshot: Optional[ClusterSnapshot] = None
+        self.capacity: Optional[NodeCapacityMatrix] = None  # 快照容量矩阵的fork，评估的预留记录在其覆盖层中
+        self._evaluation_nodes: Dict[str, Dict] = {}  # 被本评估触及的节点的写时复制副本
+        self._compiled_constraints: Dict[str, List[Constraint]] = {}  # 任务组名 -> 编译后的作业级与任务组约束
+        self.blocked_task_groups: List[TaskGroup] = []  # 没有节点能放下全部实例的任务组，评估失败时由BlockedEvals跟踪
+        self.alloc_metrics: Dict[str, AllocMetric] = {}  # 任务组名 -> 本次评估中放置新实例的指标
         print(f"[SchedulerPlanner] 创建评估 {id} 用于作业 {job.id}")
 
     
     def process(self, node_manager) -> Dict:
         """处理评估，生成分配计划。返回完整决策结果而不执行操作。"""
         print(f"\n[SchedulerPlanner] 开始处理评估 {self.id}")
-        self._prepare_nodes_for_evaluation() # Initialize self.nodes_in_evaluation
+        with self.timed("snapshot"):
+            self._prepare_nodes_for_evaluation()
 
         # 快速检查是否有健康节点
-        healthy_nodes = [n for n in self.nodes_in_evaluation if n.get("healthy", False)]
-        if not healthy_nodes and self.job.task_groups:
+        if not self.capacity.healthy_count and self.job.task_groups:
             print(f"[SchedulerPlanner] 评估失败：没有可用的健康节点，但作业需要 {len(self.job.task_groups)} 个任务组。")
             self.status = EvaluationStatus.FAILED
-            return {"success": False, "plan": self.plan, "allocations_to_delete": self.allocations_to_delete}
+            self.blocked_task_groups = list(self.job.task_groups)
+            self.alloc_metrics = {task_group.name: AllocMetric(task_group.name, task_group.count)
+                                  for task_group in self.job.task_groups}
+            return {"success": False, "plan": self.plan, "allocations_to_delete": self.allocations_to_delete,
+                    "preemptions": self.preemptions}
 
         changes_made_to_allocations = False
         planned_or_kept_task_groups: Set[str] = set()
@@ -36,93 +70,95 @@ class SchedulerPlanner:
         # Get existing allocations for the job
         # This is a snapshot. We'll use a mutable copy for tracking.
         initial_existing_allocations_list = node_manager.get_job_allocations(self.job.id)
-        # Make existing_allocations_by_group mutable for internal tracking during this evaluation
-        existing_allocations_by_group_mutable: Dict[str, Dict] = {
-            alloc["task_group"]: alloc for alloc in initial_existing_allocations_list
-        }
+        # 按任务组名和实例序号索引现有分配：任务组名 -> 实例序号 -> 分配
+        existing_allocations_by_group_mutable: Dict[str, Dict[int, Dict]] = {}
+        for alloc in initial_existing_allocations_list:
+            instances = existing_allocations_by_group_mutable.setdefault(alloc["task_group"], {})
+            index = alloc.get("alloc_index", 0)
+            if index in instances and self.reconciles_existing:
+                # 同一实例有多个分配时只保留一个，其余删除
+                self.allocations_to_delete.append(alloc["allocation_id"])
+                continue
+            instances[index] = alloc
 
         print(f"[SchedulerPlanner] 作业 {self.job.id} 包含 {len(self.job.task_groups)} 个任务组")
-        print(f"[SchedulerPlanner] 作业的现有分配 (本次评估前)：{json.dumps(initial_existing_allocations_list, indent=2)}")
+        print(f"[SchedulerPlanner] 作业的现有分配 (本次评估前)：{len(initial_existing_allocations_list)} 个")
 
-        # 处理每个任务组
-        for task_group in self.job.task_groups:
-            print(f"\n[SchedulerPlanner] 处理任务组：{task_group.name}")
+        # 按资源需求从大到小处理任务组（first-fit-decreasing），大任务组优先获得完整的节点
+        for task_group in self._placement_order():
+            print(f"\n[SchedulerPlanner] 处理任务组：{task_group.name} (count={task_group.count})")
+            kept_indices: Set[int] = set()
+            existing_instances = existing_allocations_by_group_mutable.get(task_group.name)
             
-            # 初始默认为需要创建新分配
-            allocation_was_kept = False
-            existing_allocation_details = existing_allocations_by_group_mutable.get(task_group.name)
-            
-            # 1. 首先尝试保留现有分配 (如果存在且是更新操作)
-            if existing_allocation_details and self.trigger_event == TriggerEvent.JOB_UPDATE and self.existing_job:
-                print(f"[SchedulerPlanner] 发现任务组 {task_group.name} 的现有分配：{existing_allocation_details['allocation_id']}")
-                
-                # 1.1 获取现有分配所在的节点信息
-                current_node_id = existing_allocation_details["node_id"]
-                node_info_from_eval_snapshot = next((n for n in self.nodes_in_evaluation if n["node_id"] == current_node_id), None)
+            # 1. 首先尝试保留现有分配 (如果存在且是更新操作)，只对期望数量与现有数量的差异做调整
+            if existing_instances and self.reconciles_existing and self.existing_job:
+                print(f"[SchedulerPlanner] 发现任务组 {task_group.name} 的 {len(existing_instances)} 个现有分配")
                 
-                # 1.2 获取任务组的旧配置
+                # 1.1 获取任务组的旧配置
                 existing_task_group_def = None
                 for group_def in self.existing_job.get("task_groups", []):
                     if group_def.get("name") == task_group.name:
                         existing_task_group_def = group_def
                         break
                 
-                # 1.3 检查任务组配置是否变化
-                can_keep_allocation = False
+                # 1.2 检查任务组配置是否变化（只改变count不算变化）
+                tasks_changed = True
                 if existing_task_group_def:
-                    # 将当前任务组转换为可比较格式
-                    new_tasks_def = [{"name": t.name, "resources": t.resources, "config": t.config} for t in task_group.tasks]
-                    tasks_changed = self._check_tasks_changed(existing_task_group_def["tasks"], new_tasks_def)
-                    
-                    # 如果任务配置未变更，且现有节点仍满足要求，可以保留分配
-                    if not tasks_changed and node_info_from_eval_snapshot and self.check_node_feasibility(node_info_from_eval_snapshot, task_group, use_parsed_resources=True):
-                        can_keep_allocation = True
-                
-                # 1.4 根据检查结果决定保留还是重新分配
-                if can_keep_allocation:
-                    # 保留现有分配
-                    print(f"[SchedulerPlanner] 任务组 {task_group.name} 在节点 {current_node_id} 上的现有分配保持不变。")
-                    planned_or_kept_task_groups.add(task_group.name)
-                    allocation_was_kept = True
-                    
-                    # 为保留的分配预留资源
-                    node_to_update_resources = next((n for n in self.nodes_in_evaluation if n["node_id"] == current_node_id), None)
-                    if node_to_update_resources:
-                        # 使用集中方法更新资源 - 不创建新分配
-                        self._generate_plan_and_update_resources(task_group, node_to_update_resources, create_allocation=False)
-                    else:
-                        print(f"[SchedulerPlanner] 警告：在 self.nodes_in_evaluation 中未找到节点 {current_node_id} 以更新保留分配的资源。")
-                else:
-                    # 无法保留，需要删除旧分配
-                    if not existing_task_group_def or tasks_changed:
-                        print(f"[SchedulerPlanner] 任务组 {task_group.name} 的任务配置已更改。")
+                    if self.existing_job.get("spec_hash") == self.job.spec_hash:
+                        # 作业规范内容未变（例如重启），无需逐个比较任务
+                        tasks_changed = False
                     else:
-                        print(f"[SchedulerPlanner] 现有节点 {current_node_id} 不再适用于任务组 {task_group.name}。")
-                        
-                    print(f"[SchedulerPlanner] 任务组 {task_group.name} 需要重新规划。将删除旧分配：{existing_allocation_details['allocation_id']}")
-                    # 添加到待删除列表而非直接删除
+                        # 将当前任务组转换为可比较格式
+                        new_tasks_def = [{"name": t.name, "resources": t.resources, "config": t.config} for t in task_group.tasks]
+                        tasks_changed = self._check_tasks_changed(existing_task_group_def["tasks"], new_tasks_def)
+                if tasks_changed:
+                    print(f"[SchedulerPlanner] 任务组 {task_group.name} 的任务配置已更改。")
+                
+                # 1.3 逐个实例决定保留还是删除
+                for index in sorted(existing_instances):
+                    existing_allocation_details = existing_instances[index]
+                    current_node_id = existing_allocation_details["node_id"]
+                    node_info_from_eval_snapshot = self.evaluation_node(current_node_id)
+                    if index >= task_group.count:
+                        print(f"[SchedulerPlanner] 任务组 {task_group.name} 缩容，删除实例 {index} 的分配：{existing_allocation_details['allocation_id']}")
+                    elif existing_allocation_details["status"] == "lost":
+                        print(f"[SchedulerPlanner] 任务组 {task_group.name} 的实例 {index} 已丢失（节点 {current_node_id} 失联），重新放置。")
+                    elif not tasks_changed and node_info_from_eval_snapshot and self.check_node_feasibility(node_info_from_eval_snapshot, task_group):
+                        # 保留现有分配，并为其预留资源 - 不创建新分配
+                        kept_indices.add(index)
+                        self._generate_plan_and_update_resources(task_group, node_info_from_eval_snapshot, create_allocation=False)
+                        continue
+                    elif not tasks_changed:
+                        print(f"[SchedulerPlanner] 现有节点 {current_node_id} 不再适用于任务组 {task_group.name} 的实例 {index}。")
+                    # 无法保留，需要删除旧分配（添加到待删除列表而非直接删除）
                     self.allocations_to_delete.append(existing_allocation_details["allocation_id"])
                     changes_made_to_allocations = True
-                    # 从跟踪字典中移除，防止后续重复处理
-                    del existing_allocations_by_group_mutable[task_group.name]
+                # 从跟踪字典中移除，防止后续重复处理
+                del existing_allocations_by_group_mutable[task_group.name]
+                if kept_indices:
+                    print(f"[SchedulerPlanner] 任务组 {task_group.name} 保留 {len(kept_indices)} 个现有分配。")
             
-            # 2. 如果无法保留现有分配，为任务组创建新的分配
-            if not allocation_was_kept:
-                # 2.1 寻找符合条件的节点
-                feasible_nodes = self.feasibility_check(task_group, use_parsed_resources=True)
-                if not feasible_nodes:
-                    print(f"[SchedulerPlanner] 未找到适用于任务组 {task_group.name} 的节点。")
-                    # 继续处理下一个任务组，最终评估结果由总体覆盖情况决定
-                    continue
-                
-                # 2.2 根据策略对节点排序
-                ranked_nodes = self.rank_nodes(feasible_nodes, use_parsed_resources=True)
-                selected_node = ranked_nodes[0]
-                
-                # 2.3 创建分配并更新资源
-                self._generate_plan_and_update_resources(task_group, selected_node)
-                planned_or_kept_task_groups.add(task_group.name)
+            # 2. 为缺少的实例创建新的分配
+            missing_indices = [index for index in range(task_group.count) if index not in kept_indices]
+            placed = 0
+            if missing_indices:
+                metric = self.alloc_metrics[task_group.name] = AllocMetric(task_group.name, len(missing_indices))
+                start = time.perf_counter()
+                placed = self._place_instances(task_group, missing_indices, metric)
+                if placed < len(missing_indices):
+                    with self.timed("preemption"):
+                        placed += self._preempt_instances(node_manager, task_group, missing_indices[placed:], metric)
+                metric.placed = placed
+                metric.allocation_time = time.perf_counter() - start
+            if placed:
                 changes_made_to_allocations = True
+            if placed < len(missing_indices):
+                print(f"[SchedulerPlanner] 未找到适用于任务组 {task_group.name} 的节点"
+                      f"（{len(missing_indices)} 个实例中只能放置 {placed} 个）：{metric.describe()}。")
+                self.blocked_task_groups.append(task_group)
+                # 已放置的实例和其他任务组的计划照常提交，剩余实例由BlockedEvals跟踪
+                continue
+            planned_or_kept_task_groups.add(task_group.name)
 
         # 处理删除的任务组
         self._cleanup_removed_task_groups(node_manager, existing_allocations_by_group_mutable, changes_made_to_allocations)
@@ -133,34 +169,205 @@ class SchedulerPlanner:
         return {
             "success": success,
             "plan": self.plan,
-            "allocations_to_delete": self.allocations_to_delete
+            "allocations_to_delete": self.allocations_to_delete,
+            "preemptions": self.preemptions
+        }
+
+    @contextlib.contextmanager
+    def timed(self, phase: str):
+        """把代码块的耗时累加到phase阶段"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.perf_counter() - start
+
+    def evaluation_record(self) -> Dict:
+        """评估的可序列化记录，保存在EvaluationStore中供GET /evaluations查询"""
+        plan = {"create": len(self.plan), "delete": len(self.allocations_to_delete), "preempt": len(self.preemptions)}
+        plan.update(self.apply_result)
+        return {
+            "evaluation_id": self.id,
+            "job_id": self.job.id,
+            "job_version": self.job.version,
+            "trigger_event": self.trigger_event.value,
+            "status": self.status.value,
+            "priority": self.priority,
+            "attempt": self.attempt,
+            "previous_evaluation": self.previous_evaluation,
+            "create_time": self.create_time,
+            "modify_time": time.time(),
+            "blocked_task_groups": [task_group.name for task_group in self.blocked_task_groups],
+            "plan": plan,
+            "timings": {f"{phase}_seconds": seconds for phase, seconds in self.timings.items()},
+            "alloc_metrics": {name: metric.to_dict() for name, metric in self.alloc_metrics.items()}
         }
 
+    @property
+    def priority(self) -> int:
+        """评估和计划按作业的优先级出队"""
+        return self.job.priority
+
+    @property
+    def reconciles_existing(self) -> bool:
+        """作业更新、节点失联和被抢占触发的评估按实例对照现有分配，只调整差异"""
+        return self.trigger_event in (TriggerEvent.JOB_UPDATE, TriggerEvent.NODE_FAILURE, TriggerEvent.PREEMPTION)
+
+    def _place_instances(self, task_group: TaskGroup, indices: List[int], metric: Optional[AllocMetric] = None) -> int:
+        """为任务组的多个实例选择节点并生成分配，返回成功放置的实例数"""
+        if len(indices) == 1:
+            selected_node = self.select_node(task_group, metric)
+            if selected_node is None:
+                return 0
+            self._generate_plan_and_update_resources(task_group, selected_node, index=indices[0])
+            return 1
+        if self.capacity is None:
+            self._prepare_nodes_for_evaluation()
+        required = task_group.get_total_resources()
+        with self.timed("feasibility"):
+            mask = self.capacity.feasible_mask(required, self.constraints_for(task_group), metric)
+        with self.timed("ranking"):
+            rows = self.capacity.select_many(mask, required, len(indices), self.scorer, metric)
+        for index, row in zip(indices, rows):
+            node = self.evaluation_node(self.snapshot.nodes[row]["node_id"])
+            self.plan.append(Allocation(
+                id=str(uuid.uuid4()),
+                job_id=self.job.id,
+                node_id=node["node_id"],
+                task_group=task_group,
+                index=index
+            ))
+            self._update_node_resources(node, required)
+        print(f"[SchedulerPlanner] 计划为任务组 {task_group.name} 的 {len(rows)} 个实例分配节点（涉及 {len(set(rows))} 个节点）。")
+        return len(rows)
+
+    def _preempt_instances(self, node_manager, task_group: TaskGroup, indices: List[int],
+                           metric: Optional[AllocMetric] = None) -> int:
+        """剩余资源放不下的实例通过抢占低优先级分配放置，返回放置的实例数
+
+        每个实例在满足约束的健康节点中，选出被抢占分配的最高优先级最低、数量最少、
+        腾出资源最少的节点。节点的可抢占分配按优先级升序、同优先级按大小降序排列，
+        逐个选取直到缺口补齐，再按相反顺序去掉多余的分配，得到不可再减的抢占集合，
+        不枚举分配的子集。
+        """
+        max_priority = self.job.priority - self.PREEMPTION_PRIORITY_DELTA
+        if max_priority < MIN_JOB_PRIORITY:
+            return 0
+        required = task_group.get_total_resources()
+        required_vector = np.array([required.get(dimension, 0) for dimension in RESOURCE_DIMENSIONS], dtype=float)
+        rows = np.flatnonzero(self.capacity.feasible_mask({}, self.constraints_for(task_group)))
+        candidates = node_manager.preemptible_allocations(
+            [self.snapshot.nodes[row]["node_id"] for row in rows.tolist()], max_priority, exclude_job_id=self.job.id)
+        preempted_ids = {victim["allocation_id"] for victim in self.preemptions}
+        preempted_ids.update(self.allocations_to_delete)
+        for node_id in candidates:
+            candidates[node_id] = [victim for victim in candidates[node_id] if victim["allocation_id"] not in preempted_ids]
+
+        placed = 0
+        for index in indices:
+            best = None
+            for node_id, victims in candidates.items():
+                need = required_vector - self.capacity.available_at(self.capacity.rows[node_id])
+                selected = self._select_victims(need, victims)
+                if selected is None:
+                    continue
+                key = (max(victim["priority"] for victim in selected), len(selected),
+                       tuple(sum(victim["resources"][dimension] for victim in selected) for dimension in RESOURCE_DIMENSIONS))
+                if best is None or key < best[0]:
+                    best = (key, node_id, selected)
+            if best is None:
+                break
+            _, node_id, selected = best
+            node = self.evaluation_node(node_id)
+            for victim in selected:
+                candidates[node_id].remove(victim)
+                self.preemptions.append(victim)
+                self._update_node_resources(node, {dimension: -amount for dimension, amount in victim["resources"].items()})
+            if metric is not None:
+                metric.preempted += len(selected)
+            print(f"[SchedulerPlanner] 抢占节点 {node_id} 上 {len(selected)} 个低优先级分配"
+                  f"（优先级 <= {best[0][0]}）以放置任务组 {task_group.name} 的实例 {index}。")
+            self._generate_plan_and_update_resources(task_group, node, index=index)
+            placed += 1
+        return placed
+
+    @staticmethod
+    def _select_victims(need: np.ndarray, victims: List[Dict]) -> Optional[List[Dict]]:
+        """从排好序的可抢占分配中选出补齐资源缺口的最小集合，补不齐时返回None"""
+        remaining = need.copy()
+        selected = []
+        for victim in victims:
+            if np.all(remaining <= 0):
+                break
+            vector = np.array([victim["resources"][dimension] for dimension in RESOURCE_DIMENSIONS], dtype=float)
+            if not np.any((vector > 0) & (remaining > 0)):
+                continue  # 不能缩小缺口
+            selected.append((victim, vector))
+            remaining -= vector
+        if np.any(remaining > 0):
+            return None
+        # 优先级高、体积小的先检查，去掉后缺口仍能补齐的分配不必抢占
+        keep = [True] * len(selected)
+        for position in reversed(range(len(selected))):
+            vector = selected[position][1]
+            if np.all(remaining + vector <= 0):
+                keep[position] = False
+                remaining += vector
+        return [victim for (victim, _), kept in zip(selected, keep) if kept]
+
+    def _placement_order(self) -> List[TaskGroup]:
+        """任务组按主导资源占比（需求 / 快照中该维度的最大节点容量）降序排列，相同时保持作业中的顺序"""
+        if self.capacity is None:
+            self._prepare_nodes_for_evaluation()
+        largest = self.capacity.largest_capacity
+
+        def dominant_share(task_group: TaskGroup) -> float:
+            required = task_group.get_total_resources()
+            return max((required[dimension] / largest[dimension] for dimension in RESOURCE_DIMENSIONS if largest[dimension] > 0),
+                       default=0.0)
+
+        return sorted(self.job.task_groups, key=dominant_share, reverse=True)
+
+    def _cluster_snapshot(self) -> ClusterSnapshot:
+        return ClusterSnapshot.of(self.original_nodes_snapshot)
+
     def _prepare_nodes_for_evaluation(self):
-        """创建节点的深拷贝并解析其资源以供内部使用。"""
-        self.nodes_in_evaluation = []
-        for node_data in self.original_nodes_snapshot:
-            # Create a copy to avoid modifying the original snapshot list/dicts
-            copied_node_data = json.loads(json.dumps(node_data))
-            try:
-                # Parse resources string into a dictionary
-                copied_node_data['resources'] = json.loads(copied_node_data['resources'])
-            except (TypeError, json.JSONDecodeError):
-                # If resources are already a dict (e.g., during tests or if format changes)
-                # or if it's malformed, ensure it's a dict.
-                if not isinstance(copied_node_data.get('resources'), dict):
-                    print(f"[SchedulerPlanner] 警告：节点 {copied_node_data.get('node_id')} 的资源格式错误或非JSON字符串。将使用零资源默认值。")
-                    copied_node_data['resources'] = {"cpu": 0, "memory": 0}
-            self.nodes_in_evaluation.append(copied_node_data)
+        """基于共享快照建立本评估的覆盖层，不复制节点（O(被加回资源的节点数)）"""
+        self.snapshot = self._cluster_snapshot()
+        self.capacity = self.snapshot.matrix.fork()
+        self._evaluation_nodes = {}
+        for node_id, credited in self.resource_credits.items():
+            node = self.evaluation_node(node_id)
+            if node is not None:
+                self._update_node_resources(node, {dimension: -credited.get(dimension, 0) for dimension in RESOURCE_DIMENSIONS})
+
+    def evaluation_node(self, node_id: str) -> Optional[Dict]:
+        """本评估中的节点视图，首次访问时从快照复制（写时复制），快照中不存在时返回None"""
+        node = self._evaluation_nodes.get(node_id)
+        if node is None:
+            snapshot_node = self.snapshot.get_node(node_id)
+            if snapshot_node is None:
+                return None
+            node = dict(snapshot_node, resources=dict(snapshot_node.get("resources") or {}))
+            self._evaluation_nodes[node_id] = node
+        return node
+
+    @property
+    def nodes_in_evaluation(self) -> List[Dict]:
+        """全部节点在本评估中的视图：被触及的节点为副本，其余节点直接引用快照（仅供逐节点检查使用）"""
+        return [self._evaluation_nodes.get(node["node_id"], node) for node in self.snapshot.nodes]
 
     def _update_node_resources(self, node: Dict, resources_to_deduct: Dict):
-        """从节点中扣减资源（集中资源扣减逻辑）"""
+        """从节点中扣减资源（集中资源扣减逻辑），扣减作用于本评估的节点副本，不修改共享快照"""
+        node = self.evaluation_node(node["node_id"]) or node
         # 确保资源字段存在并使用默认值0防止KeyError
-        node['resources']['cpu'] = node['resources'].get('cpu', 0) - resources_to_deduct.get('cpu', 0)
-        node['resources']['memory'] = node['resources'].get('memory', 0) - resources_to_deduct.get('memory', 0)
+        for dimension in RESOURCE_DIMENSIONS:
+            node['resources'][dimension] = node['resources'].get(dimension, 0) - resources_to_deduct.get(dimension, 0)
+        self.capacity.deduct(node["node_id"], resources_to_deduct)
         return node['resources']
 
-    def _generate_plan_and_update_resources(self, task_group: TaskGroup, selected_node: Dict, create_allocation: bool = True):
+    def _generate_plan_and_update_resources(self, task_group: TaskGroup, selected_node: Dict, create_allocation: bool = True,
+                                            index: int = 0):
         """
         生成分配计划并更新节点资源。
         
@@ -168,6 +375,7 @@ class SchedulerPlanner:
             task_group: 要分配的任务组
             selected_node: 选中的节点
             create_allocation: 是否创建新的分配对象（True表示创建新分配，False表示仅扣减资源）
+            index: 新分配在任务组内的实例序号
         
         Returns:
             Allocation对象或None（如果不创建新分配）
@@ -182,7 +390,8 @@ class SchedulerPlanner:
                 id=str(uuid.uuid4()),
                 job_id=self.job.id,
                 node_id=selected_node["node_id"],
-                task_group=task_group
+                task_group=task_group,
+                index=index
             )
             self.plan.append(allocation)
             print(f"[SchedulerPlanner] 计划分配 {allocation.id} 给节点 {selected_node['node_id']}。")
@@ -212,127 +421,46 @@ class SchedulerPlanner:
                 return True
         return False
 
-    def feasibility_check(self, task_group: TaskGroup, use_parsed_resources: bool = False) -> List[Dict]:
-        """检查节点是否满足任务组要求"""
-        target_nodes = self.nodes_in_evaluation if use_parsed_resources else self.original_nodes_snapshot
-        
-        feasible_nodes = []
-        
-        total_resources_needed = task_group.get_total_resources()
-        
-        for node in target_nodes:
-            if not node.get("healthy", False): # Ensure healthy key exists
-                continue
-            
-            # 检查任务组级别的约束条件
-            constraints_satisfied = True
-            for constraint in task_group.constraints:
-                attribute = constraint.get("attribute")
-                operator = constraint.get("operator")
-                value = constraint.get("value")
-                
-                if not all([attribute, operator, value]):
-                    continue
-                    
-                node_value = node.get(attribute)
-                if node_value is None:
-                    constraints_satisfied = False
-                    break
-                    
-                # 根据操作符检查约束条件
-                if operator == "=":
-                    if str(node_value) != str(value):
-                        constraints_satisfied = False
-                        break
-                elif operator == "!=":
-                    if str(node_value) == str(value):
-                        constraints_satisfied = False
-                        break
-                elif operator == ">":
-                    if not (isinstance(node_value, (int, float)) and isinstance(value, (int, float)) and node_value > value):
-                        constraints_satisfied = False
-                        break
-                elif operator == "<":
-                    if not (isinstance(node_value, (int, float)) and isinstance(value, (int, float)) and node_value < value):
-                        constraints_satisfied = False
-                        break
-                elif operator == "regex":
-                    import re
-                    if not re.search(str(value), str(node_value)):
-                        constraints_satisfied = False
-                        break
-            
-            if not constraints_satisfied:
-                continue
-            
-            # 资源检查
-            node_resources = node.get('resources', {"cpu":0, "memory":0}) # Already a dict if use_parsed_resources
-            if not use_parsed_resources: # If using original snapshot, parse now
-                try:
-                    node_resources = json.loads(str(node_resources)) # Ensure it's a string first if it might be a dict
-                except (TypeError, json.JSONDecodeError):
-                    if not isinstance(node_resources, dict): # Check if already a dict
-                         continue # Skip node if resources are malformed
-
-            if node_resources.get("cpu", 0) < total_resources_needed.get("cpu", 0):
-                continue
-                
-            if node_resources.get("memory", 0) < total_resources_needed.get("memory", 0):
-                continue
-            
-            feasible_nodes.append(node)
-            
-        return feasible_nodes
-
-    def rank_nodes(self, nodes: List[Dict], use_parsed_resources: bool = False) -> List[Dict]:
-        """节点排序"""
-        # Simple ranking: prefer nodes with more CPU, then more Memory (bin packing-like)
-        # When use_parsed_resources is True, nodes' 'resources' are already dicts.
-        def get_score(node):
-            node_resources = node.get('resources', {"cpu":0, "memory":0})
-            if not use_parsed_resources and isinstance(node_resources, str):
-                 try:
-                    node_resources = json.loads(node_resources)
-                 except (TypeError, json.JSONDecodeError):
-                    node_resources = {"cpu": 0, "memory": 0} # Default on error
-            
-            # Score higher for more available resources (reverse=True means higher score is better)
-            # This is a simple bin-packing preference (fill up nodes with more resources first)
-            return (node_resources.get("cpu", 0), node_resources.get("memory", 0))
-        
-        return sorted(nodes, key=get_score, reverse=True)
+    def select_node(self, task_group: TaskGroup, metric: Optional[AllocMetric] = None) -> Optional[Dict]:
+        """通过容量矩阵选出任务组的目标节点
+
+        在满足约束且剩余资源足够的健康节点中，由评估的评分插件（作业或集群的策略，默认binpack）
+        选出得分最高的节点，同分时取快照中靠前的节点。过滤和评分以向量运算完成，
+        传入metric时记录过滤和评分的指标。
+        """
+        if self.capacity is None:
+            self._prepare_nodes_for_evaluation()
+        required = task_group.get_total_resources()
+        with self.timed("feasibility"):
+            mask = self.capacity.feasible_mask(required, self.constraints_for(task_group), metric)
+        with self.timed("ranking"):
+            row = self.capacity.select(mask, required, self.scorer, metric)
+        return None if row is None else self.evaluation_node(self.snapshot.nodes[row]["node_id"])
+
+    @staticmethod
+    def _fits(resources: Dict, required: Dict) -> bool:
+        """节点剩余资源是否满足每个资源维度的需求"""
+        return all(resources.get(dimension, 0) >= required.get(dimension, 0) for dimension in RESOURCE_DIMENSIONS)
 
-    def check_node_feasibility(self, node: Dict, task_group: TaskGroup, use_parsed_resources: bool = False) -> bool:
+    def constraints_for(self, task_group: TaskGroup) -> List[Constraint]:
+        """作业级约束与任务组约束合并编译，每次评估每个任务组只编译一次"""
+        constraints = self._compiled_constraints.get(task_group.name)
+        if constraints is None:
+            constraints = compile_constraints(self.job.constraints, task_group.constraints)
+            self._compiled_constraints[task_group.name] = constraints
+        return constraints
+
+    def check_node_feasibility(self, node: Dict, task_group: TaskGroup) -> bool:
         """检查单个节点是否满足任务组要求"""
         if not node["healthy"]:
             return False
-            
-        # 如果已经使用解析过的资源，直接使用字典，不需再次解析
-        if use_parsed_resources:
-            resources = node["resources"]  # 已经是字典
-        else:
-            try:
-                resources = json.loads(node["resources"])
-            except (TypeError, json.JSONDecodeError):
-                if isinstance(node["resources"], dict):
-                    resources = node["resources"]  # 已经是字典
-                else:
-                    print(f"[SchedulerPlanner] 解析节点 {node.get('node_id')} 资源时出错")
-                    return False
-        
-        total_resources = task_group.get_total_resources()
-        
-        if resources.get("cpu", 0) < total_resources.get("cpu", 0):
-            return False
-            
-        if resources.get("memory", 0) < total_resources.get("memory", 0):
+        if not all(constraint.matches_node(node) for constraint in self.constraints_for(task_group)):
             return False
-        
-        return True 
+        return self._fits(node["resources"], task_group.get_total_resources())
 
     def _cleanup_removed_task_groups(self, node_manager, existing_allocations_by_group_mutable, changes_made_to_allocations) -> bool:
         """处理已删除任务组的分配"""
-        if self.trigger_event != TriggerEvent.JOB_UPDATE:
+        if not self.reconciles_existing:
             return changes_made_to_allocations  # 非更新操作无需清理
             
         print("\n[SchedulerPlanner] 检查是否有任务组被删除...")
@@ -341,12 +469,12 @@ class SchedulerPlanner:
         # Iterate over a copy of keys for safe deletion from the mutable dictionary
         for task_group_name_to_check in list(existing_allocations_by_group_mutable.keys()):
             if task_group_name_to_check not in current_task_group_names_in_new_job:
-                alloc_details_to_delete = existing_allocations_by_group_mutable[task_group_name_to_check]
-                allocation_id_to_delete = alloc_details_to_delete["allocation_id"]
+                instances_to_delete = existing_allocations_by_group_mutable[task_group_name_to_check]
+                allocation_ids_to_delete = [alloc["allocation_id"] for alloc in instances_to_delete.values()]
                 print(f"[SchedulerPlanner] 任务组 {task_group_name_to_check} 已从作业规范中删除。")
-                print(f"[SchedulerPlanner] 将删除其现有分配：{allocation_id_to_delete}")
+                print(f"[SchedulerPlanner] 将删除其现有分配：{allocation_ids_to_delete}")
                 # 添加到待删除列表而非直接删除
-                self.allocations_to_delete.append(allocation_id_to_delete)
+                self.allocations_to_delete.extend(allocation_ids_to_delete)
                 changes_made_to_allocations = True
                 del existing_allocations_by_group_mutable[task_group_name_to_check] # Clean from mutable dict
                 
@@ -364,7 +492,7 @@ class SchedulerPlanner:
         self.status = EvaluationStatus.COMPLETE
         
         # 根据情况提供不同的成功消息
-        if not self.plan and not changes_made_to_allocations and self.trigger_event == TriggerEvent.JOB_UPDATE:
+        if not self.plan and not changes_made_to_allocations and self.reconciles_existing:
             print(f"[SchedulerPlanner] 评估完成 (无变更)：计划为空，且未对分配进行任何更改。")
         elif not self.plan:
             print(f"[SchedulerPlanner] 评估完成：计划为空 (作业可能不包含任务组，或所有任务组都保留未更改)。")
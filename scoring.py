@@ -0,0 +1,120 @@
+from typing import Dict, Optional, Type, Union
+import numpy as np
+
+class NodeScorer:
+    """节点评分插件
+
+    score对候选节点批量打分（分数越高越优先），参数为放入任务组后各节点的
+    剩余资源free_after和节点总容量capacity，二者形状均为(候选节点数, 资源维度数)。
+    select在同分时取快照中靠前的节点；需要非数值排序规则的插件可以重写select，
+    并相应重写rank（连续放置多个实例时按rank逐列降序比较，见NodeCapacityMatrix.select_many）。
+    """
+
+    name = ""
+
+    def score(self, free_after: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def select(self, candidates: np.ndarray, free_after: np.ndarray, capacity: np.ndarray) -> int:
+        """从候选行号中选出节点行号（candidates非空且按行号升序）"""
+        return int(candidates[np.argmax(self.score(free_after, capacity))])
+
+    def rank(self, free_after: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+        """与select一致的排序键，形状为(候选节点数, 键数)，逐列降序比较"""
+        return self.score(free_after, capacity)[:, None]
+
+    @staticmethod
+    def free_fraction(free_after: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+        """放入后各维度的剩余比例，容量为0的维度记为0"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(capacity > 0, free_after / capacity, 0.0)
+        return np.clip(fraction, 0.0, 1.0)
+
+class BinPackScorer(NodeScorer):
+    """best-fit装箱（Nomad的binpack公式）：score = 20 - Σ10^剩余比例，归一化到[0, 1]
+
+    优先放到利用率高的节点上，保留完整的空闲节点给大任务组。
+    """
+
+    name = "binpack"
+
+    def score(self, free_after: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+        dimensions = free_after.shape[1]
+        total = np.power(10.0, self.free_fraction(free_after, capacity)).sum(axis=1)
+        return np.clip(10.0 * dimensions - total, 0.0, 9.0 * dimensions) / (9.0 * dimensions)
+
+class SpreadScorer(NodeScorer):
+    """分散放置：binpack的反向打分，优先放到利用率低的节点上"""
+
+    name = "spread"
+
+    def score(self, free_after: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+        dimensions = free_after.shape[1]
+        total = np.power(10.0, self.free_fraction(free_after, capacity)).sum(axis=1)
+        return np.clip(total - dimensions, 0.0, 9.0 * dimensions) / (9.0 * dimensions)
+
+class WorstFitScorer(NodeScorer):
+    """按剩余资源(cpu, memory)降序逐维比较，即容量矩阵之前逐节点排序的方式"""
+
+    name = "worst-fit"
+
+    def score(self, free_after: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+        # 仅用于加权组合：按剩余比例的平均值打分
+        return self.free_fraction(free_after, capacity).mean(axis=1)
+
+    def select(self, candidates: np.ndarray, free_after: np.ndarray, capacity: np.ndarray) -> int:
+        positions = np.arange(len(candidates))
+        for column in range(free_after.shape[1]):
+            if len(positions) <= 1:
+                break
+            values = free_after[positions, column]
+            positions = positions[values == values.max()]
+        return int(candidates[positions[0]])
+
+    def rank(self, free_after: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+        return free_after
+
+class WeightedScorer(NodeScorer):
+    """多个评分插件的加权和"""
+
+    name = "weighted"
+
+    def __init__(self, weights: Dict[str, float]):
+        self.scorers = [(make_scorer(name), float(weight)) for name, weight in weights.items()]
+        total = sum(weight for _, weight in self.scorers)
+        if total <= 0:
+            raise ValueError("评分权重之和必须大于0")
+        self.scorers = [(scorer, weight / total) for scorer, weight in self.scorers]
+
+    def score(self, free_after: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+        return sum(weight * scorer.score(free_after, capacity) for scorer, weight in self.scorers)
+
+SCORERS: Dict[str, Type[NodeScorer]] = {}
+
+def register_scorer(scorer_class: Type[NodeScorer]):
+    """注册评分插件，之后可在作业或集群配置中按名称选择"""
+    SCORERS[scorer_class.name] = scorer_class
+    return scorer_class
+
+for _scorer_class in (BinPackScorer, SpreadScorer, WorstFitScorer):
+    register_scorer(_scorer_class)
+
+# 集群默认的评分策略
+DEFAULT_SCORING = "binpack"
+
+def make_scorer(scoring: Union[str, Dict[str, float], None] = None) -> NodeScorer:
+    """按评分配置创建插件：名称、{名称: 权重}的加权组合，或None表示默认策略
+
+    Raises:
+        ValueError: 未知的评分策略或无效的权重
+    """
+    if scoring is None:
+        scoring = DEFAULT_SCORING
+    if isinstance(scoring, dict):
+        if len(scoring) == 1:
+            return make_scorer(next(iter(scoring)))
+        return WeightedScorer(scoring)
+    scorer_class: Optional[Type[NodeScorer]] = SCORERS.get(scoring)
+    if scorer_class is None:
+        raise ValueError(f"未知的评分策略: {scoring}")
+    return scorer_class()
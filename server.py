@@ -5,24 +5,76 @@ from allocation_executor import AllocationExecutor
 from scheduler import Scheduler
 from node_manager import NodeManager
 from resource_manager import ResourceManager
+from scoring import make_scorer
+from models import invalid_job_priority, invalid_task_group_count
+from priority_queue import AGING_RATE
 import os
 
 # 创建Flask应用
 app = Flask(__name__)
 CORS(app)  # 启用CORS支持
 
+# 调度工作线程数，不同作业的评估并发处理
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '4'))
+# 集群默认的节点评分策略（binpack、spread、worst-fit），作业可通过scoring字段覆盖
+SCHEDULER_SCORING = os.getenv('SCHEDULER_SCORING') or None
+# 节点失联后重新调度的限速：每秒创建的评估数和可积累的突发数
+RESCHEDULE_RATE = float(os.getenv('RESCHEDULE_RATE', '50'))
+RESCHEDULE_BURST = int(os.getenv('RESCHEDULE_BURST', '100'))
+# 评估和计划队列的老化速率：每等待1秒提高的有效优先级
+PRIORITY_AGING_RATE = float(os.getenv('PRIORITY_AGING_RATE', str(AGING_RATE)))
+# 保留的评估记录数，超出后淘汰最早创建的评估
+EVALUATION_STORE_SIZE = int(os.getenv('EVALUATION_STORE_SIZE', '10000'))
+
 # 初始化组件 - 按照正确的顺序创建并解决依赖
-node_manager = NodeManager()
+node_manager = NodeManager(evaluation_capacity=EVALUATION_STORE_SIZE)
 resource_manager = ResourceManager(node_manager)
-allocation_executor = AllocationExecutor(node_manager)
-scheduler = Scheduler(node_manager)
+allocation_executor = AllocationExecutor(node_manager, aging_rate=PRIORITY_AGING_RATE)
+scheduler = Scheduler(node_manager, workers=SCHEDULER_WORKERS, scoring=SCHEDULER_SCORING,
+                      reschedule_rate=RESCHEDULE_RATE, reschedule_burst=RESCHEDULE_BURST,
+                      aging_rate=PRIORITY_AGING_RATE)
 scheduler.set_executor(allocation_executor)
+resource_manager.set_scheduler(scheduler)
 
 print("[Server] 所有组件初始化完成，服务准备就绪")
 
 # 测试环境的密钥
 TEST_API_KEY = os.getenv('TEST_API_KEY', 'test_key_123')
 
+def _invalid_job_spec(job_data: dict):
+    """校验作业的scoring、priority字段和任务组的count字段，无效时返回错误信息"""
+    count_error = invalid_task_group_count(job_data.get("task_groups") or [])
+    if count_error:
+        return count_error
+    priority_error = invalid_job_priority(job_data.get("priority"))
+    if priority_error:
+        return priority_error
+    if job_data.get("scoring") is None:
+        return None
+    try:
+        make_scorer(job_data["scoring"])
+    except (ValueError, TypeError, AttributeError) as e:
+        return f"Invalid scoring: {e}"
+    return None
+
+def _job_from_template(template: dict, overrides: dict) -> dict:
+    """使用模板数据作为基础，允许覆盖task_groups、constraints、scoring和priority字段"""
+    job_data = {
+        "task_groups": template["task_groups"],
+        "constraints": template["constraints"]
+    }
+    for field in ("task_groups", "constraints", "scoring", "priority"):
+        if field in overrides:
+            job_data[field] = overrides[field]
+    return job_data
+
+# POST /jobs/batch 单次请求的最大作业数
+JOBS_BATCH_MAX_SIZE = 1000
+
+# GET /jobs 分页参数
+JOBS_PAGE_DEFAULT_LIMIT = 100
+JOBS_PAGE_MAX_LIMIT = 1000
+
 @app.route('/test/clear-all', methods=['POST'])
 def clear_all_data():
     """清空所有数据的测试接口"""
@@ -87,9 +139,9 @@ def handle_heartbeat():
     if not all(field in data for field in required_fields):
         return jsonify({"error": "Missing required fields"}), 400
     
-    success = resource_manager.handle_heartbeat(data)
-    if success:
-        return jsonify({"message": "Heartbeat received"}), 200
+    ack = resource_manager.handle_heartbeat(data)
+    if ack is not None:
+        return jsonify({"message": "Heartbeat received", **ack}), 200
     else:
         return jsonify({"error": "Failed to process heartbeat"}), 500
 
@@ -184,17 +236,7 @@ def submit_job():
         if not template:
             return jsonify({"error": "指定的模板不存在"}), 404
         
-        # 使用模板数据作为基础，允许覆盖特定字段
-        job_data = {
-            "task_groups": template["task_groups"],
-            "constraints": template["constraints"]
-        }
-        
-        # 允许覆盖模板中的字段
-        if "task_groups" in data:
-            job_data["task_groups"] = data["task_groups"]
-        if "constraints" in data:
-            job_data["constraints"] = data["constraints"]
+        job_data = _job_from_template(template, data)
     else:
         # 直接使用提交的数据
         required_fields = ["task_groups"]
@@ -202,6 +244,10 @@ def submit_job():
             print("[API] 错误：缺少必要字段")
             return jsonify({"error": "Missing required fields"}), 400
         job_data = data
+
+    spec_error = _invalid_job_spec(job_data)
+    if spec_error:
+        return jsonify({"error": spec_error}), 400
     
     evaluation = scheduler.create_evaluation(job_data)
     if evaluation:
@@ -215,6 +261,62 @@ def submit_job():
         print("[API] 作业提交失败")
         return jsonify({"error": "Failed to submit job"}), 500
 
+@app.route('/jobs/batch', methods=['POST'])
+def submit_jobs_batch():
+    """批量提交作业
+
+    请求体为作业规范数组（或{"jobs": [...]}），或{"template_id": ..., "overrides": [...]}，
+    后者的每个覆盖项与模板合并为一个作业。有效的作业在一个事务中保存，共用同一个集群快照，
+    评估一次性加入队列；无效的作业单独返回错误，不影响其他作业。
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and data.get("template_id"):
+        template = node_manager.get_job_template(data["template_id"])
+        if not template:
+            return jsonify({"error": "指定的模板不存在"}), 404
+        overrides = data.get("overrides")
+        if not isinstance(overrides, list):
+            return jsonify({"error": "overrides must be a list"}), 400
+        specs = [_job_from_template(template, override) if isinstance(override, dict) else override
+                 for override in overrides]
+    else:
+        specs = data.get("jobs") if isinstance(data, dict) else data
+        if not isinstance(specs, list):
+            return jsonify({"error": "Expected a list of jobs"}), 400
+    if not specs:
+        return jsonify({"error": "No jobs provided"}), 400
+    if len(specs) > JOBS_BATCH_MAX_SIZE:
+        return jsonify({"error": f"At most {JOBS_BATCH_MAX_SIZE} jobs per batch"}), 400
+
+    results = [{"index": index} for index in range(len(specs))]
+    valid = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict) or "task_groups" not in spec:
+            results[index]["error"] = "Missing required fields"
+            continue
+        spec_error = _invalid_job_spec(spec)
+        if spec_error:
+            results[index]["error"] = spec_error
+            continue
+        valid.append(index)
+
+    if valid:
+        evaluations = scheduler.create_evaluations([specs[index] for index in valid])
+        for index, evaluation in zip(valid, evaluations):
+            if evaluation:
+                results[index]["job_id"] = evaluation.job.id
+                results[index]["evaluation_id"] = evaluation.id
+            else:
+                results[index]["error"] = "没有可用的健康节点"
+
+    submitted = sum("evaluation_id" in result for result in results)
+    print(f"[API] 批量提交 {len(specs)} 个作业: 成功 {submitted}, 失败 {len(specs) - submitted}")
+    return jsonify({
+        "results": results,
+        "submitted": submitted,
+        "failed": len(specs) - submitted
+    }), 200
+
 @app.route('/jobs/<job_id>', methods=['PUT'])
 def update_job(job_id):
     """更新作业"""
@@ -226,6 +328,10 @@ def update_job(job_id):
     job = node_manager.get_job(job_id)
     if not job:
         return jsonify({"error": "作业不存在"}), 404
+
+    spec_error = _invalid_job_spec(data)
+    if spec_error:
+        return jsonify({"error": spec_error}), 400
     
     # 创建评估
     evaluation = scheduler.create_evaluation(data, job_id=job_id)
@@ -250,6 +356,9 @@ def stop_job(job_id):
     if not job:
         return jsonify({"error": "作业不存在"}), 404
     
+    # 作业不再需要调度，丢弃其被阻塞的评估和待恢复的实例
+    scheduler.blocked_evals.untrack(job_id)
+    scheduler.recovery_metrics.discard_job(job_id)
     # 停止作业，使用AllocationExecutor处理完整的停止流程
     success = allocation_executor.stop_job(job_id)
     if success:
@@ -263,11 +372,30 @@ def stop_job(job_id):
 
 @app.route('/jobs', methods=['GET'])
 def get_jobs():
-    """获取所有作业信息"""
-    jobs = node_manager.get_all_jobs()
+    """分页获取作业信息
+
+    查询参数:
+        limit: 每页数量，默认100，最大1000
+        cursor: 上一页响应中的next_cursor
+        status: 按作业状态过滤
+    """
+    try:
+        limit = int(request.args.get('limit', JOBS_PAGE_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1 or limit > JOBS_PAGE_MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {JOBS_PAGE_MAX_LIMIT}"}), 400
+
+    jobs, next_cursor, total = node_manager.list_jobs(
+        limit=limit,
+        cursor=request.args.get('cursor') or None,
+        status=request.args.get('status') or None
+    )
     return jsonify({
         "jobs": jobs,
-        "count": len(jobs)
+        "count": len(jobs),
+        "next_cursor": next_cursor,
+        "total": total
     })
 
 @app.route('/jobs/<job_id>', methods=['GET'])
@@ -278,9 +406,28 @@ def get_job_info(job_id):
     job_info = node_manager.get_job_info(job_id)
     if not job_info:
         return jsonify({"error": "作业不存在"}), 404
+    blocked_placement = scheduler.blocked_placement(job_id)
+    if blocked_placement is not None:
+        job_info["blocked_placement"] = blocked_placement
     
     return jsonify(job_info), 200
 
+@app.route('/jobs/<job_id>/evaluations', methods=['GET'])
+def get_job_evaluations(job_id):
+    """获取作业最近的评估记录，最新的在前"""
+    if not node_manager.get_job(job_id):
+        return jsonify({"error": "作业不存在"}), 404
+    evaluations = node_manager.get_job_evaluations(job_id)
+    return jsonify({"evaluations": evaluations, "count": len(evaluations)}), 200
+
+@app.route('/evaluations/<evaluation_id>', methods=['GET'])
+def get_evaluation(evaluation_id):
+    """获取评估的状态、计划规模和分阶段耗时"""
+    evaluation = node_manager.get_evaluation(evaluation_id)
+    if not evaluation:
+        return jsonify({"error": "评估不存在"}), 404
+    return jsonify(evaluation), 200
+
 @app.route('/nodes', methods=['GET'])
 def get_all_nodes():
     """获取所有节点信息"""
@@ -311,6 +458,9 @@ def delete_job(job_id):
     if not job:
         return jsonify({"error": "作业不存在"}), 404
     
+    # 作业不再需要调度，丢弃其被阻塞的评估和待恢复的实例
+    scheduler.blocked_evals.untrack(job_id)
+    scheduler.recovery_metrics.discard_job(job_id)
     # 删除作业及其相关资源，使用AllocationExecutor处理完整的删除流程
     success = allocation_executor.delete_job(job_id)
     if success:
@@ -339,7 +489,9 @@ def restart_job(job_id):
     # 创建评估，但使用原有的作业配置
     job_config = {
         "task_groups": job["task_groups"],
-        "constraints": job.get("constraints", {})
+        "constraints": job.get("constraints", {}),
+        "scoring": job.get("scoring"),
+        "priority": job.get("priority")
     }
     
     evaluation = scheduler.create_evaluation(job_config, job_id=job_id)
@@ -354,5 +506,19 @@ def restart_job(job_id):
         "message": "作业重启评估已创建并加入队列"
     })
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """调度器的运行指标：节点失联后的恢复耗时、评估队列和计划队列（按优先级区间）、被阻塞评估和重新调度队列"""
+    return jsonify({
+        "node_recovery": scheduler.recovery_metrics.summary(),
+        "eval_broker": dict(scheduler.eval_broker.stats, ready=scheduler.eval_broker.ready_count(),
+                            inflight=scheduler.eval_broker.inflight_count(),
+                            priority_bands=scheduler.eval_broker.metrics.summary()),
+        "plan_queue": {"depth": allocation_executor.plan_queue.qsize(),
+                       "priority_bands": allocation_executor.plan_queue.metrics.summary()},
+        "blocked_evals": dict(scheduler.blocked_evals.stats, tracked=len(scheduler.blocked_evals.blocked_jobs())),
+        "rescheduler": dict(scheduler.rescheduler.stats, pending=scheduler.rescheduler.pending_count())
+    }), 200
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=8500) 
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""myNomad 离线调度模拟器
+
+在合成集群上驱动 Scheduler 和 SchedulerPlanner，回放作业提交、更新和停止的轨迹，
+输出评估吞吐、评估耗时及其分阶段耗时、集群利用率和放置失败数（JSON），用于跟踪调度性能的回归。
+不需要运行服务器和Agent：节点直接注册到临时数据库，分配由模拟的Agent通信器立即确认。
+
+用法:
+    python simulator.py [--nodes 500] [--jobs 2000] [--update-ratio 0.1] [--stop-ratio 0.1] [--seed 0]
+                        [--node-cpu 4000] [--node-memory 16384] [--racks 10] [--classes compute,memory]
+                        [--workers 4] [--scoring binpack] [--save-trace trace.json] [--trace trace.json]
+                        [--output result.json]
+"""
+from typing import Dict, List, Optional
+import argparse
+import contextlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from agent_communicator import AgentCommunicator
+from allocation_executor import AllocationExecutor
+from metrics import percentile
+from models import RESOURCE_DIMENSIONS, Allocation
+from node_manager import NodeManager
+from scheduler import Scheduler
+from scheduler_planner import EvaluationStatus, SchedulerPlanner
+
+# 所有队列清空并保持该时长后认为模拟结束，需大于BlockedEvals合并通知的间隔
+IDLE_SECONDS = 0.2
+
+class SimulatedNodeManager(NodeManager):
+    """节点视图带有合成属性的NodeManager，约束条件可以按rack、class等属性匹配"""
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        self.node_attributes: Dict[str, Dict] = {}
+
+    def register_node(self, node_data: Dict) -> bool:
+        self.node_attributes[node_data["node_id"]] = dict(node_data.get("attributes", {}))
+        return super().register_node(node_data)
+
+    def _node_view(self, node: Dict) -> Dict:
+        view = NodeManager._node_view(node)
+        view.update(self.node_attributes.get(node["node_id"], {}))
+        return view
+
+class SimulatedAgentCommunicator(AgentCommunicator):
+    """不发送请求的Agent通信器，启动和停止分配总是成功"""
+
+    def __init__(self):
+        super().__init__()
+        self.stats = {"started": 0, "stopped": 0}
+
+    def send_allocation(self, allocation: Allocation) -> Optional[Dict]:
+        self.stats["started"] += 1
+        return {"status": "ok"}
+
+    def stop_allocation(self, node_id: str, allocation_id: str) -> bool:
+        self.stats["stopped"] += 1
+        return True
+
+class SimulatedExecutor(AllocationExecutor):
+    """通过模拟的Agent通信器执行计划的AllocationExecutor"""
+
+    def __init__(self, node_manager: NodeManager, **kwargs):
+        super().__init__(node_manager, **kwargs)
+        self.agent_communicator = SimulatedAgentCommunicator()
+        self.node_manager.agent_client = self.agent_communicator
+
+class TimedScheduler(Scheduler):
+    """记录每个评估处理耗时（生成计划并等待计划应用）和放置失败的Scheduler"""
+
+    def __init__(self, node_manager: NodeManager, **kwargs):
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.phases: Dict[str, List[float]] = {phase: [] for phase in SchedulerPlanner.TIMING_PHASES}
+        self.failures = {"failed_evaluations": 0, "unplaced_task_groups": 0}
+        super().__init__(node_manager, **kwargs)
+
+    def process_evaluation(self, evaluation: SchedulerPlanner):
+        start = time.perf_counter()
+        super().process_evaluation(evaluation)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+            for phase, seconds in evaluation.timings.items():
+                self.phases[phase].append(seconds)
+            if evaluation.status in (EvaluationStatus.FAILED, EvaluationStatus.BLOCKED):
+                self.failures["failed_evaluations"] += 1
+                self.failures["unplaced_task_groups"] += len(evaluation.blocked_task_groups)
+
+    def idle(self) -> bool:
+        return (not self.eval_broker.ready_count() and not self.eval_broker.inflight_count()
+                and self.allocation_executor.plan_queue.empty())
+
+def build_nodes(count: int, cpu: int, memory: int, racks: int, classes: List[str]) -> List[Dict]:
+    """合成集群：资源相同的节点，按序号轮流分配rack和class属性"""
+    return [{
+        "node_id": f"node-{index}",
+        "ip_address": f"10.{index // 65536}.{index // 256 % 256}.{index % 256}",
+        "resources": {"cpu": cpu, "memory": memory},
+        "healthy": True,
+        "attributes": {"rack": f"rack-{index % racks}", "class": classes[index % len(classes)]}
+    } for index in range(count)]
+
+def _random_spec(rng: random.Random, racks: int, classes: List[str]) -> Dict:
+    task_groups = []
+    for group in range(rng.choice([1, 1, 2])):
+        task_group = {"name": f"group-{group}", "count": rng.choice([1, 1, 2, 3]), "tasks": [{
+            "name": "task",
+            "resources": {"cpu": rng.choice([100, 250, 500, 1000]), "memory": rng.choice([128, 256, 512, 1024])},
+            "config": {"image": "nginx:latest"}
+        }]}
+        if rng.random() < 0.2:
+            task_group["constraints"] = [{"attribute": "rack", "operator": "=", "value": f"rack-{rng.randrange(racks)}"}]
+        task_groups.append(task_group)
+    constraints = {}
+    if rng.random() < 0.3:
+        constraints = [{"attribute": "class", "operator": "=", "value": rng.choice(classes)}]
+    return {"task_groups": task_groups, "constraints": constraints, "priority": rng.choice([20, 50, 50, 80])}
+
+def generate_trace(jobs: int, update_ratio: float, stop_ratio: float, seed: int,
+                   racks: int, classes: List[str]) -> List[Dict]:
+    """生成作业事件轨迹：jobs个提交，穿插约update_ratio*jobs个更新和stop_ratio*jobs个停止
+
+    事件为 {"op": "submit"|"update"|"stop", "job": 轨迹内的作业名, "spec": 作业定义（停止事件没有）}，
+    更新和停止只针对已提交且未停止的作业。
+    """
+    rng = random.Random(seed)
+    trace = []
+    live: List[str] = []
+    submitted = 0
+    while submitted < jobs:
+        roll = rng.random()
+        if live and roll < stop_ratio:
+            job = live.pop(rng.randrange(len(live)))
+            trace.append({"op": "stop", "job": job})
+        elif live and roll < stop_ratio + update_ratio:
+            job = rng.choice(live)
+            trace.append({"op": "update", "job": job, "spec": _random_spec(rng, racks, classes)})
+        else:
+            job = f"job-{submitted}"
+            submitted += 1
+            live.append(job)
+            trace.append({"op": "submit", "job": job, "spec": _random_spec(rng, racks, classes)})
+    return trace
+
+def _utilization(node_manager: NodeManager) -> Dict:
+    snapshot = node_manager.get_cluster_snapshot()
+    totals = {dimension: 0.0 for dimension in RESOURCE_DIMENSIONS}
+    free = dict(totals)
+    nodes_in_use = 0
+    for node in snapshot.nodes:
+        used = False
+        for dimension in RESOURCE_DIMENSIONS:
+            totals[dimension] += node["capacity"][dimension]
+            free[dimension] += node["resources"][dimension]
+            used = used or node["resources"][dimension] < node["capacity"][dimension]
+        nodes_in_use += used
+    utilization = {dimension: (1 - free[dimension] / totals[dimension]) if totals[dimension] else 0.0
+                   for dimension in RESOURCE_DIMENSIONS}
+    utilization["nodes_in_use"] = nodes_in_use
+    return utilization
+
+def simulate(nodes: List[Dict], trace: List[Dict], workers: int = 4, scoring=None, timeout: float = 600) -> Dict:
+    """在临时数据库上回放轨迹，所有评估（包括被阻塞后重试的）处理完后返回统计结果"""
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        node_manager = SimulatedNodeManager(os.path.join(workdir, "nomad.db"))
+        for node in nodes:
+            node_manager.register_node(node)
+        scheduler = TimedScheduler(node_manager, workers=workers, scoring=scoring)
+        executor = SimulatedExecutor(node_manager)
+        scheduler.set_executor(executor)
+        job_ids: Dict[str, str] = {}
+        counts = {"submit": 0, "update": 0, "stop": 0}
+        try:
+            start = time.perf_counter()
+            for event in trace:
+                counts[event["op"]] += 1
+                job_id = job_ids.get(event["job"])
+                if event["op"] == "submit":
+                    evaluation = scheduler.create_evaluation(dict(event["spec"]))
+                    if evaluation:
+                        job_ids[event["job"]] = evaluation.job.id
+                elif job_id and event["op"] == "update":
+                    scheduler.create_evaluation(dict(event["spec"]), job_id)
+                elif job_id:
+                    scheduler.blocked_evals.untrack(job_id)
+                    executor.stop_job(job_id)
+            replayed = time.perf_counter() - start
+
+            deadline = time.monotonic() + timeout
+            quiet_since = None
+            while time.monotonic() < deadline:
+                if not scheduler.idle():
+                    quiet_since = None
+                elif quiet_since is None:
+                    quiet_since = time.monotonic()
+                elif time.monotonic() - quiet_since >= IDLE_SECONDS:
+                    break
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start - (IDLE_SECONDS if quiet_since is not None else 0)
+
+            with scheduler._lock:
+                latencies = list(scheduler.latencies)
+                phases = {phase: list(samples) for phase, samples in scheduler.phases.items()}
+                failures = dict(scheduler.failures)
+            statuses: Dict[str, int] = {}
+            running = 0
+            for job_id in job_ids.values():
+                status = node_manager.get_job(job_id)["status"]
+                statuses[status] = statuses.get(status, 0) + 1
+                running += node_manager.get_allocation_status_counts(job_id).get("running", 0)
+            return {
+                "nodes": len(nodes),
+                "events": counts,
+                "workers": workers,
+                "completed": scheduler.idle(),
+                "evaluations": len(latencies),
+                "replay_seconds": replayed,
+                "elapsed_seconds": elapsed,
+                "evals_per_sec": len(latencies) / elapsed if elapsed > 0 else 0.0,
+                "eval_latency_ms": {
+                    "p50": percentile(latencies, 50) * 1e3,
+                    "p99": percentile(latencies, 99) * 1e3,
+                    "max": max(latencies, default=0.0) * 1e3
+                },
+                # 评估记录中的分阶段耗时，queue_wait为入队到出队
+                "phase_ms": {phase: {"p50": percentile(samples, 50) * 1e3, "p99": percentile(samples, 99) * 1e3}
+                             for phase, samples in phases.items()},
+                "utilization": _utilization(node_manager),
+                "placement_failures": dict(failures,
+                                           rejected_allocations=executor.stats["rejected"],
+                                           preempted_allocations=executor.stats["preempted"],
+                                           blocked_jobs=len(scheduler.blocked_evals.blocked_jobs())),
+                "allocations": dict(executor.agent_communicator.stats, running=running),
+                "job_statuses": statuses
+            }
+        finally:
+            scheduler.stop()
+            executor.stop()
+            node_manager.journal.close()
+            node_manager.storage.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="myNomad 离线调度模拟器")
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--node-cpu", type=int, default=4000)
+    parser.add_argument("--node-memory", type=int, default=16384)
+    parser.add_argument("--racks", type=int, default=10)
+    parser.add_argument("--classes", default="compute,memory", help="逗号分隔的节点class属性值")
+    parser.add_argument("--jobs", type=int, default=2000, help="轨迹中提交的作业数")
+    parser.add_argument("--update-ratio", type=float, default=0.1)
+    parser.add_argument("--stop-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--scoring", default=None, help="集群默认评分策略，默认binpack")
+    parser.add_argument("--trace", help="回放已保存的轨迹（JSON），忽略--jobs等轨迹参数")
+    parser.add_argument("--save-trace", help="把生成的轨迹保存为JSON，供后续对比回放")
+    parser.add_argument("--output", help="同时把结果写入该JSON文件")
+    args = parser.parse_args()
+
+    classes = args.classes.split(",")
+    if args.trace:
+        with open(args.trace) as f:
+            trace = json.load(f)
+    else:
+        trace = generate_trace(args.jobs, args.update_ratio, args.stop_ratio, args.seed, args.racks, classes)
+    if args.save_trace:
+        with open(args.save_trace, "w") as f:
+            json.dump(trace, f)
+    nodes = build_nodes(args.nodes, args.node_cpu, args.node_memory, args.racks, classes)
+    result = simulate(nodes, trace, workers=args.workers, scoring=args.scoring)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from collections import deque
+import bisect
+import json
+import threading
+import time
+from models import RESOURCE_DIMENSIONS, NODE_RESOURCE_FIELDS
+from storage import Storage
+
+# 计入节点已分配资源台账的分配状态
+ALLOCATED_STATUSES = ("running",)
+# 节点上报的剩余/已用资源随实际使用量持续抖动，各字段的变化都不超过节点总容量的该比例时不视为调度视图变化
+RESOURCE_JITTER_RATIO = 0.05
+
+class StateStore:
+    """内存状态存储（参考Nomad的memdb）
+
+    作为集群状态的权威副本，保存节点、作业、分配和任务状态四张表，
+    并维护按作业/按节点的分配索引和健康节点索引。所有读取直接从内存返回，
+    持久化由NodeManager通过WriteBehindJournal异步完成。
+
+    返回的行字典是内部对象的引用，调用方（NodeManager）负责在对外返回前复制，
+    其中作业的task_groups/constraints等嵌套结构按只读约定共享。
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.index = 0  # 每次写入递增，用于判断状态是否发生变化
+        self.cluster_index = 0  # 可调度节点视图（节点资源、健康状态、已分配资源台账）变化时递增
+        # 节点可用资源可能增加时（节点注册或恢复健康、上报资源增加、分配释放资源）以(node_id, cluster_index)调用，
+        # 调用时持有锁，回调只应记录事件
+        self.capacity_listeners: List[Callable[[str, int], None]] = []
+        self._reset()
+
+    def _reset(self):
+        self.nodes: Dict[str, Dict] = {}
+        self.jobs: Dict[str, Dict] = {}
+        # 按job_id排序的作业索引（全部/按状态），用于游标分页
+        self._job_ids_sorted: List[str] = []
+        self._job_ids_by_status: Dict[str, List[str]] = {}
+        self.allocations: Dict[str, Dict] = {}
+        self.task_states: Dict[str, Dict[str, Dict]] = {}  # allocation_id -> task_name -> 状态
+        # 二级索引，使用dict作为有序集合以保持插入顺序
+        self._allocs_by_job: Dict[str, Dict[str, None]] = {}
+        self._allocs_by_node: Dict[str, Dict[str, None]] = {}
+        # 每个作业各状态的分配计数，随分配的增删和状态变化以O(1)维护
+        self._alloc_status_counts: Dict[str, Dict[str, int]] = {}
+        # 已分配资源台账：每个节点上占用资源的分配（ALLOCATED_STATUSES）的资源合计
+        self._allocated_by_node: Dict[str, Dict[str, int]] = {}
+        self._healthy_nodes: Dict[str, None] = {}
+        # 每个节点最近一次改变调度视图（递增cluster_index）时的节点行，心跳与它比较以累计小幅抖动
+        self._schedulable_nodes: Dict[str, Dict] = {}
+
+    def load(self, storage: Storage):
+        """从数据库重建内存状态（启动时调用）"""
+        with self.lock:
+            self._reset()
+            for row in storage.query(f'''
+                SELECT node_id, ip_address, healthy, last_heartbeat, {", ".join(NODE_RESOURCE_FIELDS)} FROM nodes
+            '''):
+                self.upsert_node({
+                    "node_id": row[0],
+                    "ip_address": row[1],
+                    "resources": dict(zip(NODE_RESOURCE_FIELDS, row[4:])),
+                    "healthy": bool(row[2]),
+                    "last_heartbeat": row[3]
+                })
+            for job_id, task_groups, constraints, status, version, spec_hash, scoring, priority in storage.query('''
+                SELECT job_id, task_groups, constraints, status, version, spec_hash, scoring, priority FROM jobs
+            '''):
+                self.upsert_job({
+                    "job_id": job_id,
+                    "task_groups": json.loads(task_groups) if task_groups else [],
+                    "constraints": json.loads(constraints) if constraints else {},
+                    "status": status,
+                    "version": version,
+                    "spec_hash": spec_hash,
+                    "scoring": json.loads(scoring) if scoring else None,
+                    "priority": priority
+                })
+            # 一次LEFT JOIN同时加载分配及其任务状态，避免逐个分配查询
+            allocation_fields = ("allocation_id", "job_id", "node_id", "task_group", "status",
+                                 "start_time", "end_time", "last_update", "alloc_index")
+            for row in storage.query(f'''
+                SELECT a.allocation_id, a.job_id, a.node_id, a.task_group, a.status,
+                       a.start_time, a.end_time, a.last_update, a.alloc_index,
+                       ts.task_name, ts.config, ts.status, ts.start_time, ts.end_time,
+                       ts.error, ts.exit_code, ts.last_update, ts.message,
+                       {", ".join(f"ts.{dimension}" for dimension in RESOURCE_DIMENSIONS)}
+                FROM allocations a
+                LEFT JOIN task_status ts ON ts.allocation_id = a.allocation_id
+            '''):
+                allocation_id = row[0]
+                if allocation_id not in self.allocations:
+                    self.upsert_allocation(dict(zip(allocation_fields, row[:9])))
+                if row[9] is None:
+                    continue
+                self.upsert_task_state(allocation_id, row[9], {
+                    "resources": dict(zip(RESOURCE_DIMENSIONS, row[18:])),
+                    "config": json.loads(row[10]) if row[10] else {},
+                    "status": row[11],
+                    "start_time": row[12],
+                    "end_time": row[13],
+                    "error": row[14],
+                    "exit_code": row[15],
+                    "last_update": row[16],
+                    "message": row[17]
+                })
+            # 分配占用的资源为其任务资源之和，加载任务状态后再计入台账
+            for allocation_id, task_states in self.task_states.items():
+                totals = dict.fromkeys(RESOURCE_DIMENSIONS, 0)
+                for task_state in task_states.values():
+                    for dimension in RESOURCE_DIMENSIONS:
+                        totals[dimension] += task_state["resources"].get(dimension, 0)
+                self.update_allocation(allocation_id, resources=totals)
+
+    def clear(self):
+        """清空所有内存状态"""
+        with self.lock:
+            self._reset()
+            self.index += 1
+            self.cluster_index += 1
+
+    # ---- 节点表 ----
+
+    @staticmethod
+    def _same_schedulable_node(previous: Optional[Dict], node: Dict) -> bool:
+        """两个节点行除心跳时间和上报资源的抖动外是否相同（不影响调度视图）"""
+        if previous is None or len(previous) != len(node):
+            return False
+        for key, value in node.items():
+            if key == "last_heartbeat":
+                continue
+            if key == "resources":
+                if not StateStore._within_jitter(previous["resources"], value):
+                    return False
+            elif previous.get(key) != value:
+                return False
+        return True
+
+    @staticmethod
+    def _within_jitter(previous: Dict, resources: Dict) -> bool:
+        """上报资源的每个字段相对previous的变化是否都不超过节点总容量的RESOURCE_JITTER_RATIO"""
+        if previous.keys() != resources.keys():
+            return False
+        for dimension in RESOURCE_DIMENSIONS:
+            used = f"{dimension}_used"
+            tolerance = RESOURCE_JITTER_RATIO * (resources.get(dimension, 0) + resources.get(used, 0))
+            if (abs(resources.get(dimension, 0) - previous.get(dimension, 0)) > tolerance
+                    or abs(resources.get(used, 0) - previous.get(used, 0)) > tolerance):
+                return False
+        return True
+
+    def _capacity_freed(self, node_id: str):
+        for listener in self.capacity_listeners:
+            listener(node_id, self.cluster_index)
+
+    @staticmethod
+    def _gained_capacity(previous: Optional[Dict], node: Dict) -> bool:
+        """节点变为可调度，或上报的某个资源维度增加"""
+        if not node["healthy"]:
+            return False
+        if previous is None or not previous["healthy"]:
+            return True
+        return any(node["resources"].get(dimension, 0) > previous["resources"].get(dimension, 0)
+                   for dimension in RESOURCE_DIMENSIONS)
+
+    def upsert_node(self, node: Dict):
+        with self.lock:
+            previous = self._schedulable_nodes.get(node["node_id"])
+            if not self._same_schedulable_node(previous, node):
+                self.cluster_index += 1
+                self._schedulable_nodes[node["node_id"]] = node
+                if self._gained_capacity(previous, node):
+                    self._capacity_freed(node["node_id"])
+            self.nodes[node["node_id"]] = node
+            if node["healthy"]:
+                self._healthy_nodes[node["node_id"]] = None
+            else:
+                self._healthy_nodes.pop(node["node_id"], None)
+            self.index += 1
+
+    def get_node(self, node_id: str) -> Optional[Dict]:
+        return self.nodes.get(node_id)
+
+    def list_nodes(self, healthy_only: bool = False) -> List[Dict]:
+        with self.lock:
+            if healthy_only:
+                return [self.nodes[node_id] for node_id in self._healthy_nodes]
+            return list(self.nodes.values())
+
+    def set_node_health(self, node_id: str, healthy: bool):
+        with self.lock:
+            node = self.nodes.get(node_id)
+            if node is None:
+                return
+            changed = node["healthy"] != healthy
+            if changed:
+                self.cluster_index += 1
+                self._schedulable_nodes[node_id] = node
+            node["healthy"] = healthy
+            if changed and healthy:
+                self._capacity_freed(node_id)
+            if healthy:
+                self._healthy_nodes[node_id] = None
+            else:
+                self._healthy_nodes.pop(node_id, None)
+            self.index += 1
+
+    # ---- 作业表 ----
+
+    def upsert_job(self, job: Dict):
+        with self.lock:
+            job_id = job["job_id"]
+            previous = self.jobs.get(job_id)
+            if previous is None:
+                bisect.insort(self._job_ids_sorted, job_id)
+                bisect.insort(self._job_ids_by_status.setdefault(job["status"], []), job_id)
+            elif previous["status"] != job["status"]:
+                self._unindex_job_status(previous["status"], job_id)
+                bisect.insort(self._job_ids_by_status.setdefault(job["status"], []), job_id)
+            self.jobs[job_id] = job
+            self.index += 1
+
+    @staticmethod
+    def _remove_sorted(values: List[str], value: str):
+        position = bisect.bisect_left(values, value)
+        if position < len(values) and values[position] == value:
+            del values[position]
+
+    def _unindex_job_status(self, status: str, job_id: str):
+        job_ids = self._job_ids_by_status.get(status)
+        if job_ids is not None:
+            self._remove_sorted(job_ids, job_id)
+            if not job_ids:
+                del self._job_ids_by_status[status]
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def page_jobs(self, limit: int, cursor: Optional[str] = None,
+                  status: Optional[str] = None) -> Tuple[List[Dict], Optional[str], int]:
+        """按job_id顺序返回cursor之后的一页作业
+
+        Returns:
+            (作业列表, 下一页游标或None, 符合过滤条件的作业总数)
+        """
+        with self.lock:
+            job_ids = self._job_ids_by_status.get(status, []) if status else self._job_ids_sorted
+            start = bisect.bisect_right(job_ids, cursor) if cursor else 0
+            page_ids = job_ids[start:start + limit]
+            next_cursor = page_ids[-1] if page_ids and start + limit < len(job_ids) else None
+            return [self.jobs[job_id] for job_id in page_ids], next_cursor, len(job_ids)
+
+    def delete_job(self, job_id: str):
+        """删除作业及其所有分配和任务状态"""
+        with self.lock:
+            for allocation_id in list(self._allocs_by_job.get(job_id, ())):
+                self.delete_allocation(allocation_id)
+            self._allocs_by_job.pop(job_id, None)
+            job = self.jobs.pop(job_id, None)
+            if job is not None:
+                self._remove_sorted(self._job_ids_sorted, job_id)
+                self._unindex_job_status(job["status"], job_id)
+            self.index += 1
+
+    # ---- 分配表 ----
+
+    def upsert_allocation(self, allocation: Dict):
+        with self.lock:
+            allocation_id = allocation["allocation_id"]
+            previous = self.allocations.get(allocation_id)
+            if previous is not None:
+                self._unindex_allocation(previous)
+            self.allocations[allocation_id] = allocation
+            self._allocs_by_job.setdefault(allocation["job_id"], {})[allocation_id] = None
+            self._allocs_by_node.setdefault(allocation["node_id"], {})[allocation_id] = None
+            self._count_allocation(allocation["job_id"], allocation["status"], 1)
+            self._charge_allocation(allocation, 1)
+            self.index += 1
+
+    def _unindex_allocation(self, allocation: Dict):
+        allocation_id = allocation["allocation_id"]
+        for index, key in ((self._allocs_by_job, allocation["job_id"]), (self._allocs_by_node, allocation["node_id"])):
+            entries = index.get(key)
+            if entries is not None:
+                entries.pop(allocation_id, None)
+                if not entries:
+                    del index[key]
+        self._count_allocation(allocation["job_id"], allocation["status"], -1)
+        self._charge_allocation(allocation, -1)
+
+    def _charge_allocation(self, allocation: Dict, sign: int):
+        """把分配的资源计入(+1)或移出(-1)所在节点的台账"""
+        if allocation["status"] not in ALLOCATED_STATUSES:
+            return
+        resources = allocation.get("resources")
+        if not resources:
+            return
+        self.cluster_index += 1
+        allocated = self._allocated_by_node.setdefault(allocation["node_id"], dict.fromkeys(RESOURCE_DIMENSIONS, 0))
+        for dimension in RESOURCE_DIMENSIONS:
+            allocated[dimension] += sign * resources.get(dimension, 0)
+        if not any(allocated.values()):
+            del self._allocated_by_node[allocation["node_id"]]
+        if sign < 0:
+            self._capacity_freed(allocation["node_id"])
+
+    def _count_allocation(self, job_id: str, status: str, delta: int):
+        counts = self._alloc_status_counts.setdefault(job_id, {})
+        count = counts.get(status, 0) + delta
+        if count:
+            counts[status] = count
+        else:
+            counts.pop(status, None)
+            if not counts:
+                del self._alloc_status_counts[job_id]
+
+    def update_allocation(self, allocation_id: str, **fields):
+        """原地更新分配的非索引字段（状态、资源、时间等）"""
+        with self.lock:
+            allocation = self.allocations[allocation_id]
+            status_changed = "status" in fields and fields["status"] != allocation["status"]
+            recharge = status_changed or "resources" in fields
+            if status_changed:
+                self._count_allocation(allocation["job_id"], allocation["status"], -1)
+                self._count_allocation(allocation["job_id"], fields["status"], 1)
+            if recharge:
+                self._charge_allocation(allocation, -1)
+            allocation.update(fields)
+            if recharge:
+                self._charge_allocation(allocation, 1)
+            self.index += 1
+
+    def get_allocation(self, allocation_id: str) -> Optional[Dict]:
+        return self.allocations.get(allocation_id)
+
+    def delete_allocation(self, allocation_id: str) -> Optional[Dict]:
+        """删除分配及其任务状态，返回被删除的分配"""
+        with self.lock:
+            allocation = self.allocations.pop(allocation_id, None)
+            if allocation is not None:
+                self._unindex_allocation(allocation)
+            self.task_states.pop(allocation_id, None)
+            self.index += 1
+            return allocation
+
+    def job_allocations(self, job_id: str) -> List[Dict]:
+        with self.lock:
+            return [self.allocations[allocation_id] for allocation_id in self._allocs_by_job.get(job_id, ())]
+
+    def allocation_status_counts(self, job_id: str) -> Dict[str, int]:
+        """作业各状态的分配数量（副本）"""
+        with self.lock:
+            return dict(self._alloc_status_counts.get(job_id, {}))
+
+    def allocated_resources(self, node_id: str) -> Dict[str, int]:
+        """节点上已分配资源的合计（副本）"""
+        with self.lock:
+            return dict(self._allocated_by_node.get(node_id) or dict.fromkeys(RESOURCE_DIMENSIONS, 0))
+
+    def available_resources(self, node: Dict) -> Dict[str, int]:
+        """节点上报的资源减去台账中已分配的资源"""
+        allocated = self._allocated_by_node.get(node["node_id"])
+        if allocated is None:
+            return {dimension: node["resources"].get(dimension, 0) for dimension in RESOURCE_DIMENSIONS}
+        return {dimension: node["resources"].get(dimension, 0) - allocated[dimension] for dimension in RESOURCE_DIMENSIONS}
+
+    def node_allocations(self, node_id: str) -> List[Dict]:
+        with self.lock:
+            return [self.allocations[allocation_id] for allocation_id in self._allocs_by_node.get(node_id, ())]
+
+    # ---- 任务状态表 ----
+
+    def upsert_task_state(self, allocation_id: str, task_name: str, state: Dict):
+        with self.lock:
+            self.task_states.setdefault(allocation_id, {})[task_name] = state
+            self.index += 1
+
+    def allocation_task_states(self, allocation_id: str) -> Dict[str, Dict]:
+        return self.task_states.get(allocation_id, {})
+
+
+class WriteBehindJournal:
+    """写后日志
+
+    内存状态变更后，调用方按顺序追加对应的SQL写操作；后台线程每隔几毫秒
+    将积累的操作在一个事务中落盘，连续的相同语句合并为executemany。
+    """
+
+    def __init__(self, storage: Storage, flush_interval: float = 0.005):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self._pending: deque = deque()  # (序号, sql, 参数列表)
+        self._condition = threading.Condition()
+        self._appended_seq = 0
+        self._persisted_seq = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, sql: str, params: Sequence = ()):
+        """追加单条写操作"""
+        self.append_many(sql, [params])
+
+    def append_many(self, sql: str, rows: List[Sequence]):
+        """追加同一语句的多组参数"""
+        if not rows:
+            return
+        with self._condition:
+            self._appended_seq += 1
+            self._pending.append((self._appended_seq, sql, list(rows)))
+            self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """阻塞直到目前已追加的操作全部落盘"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            target = self._appended_seq
+            self._condition.notify_all()
+            while self._persisted_seq < target:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self):
+        """落盘剩余操作并停止后台线程"""
+        self.flush(timeout=5)
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=5)
+
+    def _take_batch(self) -> List[Tuple[int, str, List[Sequence]]]:
+        with self._condition:
+            while self._running and not self._pending:
+                self._condition.wait()
+            batch = list(self._pending)
+            self._pending.clear()
+            return batch
+
+    def _persist(self, batch: List[Tuple[int, str, List[Sequence]]]):
+        """在一个事务中执行一批写操作，连续的相同语句合并为executemany"""
+        with self.storage.transaction() as cursor:
+            sql, rows = None, []
+            for _, op_sql, op_rows in batch:
+                if op_sql != sql:
+                    if rows:
+                        cursor.executemany(sql, rows)
+                    sql, rows = op_sql, []
+                rows.extend(op_rows)
+            if rows:
+                cursor.executemany(sql, rows)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                self._persist(batch)
+            except Exception as e:
+                print(f"[WriteBehindJournal] 批量持久化 {len(batch)} 个写操作时出错，改为逐条写入: {e}")
+                for op in batch:
+                    try:
+                        self._persist([op])
+                    except Exception as op_error:
+                        print(f"[WriteBehindJournal] 丢弃无法持久化的写操作 {op[1].split()[0]}: {op_error}")
+            with self._condition:
+                self._persisted_seq = batch[-1][0]
+                self._condition.notify_all()
+            # 留出时间积累下一批写操作，实现组提交
+            time.sleep(self.flush_interval)
@@ -0,0 +1,127 @@
+from typing import Iterable, List, Optional, Sequence
+from contextlib import contextmanager
+import sqlite3
+import threading
+
+class Storage:
+    """SQLite存储层
+
+    所有访问nomad.db的组件都应通过此类进行:
+    - 每个线程复用一个长连接，避免每次操作都重新建立连接
+    - 启用WAL日志模式并调优pragma，减少fsync开销，读写互不阻塞
+    - 依赖sqlite3连接自带的预编译语句缓存(cached_statements)
+    - 通过transaction()上下文管理器统一事务边界
+    """
+
+    # 每个新连接建立后执行的pragma
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",   # WAL模式下NORMAL即可保证一致性，只在检查点时fsync
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-16000",    # 约16MB页缓存
+        "PRAGMA busy_timeout=5000",    # 写锁竞争时最多等待5秒
+    )
+
+    def __init__(self, db_path: str = "nomad.db", statement_cache_size: int = 256):
+        self.db_path = db_path
+        self.statement_cache_size = statement_cache_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []  # (线程, 连接) 列表，用于回收已退出线程的连接
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: 由transaction()显式控制BEGIN/COMMIT
+        conn = sqlite3.connect(
+            self.db_path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size
+        )
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的连接，不存在时创建"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._prune_dead_connections()
+                self._connections.append((threading.current_thread(), conn))
+        return conn
+
+    def _prune_dead_connections(self):
+        """关闭已退出线程遗留的连接（Flask每个请求可能使用不同线程）"""
+        alive = []
+        for thread, conn in self._connections:
+            if thread.is_alive():
+                alive.append((thread, conn))
+            else:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+        self._connections = alive
+
+    @contextmanager
+    def transaction(self):
+        """事务上下文管理器
+
+        正常退出时提交，出现异常时回滚并重新抛出。
+        支持嵌套使用：内层事务并入最外层事务，由最外层统一提交。
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+        if self._local.depth > 0:
+            self._local.depth += 1
+            try:
+                yield cursor
+            finally:
+                self._local.depth -= 1
+            return
+
+        cursor.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield cursor
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self._local.depth = 0
+
+    def execute(self, sql: str, params: Sequence = ()) -> sqlite3.Cursor:
+        """在独立事务中执行单条写语句"""
+        with self.transaction() as cursor:
+            cursor.execute(sql, params)
+            return cursor
+
+    def executemany(self, sql: str, rows: Iterable[Sequence]) -> sqlite3.Cursor:
+        """在独立事务中批量执行写语句"""
+        with self.transaction() as cursor:
+            cursor.executemany(sql, rows)
+            return cursor
+
+    def query(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        """执行查询并返回所有行"""
+        return self.connection().execute(sql, params).fetchall()
+
+    def query_one(self, sql: str, params: Sequence = ()) -> Optional[tuple]:
+        """执行查询并返回第一行"""
+        return self.connection().execute(sql, params).fetchone()
+
+    def close(self):
+        """关闭所有线程的连接"""
+        with self._lock:
+            for _, conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
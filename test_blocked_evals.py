@@ -0,0 +1,135 @@
+"""被阻塞评估跟踪器的测试
+
+运行: python -m pytest -q test_blocked_evals.py
+"""
+import time
+import pytest
+from allocation_executor import AllocationExecutor
+from blocked_evals import BlockedEvals
+from models import Allocation, AllocationStatus, Job, TriggerEvent
+from scheduler import Scheduler
+from scheduler_planner import SchedulerPlanner
+from testutil import NoAllocations, job_data, register_node, wait_until
+
+def _task_groups(cpu, constraints=None, count=1):
+    return job_data(cpu, count, constraints=constraints)["task_groups"]
+
+@pytest.fixture
+def node_manager(node_manager):
+    register_node(node_manager, "node-1")
+    return node_manager
+
+@pytest.fixture
+def tracker(node_manager):
+    unblocked = []
+    blocked_evals = BlockedEvals(node_manager, unblocked.extend, coalesce_interval=3600)
+    blocked_evals.unblocked = unblocked
+    yield blocked_evals
+    blocked_evals.close()
+
+def _failed_evaluation(node_manager, job_id, cpu, constraints=None, count=1, task_groups=None):
+    task_groups = task_groups or _task_groups(cpu, constraints, count)
+    planner = SchedulerPlanner(f"eval-{job_id}", TriggerEvent.JOB_SUBMIT, Job(job_id, task_groups, {}),
+                               node_manager.get_cluster_snapshot())
+    assert not planner.process(NoAllocations())["success"]
+    return planner
+
+def _occupy(node_manager, job_id, cpu):
+    allocation = Allocation(f"alloc-{job_id}", job_id, "node-1", Job(job_id, _task_groups(cpu), {}).task_groups[0])
+    allocation.status = AllocationStatus.RUNNING
+    node_manager.update_allocation(allocation)
+    return allocation.id
+
+def test_freed_capacity_unblocks_only_what_fits(node_manager, tracker):
+    allocation_id = _occupy(node_manager, "running", 800)
+    for index in range(5):
+        assert tracker.block(_failed_evaluation(node_manager, f"job-{index}", 300))
+    assert tracker.block(_failed_evaluation(node_manager, "pinned", 200, [{"attribute": "node_id", "operator": "=", "value": "node-2"}]))
+    assert tracker.check() == []
+
+    # 释放800 cpu后node-1剩余1000，只够3个300 cpu的评估，约束不满足的评估不解除
+    node_manager.delete_allocation(allocation_id, notify_agent=False)
+    unblocked = tracker.check()
+    assert [evaluation.job.id for evaluation in unblocked] == ["job-0", "job-1", "job-2"]
+    assert tracker.blocked_jobs() == ["job-3", "job-4", "pinned"]
+    # 没有新的容量变化时不会再次解除
+    assert tracker.check() == []
+
+    # node-2的500 cpu放下job-3后剩余200，job-4放不下，200 cpu的pinned可以
+    register_node(node_manager, "node-2", cpu=500)
+    assert [evaluation.job.id for evaluation in tracker.check()] == ["job-3", "pinned"]
+
+def test_unblocks_only_when_all_remaining_instances_fit(node_manager, tracker):
+    allocation_id = _occupy(node_manager, "running", 800)
+    assert tracker.block(_failed_evaluation(node_manager, "big", 300, count=4))
+    assert tracker.block(_failed_evaluation(node_manager, "small", 300))
+
+    # node-1剩余1000 cpu能放下big的一个实例，但放不下全部4个
+    node_manager.delete_allocation(allocation_id, notify_agent=False)
+    assert [evaluation.job.id for evaluation in tracker.check()] == ["small"]
+    assert tracker.blocked_jobs() == ["big"]
+
+    register_node(node_manager, "node-2", cpu=1200)
+    assert [evaluation.job.id for evaluation in tracker.check()] == ["big"]
+
+def test_unblocks_job_only_when_every_shape_fits(node_manager, tracker):
+    allocation_id = _occupy(node_manager, "running", 800)
+    task_groups = _task_groups(300) + [dict(_task_groups(600)[0], name="db")]
+    pair = _failed_evaluation(node_manager, "pair", None, task_groups=task_groups)
+    assert sorted(task_group.name for task_group in pair.blocked_task_groups) == ["db", "web"]
+    assert tracker.block(pair)
+    assert tracker.block(_failed_evaluation(node_manager, "other", 300))
+
+    # 释放的1000 cpu先扣减pair两个任务组的全部900，other放不下
+    node_manager.delete_allocation(allocation_id, notify_agent=False)
+    assert tracker.check() == [pair]
+    assert tracker.blocked_jobs() == ["other"]
+
+def test_retries_are_deduplicated_per_job(node_manager, tracker):
+    allocation_id = _occupy(node_manager, "running", 900)
+    tracker.block(_failed_evaluation(node_manager, "job-1", 500))
+    tracker.block(_failed_evaluation(node_manager, "job-1", 500))
+    assert tracker.stats["replaced"] == 1
+    node_manager.delete_allocation(allocation_id, notify_agent=False)
+    assert len(tracker.check()) == 1
+
+def test_heartbeat_with_more_free_resources_unblocks(node_manager, tracker):
+    tracker.block(_failed_evaluation(node_manager, "job-1", 1500))
+    # 上报资源减少不触发检查
+    node_manager.update_heartbeats([{"node_id": "node-1", "timestamp": time.time(), "healthy": True,
+                                     "resources": {"cpu": 900, "memory": 4096}}])
+    assert tracker.check() == []
+    node_manager.update_heartbeats([{"node_id": "node-1", "timestamp": time.time(), "healthy": True,
+                                     "resources": {"cpu": 2000, "memory": 4096}}])
+    assert [evaluation.job.id for evaluation in tracker.check()] == ["job-1"]
+
+def test_capacity_freed_before_blocking_is_not_missed(node_manager, tracker):
+    allocation_id = _occupy(node_manager, "running", 800)
+    evaluation = _failed_evaluation(node_manager, "job-1", 500)
+    # 评估失败后、进入跟踪器前容量已经释放
+    node_manager.delete_allocation(allocation_id, notify_agent=False)
+    tracker.block(evaluation)
+    assert tracker.check() == [evaluation]
+
+def test_scheduler_retries_blocked_job_when_node_joins(node_manager):
+    scheduler = Scheduler(node_manager, workers=2)
+    scheduler.blocked_evals.coalesce_interval = 0.01
+    executor = AllocationExecutor(node_manager)
+    executor.agent_communicator.send_allocation = lambda allocation: {"status": "ok"}
+    scheduler.set_executor(executor)
+    try:
+        job_id = scheduler.create_evaluation(job_data(1500)).job.id
+        assert wait_until(lambda: node_manager.get_job(job_id)["status"] == "blocked")
+        assert scheduler.blocked_evals.blocked_jobs() == [job_id]
+        metric = scheduler.blocked_placement(job_id)["alloc_metrics"]["web"]
+        assert (metric["nodes_evaluated"], metric["nodes_exhausted"], metric["placed"]) == (1, 1, 0)
+        assert metric["dimension_exhausted"] == {"cpu": 1}
+
+        register_node(node_manager, "node-2", cpu=2000)
+        assert wait_until(lambda: node_manager.get_job_allocations(job_id))
+        assert [allocation["node_id"] for allocation in node_manager.get_job_allocations(job_id)] == ["node-2"]
+        assert scheduler.blocked_evals.blocked_jobs() == []
+        assert scheduler.blocked_placement(job_id) is None
+    finally:
+        scheduler.stop()
+        executor.stop()
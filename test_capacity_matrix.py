@@ -0,0 +1,120 @@
+"""容量矩阵节点选择的测试
+
+运行: python -m pytest -q test_capacity_matrix.py
+"""
+import random
+import numpy as np
+from capacity_matrix import NodeCapacityMatrix
+from constraints import Constraint
+from metrics import AllocMetric
+from models import RESOURCE_DIMENSIONS, Job, TriggerEvent
+from scheduler_planner import SchedulerPlanner
+from testutil import NoAllocations
+
+class _LoopPlanner(SchedulerPlanner):
+    """逐节点过滤并排序的原选择方式，作为对照"""
+
+    def select_node(self, task_group, metric=None):
+        required = task_group.get_total_resources()
+        constraints = self.constraints_for(task_group)
+        feasible = [
+            node for node in self.nodes_in_evaluation
+            if node.get("healthy", False) and all(constraint.matches_node(node) for constraint in constraints)
+            and self._fits(node.get("resources", {}), required)
+        ]
+        # 按剩余资源(cpu, memory)降序排列，同值保持快照中的顺序
+        ranked = sorted(feasible, key=lambda node: tuple(node["resources"].get(dimension, 0)
+                                                         for dimension in RESOURCE_DIMENSIONS), reverse=True)
+        return ranked[0] if ranked else None
+
+def _nodes(count, seed):
+    rng = random.Random(seed)
+    return [{
+        "node_id": f"node-{i}",
+        "ip_address": f"10.0.{i // 256}.{i % 256}",
+        "resources": {"cpu": rng.choice([500, 1000, 2000]), "memory": rng.choice([1024, 2048, 4096])},
+        "healthy": rng.random() > 0.1,
+        "last_heartbeat": 0.0
+    } for i in range(count)]
+
+def _job(seed):
+    rng = random.Random(seed)
+    task_groups = []
+    for index in range(8):
+        constraints = []
+        if index % 3 == 0:
+            constraints.append({"attribute": "ip_address", "operator": "regex", "value": r"^10\.0\.[01]\."})
+        if index % 4 == 1:
+            constraints.append({"attribute": "node_id", "operator": "!=", "value": "node-3"})
+        task_groups.append({"name": f"group-{index}", "constraints": constraints, "tasks": [
+            {"name": "task", "resources": {"cpu": rng.choice([100, 400, 900]), "memory": rng.choice([128, 1024, 3000])}, "config": {}}
+        ]})
+    return Job("job-1", task_groups, {})
+
+def _placements(planner_class, nodes, job):
+    planner = planner_class("eval-1", TriggerEvent.JOB_SUBMIT, job, nodes, scoring="worst-fit")
+    result = planner.process(NoAllocations())
+    return result["success"], [(allocation.task_group.name, allocation.node_id) for allocation in result["plan"]]
+
+def test_matrix_placements_match_loop_planner():
+    for seed in range(5):
+        nodes = _nodes(300, seed)
+        job = _job(seed)
+        assert _placements(SchedulerPlanner, nodes, job) == _placements(_LoopPlanner, nodes, job)
+
+def test_select_prefers_first_node_on_ties():
+    nodes = [
+        {"node_id": "a", "resources": {"cpu": 500, "memory": 512}, "healthy": True},
+        {"node_id": "b", "resources": {"cpu": 1000, "memory": 256}, "healthy": True},
+        {"node_id": "c", "resources": {"cpu": 1000, "memory": 256}, "healthy": True},
+        {"node_id": "d", "resources": {"cpu": 2000, "memory": 4096}, "healthy": False},
+    ]
+    matrix = NodeCapacityMatrix(nodes)
+    assert matrix.select(matrix.feasible_mask({"cpu": 100, "memory": 128})) == 1
+    matrix.deduct("b", {"cpu": 600, "memory": 0})
+    assert matrix.select(matrix.feasible_mask({"cpu": 100, "memory": 128})) == 2
+    assert matrix.select(matrix.feasible_mask({"cpu": 100, "memory": 1024})) is None
+
+def test_constraint_masks_are_cached():
+    matrix = NodeCapacityMatrix(_nodes(10, 0))
+    mask = matrix.constraint_mask(Constraint("node_id", "=", "node-4"))
+    assert matrix.constraint_mask(Constraint("node_id", "=", "node-4")) is mask
+    assert np.flatnonzero(mask).tolist() == [4]
+
+def test_equality_masks_use_attribute_index():
+    nodes = _nodes(6, 0)
+    nodes[2]["rack"] = "r1"
+    nodes[3]["rack"] = "r2"
+    nodes[5]["rack"] = "r1"
+    matrix = NodeCapacityMatrix(nodes)
+    assert np.flatnonzero(matrix.constraint_mask(Constraint("rack", "=", "r1"))).tolist() == [2, 5]
+    # 缺少该属性的节点不满足"!="约束
+    assert np.flatnonzero(matrix.constraint_mask(Constraint("rack", "!=", "r1"))).tolist() == [3]
+    assert not matrix.constraint_mask(Constraint("rack", "=", "r9")).any()
+    assert list(matrix._attribute_index) == ["rack"]
+
+def test_feasible_mask_records_filtering_and_top_scores():
+    nodes = [
+        {"node_id": "a", "rack": "r1", "resources": {"cpu": 500, "memory": 512}, "healthy": True},
+        {"node_id": "b", "rack": "r2", "resources": {"cpu": 1000, "memory": 2048}, "healthy": True},
+        {"node_id": "c", "rack": "r1", "resources": {"cpu": 100, "memory": 64}, "healthy": True},
+        {"node_id": "d", "rack": "r1", "resources": {"cpu": 2000, "memory": 4096}, "healthy": False},
+        {"node_id": "e", "resources": {"cpu": 1000, "memory": 2048}, "healthy": True},
+        {"node_id": "f", "rack": "r1", "resources": {"cpu": 1000, "memory": 1024}, "healthy": True},
+    ]
+    matrix = NodeCapacityMatrix(nodes)
+    matrix.deduct("f", {"cpu": 900, "memory": 0})
+    constraints = [Constraint("rack", "!=", "r2")]
+    metric = AllocMetric("web", 1)
+    mask = matrix.feasible_mask({"cpu": 200, "memory": 128}, constraints, metric)
+    assert mask.tolist() == matrix.feasible_mask({"cpu": 200, "memory": 128}, constraints).tolist()
+    # 不健康的d不参与过滤；b和缺少rack属性的e被约束过滤；c两个维度都不足，f在覆盖层扣减后cpu不足
+    assert (metric.nodes_evaluated, metric.nodes_filtered, metric.nodes_exhausted) == (5, 2, 2)
+    assert metric.constraint_filtered == {"rack != r2": 2}
+    assert metric.dimension_exhausted == {"cpu": 2, "memory": 1}
+
+    assert matrix.select(mask, {"cpu": 200, "memory": 128}, metric=metric) == 0
+    assert [score["node_id"] for score in metric.scores] == ["a"]
+    rows = matrix.select_many(np.ones(len(nodes), dtype=bool), {"cpu": 100, "memory": 64}, 2, metric=metric)
+    assert len(metric.scores) == AllocMetric.TOP_SCORES
+    assert metric.scores[0]["node_id"] == nodes[rows[0]]["node_id"]
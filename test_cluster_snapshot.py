@@ -0,0 +1,86 @@
+"""共享集群快照与评估覆盖层的测试
+
+运行: python -m pytest -q test_cluster_snapshot.py
+"""
+import time
+import pytest
+from cluster_snapshot import ClusterSnapshot
+from models import Allocation, AllocationStatus, Job, TriggerEvent
+from scheduler_planner import SchedulerPlanner
+from testutil import NoAllocations, register_node
+
+TASK_GROUPS = [{"name": "web", "tasks": [{"name": "nginx", "resources": {"cpu": 300, "memory": 256}, "config": {}}]}]
+
+@pytest.fixture
+def node_manager(node_manager):
+    for index in range(3):
+        register_node(node_manager, f"node-{index}", memory=2048, ip_address=f"10.0.0.{index}")
+    return node_manager
+
+def _heartbeat(node_id, cpu):
+    return {"node_id": node_id, "timestamp": time.time(), "healthy": True, "resources": {"cpu": cpu, "memory": 2048}}
+
+def test_snapshot_is_shared_until_schedulable_state_changes(node_manager):
+    snapshot = node_manager.get_cluster_snapshot()
+    assert node_manager.get_cluster_snapshot() is snapshot
+    # 只刷新心跳时间不会使快照失效
+    node_manager.update_heartbeats([_heartbeat("node-1", 1000)])
+    assert node_manager.get_cluster_snapshot() is snapshot
+
+    node_manager.update_heartbeats([_heartbeat("node-1", 600)])
+    refreshed = node_manager.get_cluster_snapshot()
+    assert refreshed is not snapshot and refreshed.version > snapshot.version
+    assert refreshed.get_node("node-1")["resources"]["cpu"] == 600
+    assert snapshot.get_node("node-1")["resources"]["cpu"] == 1000
+
+def test_usage_jitter_keeps_the_snapshot(node_manager):
+    freed = []
+    node_manager.add_capacity_listener(lambda node_id, cluster_index: freed.append(node_id))
+    snapshot = node_manager.get_cluster_snapshot()
+    # 上报的使用量小幅抖动（累计也不超过节点总容量的5%）不改变调度视图
+    for cpu_used in (10, 30, 20, 45, 0):
+        node_manager.update_heartbeats([{**_heartbeat("node-1", 1000 - cpu_used),
+                                         "resources": {"cpu": 1000 - cpu_used, "memory": 2040,
+                                                       "cpu_used": cpu_used, "memory_used": 8}}])
+    assert node_manager.get_cluster_snapshot() is snapshot and freed == []
+    assert node_manager.state.get_node("node-1")["resources"]["cpu_used"] == 0
+
+    node_manager.update_heartbeats([_heartbeat("node-1", 800)])
+    assert node_manager.get_cluster_snapshot() is not snapshot
+
+def test_evaluations_only_copy_touched_nodes(node_manager):
+    snapshot = node_manager.get_cluster_snapshot()
+    job = Job("job-1", TASK_GROUPS, {})
+    first = SchedulerPlanner("eval-1", TriggerEvent.JOB_SUBMIT, job, snapshot)
+    second = SchedulerPlanner("eval-2", TriggerEvent.JOB_SUBMIT, job, snapshot)
+    first_node = first.process(NoAllocations())["plan"][0].node_id
+    second_node = second.process(NoAllocations())["plan"][0].node_id
+
+    # 两个评估各自只复制被选中的节点，快照和另一个评估看不到对方的预留
+    assert list(first._evaluation_nodes) == [first_node]
+    assert first._evaluation_nodes[first_node]["resources"]["cpu"] == 700
+    assert snapshot.get_node(first_node)["resources"]["cpu"] == 1000
+    assert first_node == second_node
+    assert snapshot.matrix.available_at(snapshot.row(first_node)).tolist() == [1000, 2048]
+
+def test_job_resource_credits_are_applied_in_the_overlay(node_manager):
+    node_manager.submit_job({"job_id": "job-1", "task_groups": TASK_GROUPS, "constraints": {}})
+    allocation = Allocation("alloc-1", "job-1", "node-2", Job("job-1", TASK_GROUPS, {}).task_groups[0])
+    allocation.status = AllocationStatus.RUNNING
+    node_manager.update_allocation(allocation)
+
+    snapshot, credits = node_manager.get_evaluation_view("job-1")
+    assert snapshot.get_node("node-2")["resources"]["cpu"] == 700
+    assert credits == {"node-2": {"cpu": 300, "memory": 256}}
+
+    planner = SchedulerPlanner("eval-1", TriggerEvent.JOB_SUBMIT, Job("job-2", TASK_GROUPS, {}), snapshot,
+                               resource_credits=credits)
+    planner.process(NoAllocations())
+    assert planner.evaluation_node("node-2")["resources"]["cpu"] == 1000
+    assert snapshot.get_node("node-2")["resources"]["cpu"] == 700
+
+def test_node_lists_are_wrapped_as_one_off_snapshots():
+    nodes = [{"node_id": "a", "resources": {"cpu": 500, "memory": 512}, "healthy": True}]
+    assert ClusterSnapshot.of(nodes).version == 0
+    snapshot = ClusterSnapshot(nodes, version=3)
+    assert ClusterSnapshot.of(snapshot) is snapshot
@@ -0,0 +1,38 @@
+"""编译约束条件的测试
+
+运行: python -m pytest -q test_constraints.py
+"""
+from constraints import Constraint, compile_constraints
+from models import Job, TriggerEvent
+from scheduler_planner import SchedulerPlanner
+from testutil import NoAllocations
+
+def test_operators():
+    assert Constraint("ip_address", "regex", r"^10\.").matches("10.0.0.1")
+    assert not Constraint("ip_address", "regex", r"^10\.").matches("192.168.0.1")
+    assert Constraint("cores", ">", 4).matches(8)
+    assert not Constraint("cores", ">", 4).matches("8")   # 非数值不参与大小比较
+    assert not Constraint("cores", "<", "4").matches(2)
+    assert Constraint("node_id", "=", 1).matches("1")
+    assert not Constraint("node_id", "!=", "a").matches(None)
+    assert Constraint("node_id", "unknown", "a").matches("b")
+
+def test_compile_skips_incomplete_and_duplicate_constraints():
+    compiled = compile_constraints(
+        [{"attribute": "node_id", "operator": "=", "value": "a"}],
+        [{"attribute": "node_id", "operator": "=", "value": "a"}, {"attribute": "node_id", "operator": "="}]
+    )
+    assert [constraint.key for constraint in compiled] == [("node_id", "=", "'a'")]
+    # 旧版本作业元数据形式不参与调度
+    assert compile_constraints({"region": "us-west"}) == []
+    assert len(compile_constraints({"attribute": "node_id", "operator": "!=", "value": "a"})) == 1
+
+def test_job_constraints_apply_to_every_task_group():
+    nodes = [{"node_id": f"node-{i}", "ip_address": f"10.0.0.{i}", "healthy": True,
+              "resources": {"cpu": 1000 + i, "memory": 2048}} for i in range(4)]
+    task_groups = [{"name": name, "tasks": [{"name": "t", "resources": {"cpu": 100, "memory": 128}, "config": {}}]}
+                   for name in ("a", "b")]
+    job = Job("job-1", task_groups, [{"attribute": "node_id", "operator": "!=", "value": "node-0"}])
+    result = SchedulerPlanner("eval-1", TriggerEvent.JOB_SUBMIT, job, nodes).process(NoAllocations())
+    assert result["success"]
+    assert [allocation.node_id for allocation in result["plan"]] == ["node-1", "node-1"]
@@ -0,0 +1,57 @@
+"""评估记录存储和分阶段耗时的测试
+
+运行: python -m pytest -q test_evaluation_store.py
+"""
+from evaluation_store import EvaluationStore
+from testutil import job_data, wait_until
+
+def _record(evaluation_id, job_id, create_time, status="pending"):
+    return {"evaluation_id": evaluation_id, "job_id": job_id, "create_time": create_time, "status": status}
+
+def test_store_evicts_oldest_and_keeps_order_on_update():
+    store = EvaluationStore(capacity=3)
+    for index in range(3):
+        store.put(_record(f"eval-{index}", "job-a" if index < 2 else "job-b", index))
+    # 更新不改变创建顺序，eval-0仍最先被淘汰
+    store.put(_record("eval-0", "job-a", 0, status="complete"))
+    store.put(_record("eval-3", "job-a", 3))
+    assert store.get("eval-0") is None
+    assert [record["evaluation_id"] for record in store.job_evaluations("job-a")] == ["eval-3", "eval-1"]
+    store.delete_job("job-a")
+    assert len(store) == 1 and store.job_evaluations("job-a") == []
+
+def test_records_survive_restart_within_capacity(node_manager, reopen):
+    node_manager.record_evaluations([_record(f"eval-{index}", "job-a", index) for index in range(5)])
+
+    node_manager = reopen(evaluation_capacity=2)
+    assert [record["evaluation_id"] for record in node_manager.get_job_evaluations("job-a")] == ["eval-4", "eval-3"]
+    assert node_manager.storage.query_one("SELECT COUNT(*) FROM evaluations")[0] == 2
+
+def test_evaluation_records_plan_and_phase_timings(cluster):
+    node_manager, scheduler, executor = cluster
+    evaluation_id = scheduler.create_evaluation(job_data(400)).id
+    assert wait_until(lambda: node_manager.get_evaluation(evaluation_id)["status"] == "complete")
+    record = node_manager.get_evaluation(evaluation_id)
+    assert record["plan"] == {"create": 1, "delete": 0, "preempt": 0, "created": 1, "rejected": 0, "preempted": 0}
+    assert set(record["timings"]) == {"queue_wait_seconds", "snapshot_seconds", "feasibility_seconds",
+                                      "ranking_seconds", "preemption_seconds", "apply_seconds"}
+    assert all(seconds >= 0 for seconds in record["timings"].values())
+    assert record["timings"]["ranking_seconds"] > 0 and record["timings"]["apply_seconds"] > 0
+    metric = record["alloc_metrics"]["web"]
+    assert (metric["instances"], metric["placed"], metric["nodes_evaluated"]) == (1, 1, 1)
+    assert [score["node_id"] for score in metric["scores"]] == ["node-1"]
+
+def test_blocked_evaluation_is_linked_to_its_retry(cluster):
+    node_manager, scheduler, executor = cluster
+    filler_evaluation = scheduler.create_evaluation(job_data(800))
+    filler = filler_evaluation.job.id
+    assert wait_until(lambda: node_manager.get_evaluation(filler_evaluation.id)["status"] == "complete")
+    blocked = scheduler.create_evaluation(job_data(500))
+    assert wait_until(lambda: node_manager.get_evaluation(blocked.id)["status"] == "blocked")
+    assert node_manager.get_evaluation(blocked.id)["blocked_task_groups"] == ["web"]
+
+    executor.stop_job(filler)
+    assert wait_until(lambda: node_manager.get_job_evaluations(blocked.job.id)[0]["status"] == "complete")
+    retry, original = node_manager.get_job_evaluations(blocked.job.id)
+    assert original["evaluation_id"] == blocked.id
+    assert retry["previous_evaluation"] == blocked.id and retry["trigger_event"] == "job_submit"
@@ -0,0 +1,156 @@
+"""心跳写入流水线的测试
+
+运行: python -m pytest -q test_heartbeat_pipeline.py
+"""
+import pytest
+from agent import NodeAgent
+from heartbeat_pipeline import HeartbeatPipeline
+from models import Allocation, AllocationStatus, Job
+from testutil import register_node
+
+@pytest.fixture
+def node_manager(node_manager):
+    for node_id in ("node-1", "node-2"):
+        register_node(node_manager, node_id, memory=2048)
+    return node_manager
+
+def _heartbeat(node_id, timestamp, cpu):
+    return {
+        "node_id": node_id,
+        "resources": {"cpu": cpu, "memory": 2048},
+        "healthy": True,
+        "timestamp": timestamp,
+        "allocations": {}
+    }
+
+def _cpu(node_manager, node_id):
+    return node_manager.state.get_node(node_id)["resources"]["cpu"]
+
+def test_latest_heartbeat_per_node_wins(node_manager):
+    pipeline = HeartbeatPipeline(node_manager, flush_interval=0.05)
+    try:
+        for heartbeat in (
+            _heartbeat("node-1", 1.0, 100),
+            _heartbeat("node-1", 3.0, 300),
+            _heartbeat("node-1", 2.0, 200),   # 乱序到达的旧心跳，直接丢弃
+            _heartbeat("node-2", 1.0, 500),
+        ):
+            assert pipeline.submit(heartbeat)
+        assert pipeline.flush(timeout=5)
+        assert _cpu(node_manager, "node-1") == 300
+        assert _cpu(node_manager, "node-2") == 500
+        assert pipeline.stats["coalesced"] >= 1
+    finally:
+        pipeline.close()
+
+def test_heartbeats_are_persisted(node_manager):
+    pipeline = HeartbeatPipeline(node_manager)
+    try:
+        pipeline.submit(_heartbeat("node-1", 10.0, 700))
+        assert pipeline.flush(timeout=5)
+    finally:
+        pipeline.close()
+    node_manager.flush()
+    row = node_manager.storage.query_one("SELECT cpu, last_heartbeat FROM nodes WHERE node_id = ?", ("node-1",))
+    assert row == (700, 10.0)
+
+def test_full_queue_rejects_new_nodes(node_manager):
+    pipeline = HeartbeatPipeline(node_manager, max_pending=1)
+    pipeline.close()
+    # 关闭后写线程不再消费，直接构造已满的待处理表
+    pipeline._running = True
+    pipeline._pending = {"node-1": _heartbeat("node-1", 1.0, 100)}
+    assert pipeline.submit(_heartbeat("node-1", 2.0, 200))
+    assert not pipeline.submit(_heartbeat("node-2", 1.0, 500))
+    assert pipeline.stats["rejected"] == 1
+
+def _task(status, message=None):
+    return {"status": status, "start_time": 1.0, "end_time": None, "message": message}
+
+def _allocation(status, **tasks):
+    return {"status": status, "start_time": 1.0, "end_time": None, "tasks": tasks}
+
+def _run_allocation(node_manager):
+    task_groups = [{"name": "web", "tasks": [
+        {"name": "nginx", "resources": {"cpu": 100, "memory": 128}, "config": {}},
+        {"name": "logger", "resources": {"cpu": 10, "memory": 16}, "config": {}}
+    ]}]
+    job_id, _ = node_manager.submit_job({"task_groups": task_groups, "constraints": {}})
+    allocation = Allocation("alloc-1", job_id, "node-1", Job(job_id, task_groups, {}).task_groups[0])
+    allocation.status = AllocationStatus.RUNNING
+    node_manager.update_allocation(allocation)
+
+def test_sequence_gap_requests_full_resync(node_manager):
+    _run_allocation(node_manager)
+    pipeline = HeartbeatPipeline(node_manager)
+    try:
+        # 服务器不知道该节点的确认序号（例如刚重启），增量心跳只更新节点信息
+        delta = dict(_heartbeat("node-1", 1.0, 400), seq=8, base_seq=7, full=False,
+                     allocations={"alloc-1": _allocation("running", nginx=_task("running", "delta"))})
+        assert pipeline.submit(delta) == {"ack_seq": None, "resync": True}
+        assert pipeline.flush(timeout=5)
+        assert _cpu(node_manager, "node-1") == 400
+        assert node_manager.state.allocation_task_states("alloc-1")["nginx"]["status"] == "pending"
+
+        full = dict(_heartbeat("node-1", 2.0, 400), seq=9, base_seq=7, full=True,
+                    allocations={"alloc-1": _allocation("running", nginx=_task("running"), logger=_task("running"))})
+        assert pipeline.submit(full) == {"ack_seq": 9, "resync": False}
+        delta = dict(_heartbeat("node-1", 3.0, 400), seq=10, base_seq=9, full=False,
+                     allocations={"alloc-1": _allocation("running", logger=_task("failed", "oom"))})
+        assert pipeline.submit(delta) == {"ack_seq": 10, "resync": False}
+        assert pipeline.flush(timeout=5)
+        tasks = node_manager.state.allocation_task_states("alloc-1")
+        assert tasks["nginx"]["status"] == "running"
+        assert tasks["logger"]["message"] == "oom"
+    finally:
+        pipeline.close()
+
+def test_failed_batch_forces_resync(node_manager, monkeypatch):
+    _run_allocation(node_manager)
+    pipeline = HeartbeatPipeline(node_manager)
+    try:
+        monkeypatch.setattr(node_manager, "update_heartbeats", lambda heartbeats: 0)
+        full = dict(_heartbeat("node-1", 1.0, 400), seq=1, base_seq=None, full=True,
+                    allocations={"alloc-1": _allocation("running", nginx=_task("running"), logger=_task("running"))})
+        assert pipeline.submit(full) == {"ack_seq": 1, "resync": False}
+        assert pipeline.flush(timeout=5)
+        monkeypatch.undo()
+
+        # 已确认的全量心跳没有应用，基于它的增量心跳不能被接受
+        delta = dict(_heartbeat("node-1", 2.0, 400), seq=2, base_seq=1, full=False,
+                     allocations={"alloc-1": _allocation("running", logger=_task("failed", "oom"))})
+        assert pipeline.submit(delta) == {"ack_seq": None, "resync": True}
+        assert pipeline.flush(timeout=5)
+        assert node_manager.state.allocation_task_states("alloc-1")["nginx"]["status"] == "pending"
+    finally:
+        pipeline.close()
+
+def test_pending_deltas_are_merged_per_task():
+    previous = {"node_id": "node-1", "timestamp": 1.0, "full": True, "allocations": {
+        "alloc-1": _allocation("running", nginx=_task("running"), logger=_task("running"))}}
+    delta = {"node_id": "node-1", "timestamp": 2.0, "full": False, "allocations": {
+        "alloc-1": _allocation("failed", logger=_task("failed")),
+        "alloc-2": _allocation("pending")}}
+    merged = HeartbeatPipeline._merge(previous, delta)
+    assert merged["full"] and merged["timestamp"] == 2.0
+    assert merged["allocations"]["alloc-1"]["status"] == "failed"
+    assert merged["allocations"]["alloc-1"]["tasks"] == {"nginx": _task("running"), "logger": _task("failed")}
+    assert set(merged["allocations"]) == {"alloc-1", "alloc-2"}
+    # 合并不修改待处理的原心跳
+    assert previous["allocations"]["alloc-1"]["tasks"]["logger"] == _task("running")
+
+def test_agent_delta_contains_only_changed_tasks():
+    acked = {
+        "alloc-1": _allocation("running", nginx=_task("running"), logger=_task("running")),
+        "alloc-2": _allocation("complete", job=_task("complete")),
+    }
+    snapshot = {
+        "alloc-1": _allocation("running", nginx=_task("running"), logger=_task("failed")),
+        "alloc-2": _allocation("complete", job=_task("complete")),
+        "alloc-3": _allocation("pending", web=_task("pending")),
+    }
+    delta = NodeAgent._allocation_delta(snapshot, acked)
+    assert delta == {
+        "alloc-1": _allocation("running", logger=_task("failed")),
+        "alloc-3": snapshot["alloc-3"],
+    }
@@ -0,0 +1,70 @@
+"""作业版本与已解析作业缓存的测试
+
+运行: python -m pytest -q test_job_cache.py
+"""
+from job_cache import JobCache
+from models import Job
+from testutil import job_data
+
+JOB_SPEC = {
+    "task_groups": [
+        {"name": "web", "tasks": [{"name": "nginx", "resources": {"cpu": 100, "memory": 128}, "config": {}}]}
+    ],
+    "constraints": {}
+}
+
+def test_version_changes_only_with_spec_content(node_manager):
+    job_id, _ = node_manager.submit_job(job_data(100))
+    first = node_manager.get_job(job_id)
+    assert first["version"] == 1
+
+    # 相同内容（键顺序不同）重复提交不改变版本
+    node_manager.submit_job({"constraints": {}, "task_groups": job_data(100)["task_groups"], "job_id": job_id})
+    assert node_manager.get_job(job_id)["version"] == 1
+
+    node_manager.submit_job(dict(job_data(200), job_id=job_id))
+    second = node_manager.get_job(job_id)
+    assert second["version"] == 2
+    assert second["spec_hash"] != first["spec_hash"]
+
+def test_parsed_job_is_cached_per_version(node_manager):
+    job_id, _ = node_manager.submit_job(job_data(100))
+    job = node_manager.get_job_model(job_id)
+    assert node_manager.get_job_model(job_id) is job
+    assert node_manager.job_cache.hits == 1
+
+    node_manager.submit_job(dict(job_data(200), job_id=job_id))
+    updated = node_manager.get_job_model(job_id)
+    assert updated is not job
+    assert updated.version == 2
+    assert updated.task_groups[0].get_total_resources()["cpu"] == 200
+
+    node_manager.clean_job_data(job_id)
+    assert node_manager.get_job_model(job_id) is None
+    assert len(node_manager.job_cache) == 0
+
+def test_version_survives_restart(node_manager, reopen):
+    job_id, _ = node_manager.submit_job(job_data(100))
+    node_manager.submit_job(dict(job_data(200), job_id=job_id))
+
+    reopened = reopen()
+    assert reopened.get_job(job_id)["version"] == 2
+    assert reopened.get_job_model(job_id).spec_hash == reopened.get_job(job_id)["spec_hash"]
+
+def test_lru_evicts_least_recently_used():
+    cache = JobCache(capacity=2)
+    loads = []
+
+    def loader(job_id):
+        def load():
+            loads.append(job_id)
+            return Job(job_id, JOB_SPEC["task_groups"], {})
+        return load
+
+    cache.get("a", 1, loader("a"))
+    cache.get("b", 1, loader("b"))
+    cache.get("a", 1, loader("a"))   # a变为最近使用
+    cache.get("c", 1, loader("c"))   # 淘汰b
+    cache.get("a", 1, loader("a"))
+    cache.get("b", 1, loader("b"))
+    assert loads == ["a", "b", "c", "b"]
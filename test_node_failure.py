@@ -0,0 +1,71 @@
+"""节点失联后重新调度丢失分配的测试
+
+运行: python -m pytest -q test_node_failure.py
+"""
+import time
+from allocation_executor import AllocationExecutor
+from metrics import NodeRecoveryMetrics
+from reschedule_queue import RescheduleQueue
+from scheduler import Scheduler
+from testutil import job_data, register_node, wait_until
+
+def test_reschedule_queue_deduplicates_and_limits_rate():
+    batches = []
+    queue = RescheduleQueue(batches.append, rate=20, burst=5)
+    try:
+        queue.add([f"job-{index}" for index in range(15)] + ["job-0", "job-1"])
+        assert queue.stats["deduplicated"] == 2
+        # 突发额度立即提交5个，其余10个按每秒20个补充的令牌提交
+        assert wait_until(lambda: queue.stats["submitted"] == 5, timeout=1)
+        started = time.monotonic()
+        assert wait_until(lambda: queue.stats["submitted"] == 15)
+        assert time.monotonic() - started >= 0.4
+        assert [job_id for batch in batches for job_id in batch] == [f"job-{index}" for index in range(15)]
+    finally:
+        queue.close()
+
+def test_recovery_metrics_records_time_to_recover():
+    metrics = NodeRecoveryMetrics()
+    metrics.node_failed("node-1", [("job-1", "web", 0), ("job-2", "web", 0)], failed_at=time.time() - 2)
+    metrics.instance_placed("job-1", "web", 0)
+    assert metrics.summary()["recovering_nodes"] == 1
+    metrics.discard_job("job-2")
+    summary = metrics.summary()
+    assert summary["recovered_nodes"] == 1 and summary["replaced_instances"] == 1
+    assert summary["recovery_seconds_last"] >= 2
+
+def test_node_failure_evaluation_replaces_only_lost_instances(node_manager):
+    register_node(node_manager, "node-1")
+    register_node(node_manager, "node-2")
+    scheduler = Scheduler(node_manager, workers=2)
+    executor = AllocationExecutor(node_manager)
+    executor.agent_communicator.send_allocation = lambda allocation: {"status": "ok"}
+    scheduler.set_executor(executor)
+    try:
+        # spread让实例分布在两个节点上
+        job_id = scheduler.create_evaluation(dict(job_data(count=4), scoring="spread")).job.id
+        assert wait_until(lambda: len(node_manager.get_job_allocations(job_id)) == 4)
+        before = {allocation["alloc_index"]: allocation for allocation in node_manager.get_job_allocations(job_id)}
+        failed_node = before[0]["node_id"]
+        healthy_node = "node-2" if failed_node == "node-1" else "node-1"
+
+        # 失联节点的心跳超时
+        node_manager.update_heartbeats([{"node_id": healthy_node, "timestamp": time.time() + 60, "healthy": True,
+                                      "resources": {"cpu": 1000, "memory": 4096}}])
+        assert node_manager.mark_unhealthy_nodes(time.time() + 30) == [failed_node]
+        lost = node_manager.mark_lost_allocations()
+        assert {allocation["alloc_index"] for allocation in lost} == \
+            {index for index, allocation in before.items() if allocation["node_id"] == failed_node}
+        scheduler.reschedule_lost(lost)
+
+        assert wait_until(lambda: scheduler.recovery_metrics.summary()["recovered_nodes"] == 1)
+        after = {allocation["alloc_index"]: allocation for allocation in node_manager.get_job_allocations(job_id)}
+        assert sorted(after) == [0, 1, 2, 3]
+        assert all(allocation["node_id"] == healthy_node for allocation in after.values())
+        # 健康节点上的实例保留原分配
+        for index, allocation in before.items():
+            if allocation["node_id"] == healthy_node:
+                assert after[index]["allocation_id"] == allocation["allocation_id"]
+    finally:
+        scheduler.stop()
+        executor.stop()
@@ -0,0 +1,69 @@
+"""抢占低优先级分配的测试
+
+运行: python -m pytest -q test_preemption.py
+"""
+import numpy as np
+from models import TriggerEvent
+from scheduler_planner import SchedulerPlanner
+from testutil import job_data, wait_until
+
+def _victim(allocation_id, priority, cpu):
+    return {"allocation_id": allocation_id, "job_id": allocation_id, "node_id": "node-1",
+            "priority": priority, "resources": {"cpu": cpu, "memory": 0}}
+
+def test_victims_prefer_lowest_priority_and_drop_redundant():
+    need = np.array([300.0, 0.0])
+    # 优先级低的分配先被选取，即使需要抢占更多个
+    victims = [_victim("a", 10, 100), _victim("b", 10, 100), _victim("c", 10, 100), _victim("d", 20, 300)]
+    assert [victim["allocation_id"] for victim in SchedulerPlanner._select_victims(need, victims)] == ["a", "b", "c"]
+    # 选到d后缺口已由d单独补齐，先选的a是多余的
+    victims = [_victim("a", 10, 100), _victim("d", 20, 300)]
+    assert [victim["allocation_id"] for victim in SchedulerPlanner._select_victims(need, victims)] == ["d"]
+    assert SchedulerPlanner._select_victims(need, [_victim("a", 10, 100)]) is None
+
+def _running(node_manager, job_id):
+    return [allocation for allocation in node_manager.get_job_allocations(job_id) if allocation["status"] == "running"]
+
+def test_high_priority_job_preempts_and_victim_is_rescheduled(cluster):
+    node_manager, scheduler, executor = cluster
+    low_job = scheduler.create_evaluation(job_data(400, priority=20, count=2)).job.id
+    assert wait_until(lambda: len(_running(node_manager, low_job)) == 2)
+
+    # 剩余200 cpu，放下500 cpu的高优先级作业只需抢占一个400 cpu的分配
+    high_job = scheduler.create_evaluation(job_data(500, priority=80)).job.id
+    assert wait_until(lambda: len(_running(node_manager, high_job)) == 1)
+    assert executor.stats["preempted"] == 1
+    # 被抢占的实例重新调度时放不下，由BlockedEvals跟踪
+    assert wait_until(lambda: scheduler.blocked_evals.blocked_jobs() == [low_job])
+    assert len(_running(node_manager, low_job)) == 1
+
+    # 高优先级作业停止后，被抢占的实例重新运行
+    executor.stop_job(high_job)
+    assert wait_until(lambda: len(_running(node_manager, low_job)) == 2)
+
+def test_jobs_within_priority_delta_are_not_preempted(cluster):
+    node_manager, scheduler, executor = cluster
+    low_job = scheduler.create_evaluation(job_data(800, priority=20)).job.id
+    assert wait_until(lambda: len(_running(node_manager, low_job)) == 1)
+    job_id = scheduler.create_evaluation(job_data(500, priority=20 + SchedulerPlanner.PREEMPTION_PRIORITY_DELTA - 1)).job.id
+    assert wait_until(lambda: node_manager.get_job(job_id)["status"] == "blocked")
+    assert executor.stats["preempted"] == 0
+
+def test_stale_plan_does_not_preempt(cluster):
+    node_manager, scheduler, executor = cluster
+    low_job = scheduler.create_evaluation(job_data(400, priority=20, count=2)).job.id
+    assert wait_until(lambda: len(_running(node_manager, low_job)) == 2)
+
+    # 高优先级作业的计划生成后、应用前作业被停止
+    node_manager.submit_job(dict(job_data(500, priority=80), job_id="high"))
+    planner = SchedulerPlanner("eval-high", TriggerEvent.JOB_SUBMIT, node_manager.get_job_model("high"),
+                               node_manager.get_cluster_snapshot())
+    result = planner.process(node_manager)
+    assert result["success"] and len(result["preemptions"]) == 1
+    executor.stop_job("high")
+
+    plan_result = executor.submit_plan(result["plan"], result["allocations_to_delete"], 80, result["preemptions"])
+    assert plan_result.wait(5)
+    assert plan_result.created == [] and plan_result.preempted == []
+    assert executor.stats["preempted"] == 0
+    assert len(_running(node_manager, low_job)) == 2
@@ -0,0 +1,57 @@
+"""作业优先级与优先级队列的测试
+
+运行: python -m pytest -q test_priority.py
+"""
+import pytest
+from eval_broker import EvalBroker
+from models import DEFAULT_JOB_PRIORITY, invalid_job_priority
+from priority_queue import AgingHeap, PriorityQueue
+
+TASK_GROUPS = [{"name": "web", "tasks": [{"name": "nginx", "resources": {"cpu": 100, "memory": 128}, "config": {}}]}]
+
+class _Evaluation:
+    def __init__(self, name, priority):
+        self.name = name
+        self.priority = priority
+
+def test_aging_lets_old_low_priority_items_overtake():
+    heap = AgingHeap(aging_rate=1.0)
+    heap.push("low", 10, enqueued_at=0)
+    heap.push("high", 90, enqueued_at=50)
+    heap.push("newest-high", 90, enqueued_at=100)
+    # t=100时的有效优先级：high为140，等待了100秒的low为110，刚入队的newest-high为90
+    assert [heap.pop()[0] for _ in range(3)] == ["high", "low", "newest-high"]
+
+def test_broker_dequeues_high_priority_ahead_of_backlog():
+    broker = EvalBroker()
+    broker.enqueue_many([(f"batch-{index}", _Evaluation(f"batch-{index}", 10)) for index in range(100)])
+    broker.enqueue("service", _Evaluation("service", 90))
+    assert broker.dequeue(timeout=1)[0] == "service"
+    # 优先级相同的评估按入队顺序
+    assert [broker.dequeue(timeout=1)[0] for _ in range(3)] == ["batch-0", "batch-1", "batch-2"]
+    bands = broker.metrics.summary()
+    assert bands["high"]["dequeued"] == 1 and bands["high"]["depth"] == 0
+    assert bands["low"]["depth"] == 97 and bands["low"]["dequeued"] == 3
+
+def test_plan_queue_drains_before_closing():
+    plans = PriorityQueue()
+    plans.put("low", 10)
+    plans.put("high", 90)
+    plans.close()
+    assert [plans.get(), plans.get(), plans.get()] == ["high", "low", None]
+
+@pytest.mark.parametrize("priority", [0, 101, 50.5, True, "high"])
+def test_invalid_priority_is_rejected(priority):
+    assert invalid_job_priority(priority)
+
+def test_priority_is_versioned_and_survives_restart(node_manager, reopen):
+    job_id, _ = node_manager.submit_job({"task_groups": TASK_GROUPS, "constraints": {}})
+    default_hash = node_manager.get_job(job_id)["spec_hash"]
+    assert node_manager.get_job_model(job_id).priority == DEFAULT_JOB_PRIORITY
+    node_manager.submit_job({"job_id": job_id, "task_groups": TASK_GROUPS, "constraints": {}, "priority": 80})
+    job = node_manager.get_job(job_id)
+    assert job["version"] == 2 and job["spec_hash"] != default_hash
+
+    node_manager = reopen()
+    assert node_manager.get_job(job_id)["priority"] == 80
+    assert node_manager.get_job_model(job_id).priority == 80
@@ -0,0 +1,84 @@
+"""数据库迁移与热点查询计划的回归测试
+
+运行: python -m pytest -q test_query_plans.py
+"""
+import sqlite3
+import pytest
+from evaluation_store import EvaluationStore
+from node_manager import (NodeManager, NODE_HEARTBEAT_SQL, ALLOCATION_HEARTBEAT_SQL, NODE_UNHEALTHY_SQL,
+                          ALLOCATION_LOST_SQL, TASK_STATUS_LOST_SQL, TASK_STATUS_DELETE_SQL, ALLOCATION_DELETE_SQL,
+                          JOB_ALLOCATIONS_DELETE_SQL)
+
+# 内存状态存储接管读取后，数据库只在写后日志中执行写入；热点路径上的写入语句直接取自代码，
+# 都不允许出现全表扫描(SCAN)
+HOT_QUERIES = [
+    ("node_heartbeat", NODE_HEARTBEAT_SQL),
+    ("allocation_heartbeat", ALLOCATION_HEARTBEAT_SQL),
+    ("node_unhealthy", NODE_UNHEALTHY_SQL),
+    ("allocation_lost", ALLOCATION_LOST_SQL),
+    ("task_status_lost", TASK_STATUS_LOST_SQL),
+    ("task_status_delete", TASK_STATUS_DELETE_SQL),
+    ("allocation_delete", ALLOCATION_DELETE_SQL),
+    ("job_allocations_delete", JOB_ALLOCATIONS_DELETE_SQL),
+    ("evaluation_delete", EvaluationStore.DELETE_SQL),
+    ("job_evaluations_delete", EvaluationStore.DELETE_JOB_SQL),
+]
+
+# 旧版本(无迁移机制)创建的表结构
+LEGACY_SCHEMA = [
+    "CREATE TABLE nodes (node_id TEXT PRIMARY KEY, ip_address TEXT, resources TEXT, healthy INTEGER, last_heartbeat REAL)",
+    "CREATE TABLE jobs (job_id TEXT PRIMARY KEY, task_groups TEXT, constraints TEXT, status TEXT)",
+    "CREATE TABLE allocations (allocation_id TEXT PRIMARY KEY, job_id TEXT, node_id TEXT, task_group TEXT, "
+    "status TEXT, start_time REAL, end_time REAL, last_update REAL)",
+    "CREATE TABLE task_status (allocation_id TEXT, task_name TEXT, resources TEXT, config TEXT, status TEXT, "
+    "start_time REAL, end_time REAL, error TEXT, exit_code INTEGER, last_update REAL, message TEXT, "
+    "PRIMARY KEY (allocation_id, task_name))",
+]
+
+def _query_plan(node_manager, sql):
+    rows = node_manager.storage.query(f"EXPLAIN QUERY PLAN {sql}", (None,) * sql.count("?"))
+    return [row[-1] for row in rows]
+
+@pytest.mark.parametrize("name,sql", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_queries_do_not_scan(node_manager, name, sql):
+    plan = _query_plan(node_manager, sql)
+    assert plan, f"{name}: 查询计划为空"
+    scans = [step for step in plan if step.startswith("SCAN")]
+    assert not scans, f"{name} 出现全表扫描: {plan}"
+
+def test_fresh_database_is_at_latest_version(node_manager):
+    latest = NodeManager.SCHEMA_MIGRATIONS[-1][0]
+    assert node_manager.schema_version == latest
+
+def test_legacy_database_is_upgraded_in_place(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(db_path)
+    for statement in LEGACY_SCHEMA:
+        conn.execute(statement)
+    conn.execute("INSERT INTO jobs VALUES ('job-1', '[]', '{}', 'running')")
+    conn.execute("INSERT INTO nodes VALUES ('node-1', '10.0.0.1', '{\"cpu\": 800, \"memory\": 1024, \"cpu_used\": 200}', 1, 0)")
+    conn.execute("INSERT INTO allocations VALUES ('alloc-1', 'job-1', 'node-1', 'web', 'running', 0, NULL, 0)")
+    conn.execute("INSERT INTO task_status VALUES ('alloc-1', 'nginx', '{\"cpu\": 100, \"memory\": 64}', '{}', "
+                 "'running', 0, NULL, NULL, NULL, 0, NULL)")
+    conn.execute("INSERT INTO task_status VALUES ('alloc-1', 'broken', 'not json', NULL, 'running', 0, NULL, NULL, NULL, 0, NULL)")
+    conn.commit()
+    conn.close()
+
+    manager = NodeManager(db_path)
+    try:
+        assert manager.schema_version == NodeManager.SCHEMA_MIGRATIONS[-1][0]
+        assert manager.get_job("job-1")["status"] == "running"
+        # JSON资源列被拆分为数值列
+        assert manager.storage.query_one("SELECT cpu, memory, cpu_used, memory_used FROM nodes") == (800, 1024, 200, 0)
+        assert manager.get_healthy_nodes()[0]["resources"] == {"cpu": 800, "memory": 1024, "cpu_used": 200, "memory_used": 0}
+        tasks = manager.state.allocation_task_states("alloc-1")
+        assert tasks["nginx"]["resources"] == {"cpu": 100, "memory": 64}
+        assert tasks["broken"]["resources"] == {"cpu": 0, "memory": 0}
+        indexes = {row[0] for row in manager.storage.query("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert "idx_allocations_job" in indexes
+        assert not {"idx_allocations_node", "idx_nodes_health"} & indexes
+    finally:
+        manager.storage.close()
+
+def test_migrations_are_idempotent(node_manager, reopen):
+    assert reopen().schema_version == NodeManager.SCHEMA_MIGRATIONS[-1][0]
@@ -0,0 +1,174 @@
+"""调度器评估队列与工作线程的测试
+
+运行: python -m pytest -q test_scheduler.py
+"""
+import threading
+import time
+import pytest
+from allocation_executor import AllocationExecutor, PlanResult
+from eval_broker import EvalBroker
+from models import TriggerEvent
+from node_manager import NodeManager
+from scheduler import Scheduler
+from scheduler_planner import SchedulerPlanner
+from testutil import job_data, register_node
+
+JOB_SPEC = {
+    "task_groups": [
+        {"name": "web", "tasks": [{"name": "nginx", "resources": {"cpu": 100, "memory": 128}, "config": {}}]}
+    ],
+    "constraints": {}
+}
+
+class _RecordingExecutor:
+    """记录提交的计划并立即标记为已应用"""
+
+    def __init__(self):
+        self.plans = []
+        self.submitted = threading.Event()
+
+    def submit_plan(self, plan, allocations_to_delete=None, priority=None, preemptions=None):
+        self.plans.append((time.perf_counter(), plan))
+        self.submitted.set()
+        result = PlanResult()
+        result.created = list(plan)
+        result.set_done()
+        return result
+
+@pytest.fixture
+def node_manager(node_manager):
+    register_node(node_manager, "node-1", memory=2048)
+    return node_manager
+
+def test_submit_to_plan_latency_is_milliseconds(node_manager):
+    scheduler = Scheduler(node_manager, workers=2)
+    executor = _RecordingExecutor()
+    scheduler.set_executor(executor)
+    try:
+        start = time.perf_counter()
+        assert scheduler.create_evaluation(dict(JOB_SPEC)) is not None
+        assert executor.submitted.wait(timeout=2)
+        assert executor.plans[0][0] - start < 0.5
+        assert len(executor.plans[0][1]) == 1
+    finally:
+        scheduler.stop()
+
+def test_broker_serializes_evaluations_per_job():
+    broker = EvalBroker()
+    broker.enqueue("job-a", "a1")
+    broker.enqueue("job-a", "a2")
+    broker.enqueue("job-b", "b1")
+
+    assert broker.dequeue(timeout=1) == ("job-a", "a1")
+    # a2需等待a1被ack，其他作业的评估不受影响
+    assert broker.dequeue(timeout=1) == ("job-b", "b1")
+    assert broker.dequeue(timeout=0.01) is None
+    broker.ack("job-a")
+    assert broker.dequeue(timeout=1) == ("job-a", "a2")
+    assert broker.stats["serialized"] == 1
+
+def test_dequeue_wakes_on_enqueue_and_close():
+    broker = EvalBroker()
+    results = []
+    worker = threading.Thread(target=lambda: results.append(broker.dequeue()))
+    worker.start()
+    broker.enqueue("job-a", "a1")
+    worker.join(timeout=1)
+    assert results == [("job-a", "a1")]
+
+    worker = threading.Thread(target=lambda: results.append(broker.dequeue()))
+    worker.start()
+    broker.close()
+    worker.join(timeout=1)
+    assert results[-1] is None
+
+def _executor(node_manager):
+    executor = AllocationExecutor(node_manager)
+    executor.agent_communicator.send_allocation = lambda allocation: {"status": "ok"}
+    return executor
+
+def _wait_idle(scheduler, executor, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if not scheduler.eval_broker.ready_count() and not scheduler.eval_broker.inflight_count() \
+                and executor.plan_queue.empty():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_applier_rejects_plans_from_stale_snapshots(node_manager):
+    executor = _executor(node_manager)
+    try:
+        snapshot = node_manager.get_cluster_snapshot()
+        plans = []
+        for _ in range(2):
+            job_id, _ = node_manager.submit_job(job_data(600))
+            planner = SchedulerPlanner(job_id, TriggerEvent.JOB_SUBMIT, node_manager.get_job_model(job_id), snapshot)
+            plans.append(planner.process(node_manager)["plan"])
+        # 两个计划都基于同一快照选择了node-1，只有先应用的一个能通过复核
+        first, second = (executor.submit_plan(plan) for plan in plans)
+        assert first.wait(5) and second.wait(5)
+        assert len(first.created) == 1 and not first.rejected
+        assert not second.created and len(second.rejected) == 1
+        assert node_manager.state.allocated_resources("node-1")["cpu"] == 600
+    finally:
+        executor.stop()
+
+def test_parallel_workers_never_double_book(node_manager):
+    scheduler = Scheduler(node_manager, workers=4)
+    executor = _executor(node_manager)
+    scheduler.set_executor(executor)
+    try:
+        for _ in range(6):
+            scheduler.create_evaluation(job_data(300))
+        assert _wait_idle(scheduler, executor)
+        assert node_manager.state.allocated_resources("node-1")["cpu"] == 900
+        running = [job for job in node_manager.get_all_jobs() if job["status"] == "running"]
+        assert len(running) == 3
+    finally:
+        scheduler.stop()
+        executor.stop()
+
+def test_enqueue_many_keeps_per_job_order():
+    broker = EvalBroker()
+    broker.enqueue_many([("job-a", "a1"), ("job-b", "b1"), ("job-a", "a2")])
+    assert broker.dequeue(timeout=1) == ("job-a", "a1")
+    assert broker.dequeue(timeout=1) == ("job-b", "b1")
+    assert broker.dequeue(timeout=0.01) is None
+    broker.ack("job-a")
+    assert broker.dequeue(timeout=1) == ("job-a", "a2")
+
+def test_batch_submission_shares_one_write_and_snapshot(node_manager):
+    scheduler = Scheduler(node_manager, workers=2)
+    executor = _executor(node_manager)
+    appended = []
+    append_many = node_manager.journal.append_many
+    node_manager.journal.append_many = lambda sql, rows: appended.append(len(rows)) or append_many(sql, rows)
+    try:
+        # 尚未设置分配执行器，工作线程取出评估后直接跳过，不会替换评估的快照
+        evaluations = scheduler.create_evaluations([job_data(100) for _ in range(5)])
+        # 作业和评估记录各为一条写操作
+        assert appended[:2] == [5, 5]
+        assert len({evaluation.job.id for evaluation in evaluations}) == 5
+        assert len({id(evaluation.original_nodes_snapshot) for evaluation in evaluations}) == 1
+        assert _wait_idle(scheduler, executor)
+
+        scheduler.set_executor(executor)
+        assert all(scheduler.create_evaluations([job_data(200) for _ in range(3)]))
+        assert _wait_idle(scheduler, executor)
+        assert node_manager.state.allocated_resources("node-1")["cpu"] == 600
+    finally:
+        scheduler.stop()
+        executor.stop()
+
+def test_batch_without_healthy_nodes_saves_no_jobs(tmp_path):
+    node_manager = NodeManager(str(tmp_path / "nomad.db"))
+    scheduler = Scheduler(node_manager, workers=1)
+    try:
+        # 结果为错误的作业不能已被保存，否则客户端无法得知其ID
+        assert scheduler.create_evaluations([job_data(100) for _ in range(3)]) == [None] * 3
+        assert node_manager.get_all_jobs() == []
+    finally:
+        scheduler.stop()
+        node_manager.journal.close()
+        node_manager.storage.close()
@@ -0,0 +1,69 @@
+"""节点评分插件与任务组放置顺序的测试
+
+运行: python -m pytest -q test_scoring.py
+"""
+import numpy as np
+import pytest
+from capacity_matrix import NodeCapacityMatrix
+from models import Job, TriggerEvent
+from scheduler_planner import SchedulerPlanner
+from scoring import BinPackScorer, SpreadScorer, WeightedScorer, make_scorer
+from testutil import NoAllocations
+
+def _node(node_id, cpu, memory):
+    return {"node_id": node_id, "resources": {"cpu": cpu, "memory": memory},
+            "capacity": {"cpu": 4000, "memory": 8192}, "healthy": True}
+
+NODES = [_node("empty", 4000, 8192), _node("half", 2000, 4096), _node("full", 600, 1024)]
+REQUIRED = {"cpu": 500, "memory": 512}
+
+def _select(scorer):
+    matrix = NodeCapacityMatrix(NODES)
+    return NODES[matrix.select(matrix.feasible_mask(REQUIRED), REQUIRED, scorer)]["node_id"]
+
+def test_binpack_prefers_fullest_node_and_spread_the_emptiest():
+    assert _select(BinPackScorer()) == "full"
+    assert _select(SpreadScorer()) == "empty"
+    assert _select(make_scorer()) == "full"
+
+def test_binpack_scores_are_normalized():
+    free_after = np.array([[0.0, 0.0], [4000.0, 8192.0]])
+    capacity = np.array([[4000.0, 8192.0], [4000.0, 8192.0]])
+    assert BinPackScorer().score(free_after, capacity).tolist() == [1.0, 0.0]
+    assert SpreadScorer().score(free_after, capacity).tolist() == [0.0, 1.0]
+
+def test_weighted_combination():
+    scorer = make_scorer({"binpack": 1, "spread": 3})
+    assert isinstance(scorer, WeightedScorer)
+    assert _select(scorer) == "empty"
+    assert _select(make_scorer({"binpack": 3, "spread": 1})) == "full"
+
+@pytest.mark.parametrize("scoring", ["best-fit", {"binpack": 1, "unknown": 1}, {"binpack": 0, "spread": 0}])
+def test_invalid_scoring_is_rejected(scoring):
+    with pytest.raises(ValueError):
+        make_scorer(scoring)
+
+def test_groups_are_placed_first_fit_decreasing():
+    task_groups = [
+        {"name": name, "tasks": [{"name": "task", "resources": {"cpu": cpu, "memory": memory}, "config": {}}]}
+        for name, cpu, memory in (("small", 100, 128), ("large", 1000, 512), ("wide", 200, 4096))
+    ]
+    planner = SchedulerPlanner("eval-1", TriggerEvent.JOB_SUBMIT, Job("job-1", task_groups, {}), NODES)
+    result = planner.process(NoAllocations())
+    assert result["success"]
+    assert [task_group.name for task_group in planner._placement_order()] == ["wide", "large", "small"]
+    assert [allocation.task_group.name for allocation in result["plan"]] == ["wide", "large", "small"]
+
+def test_job_scoring_overrides_cluster_default_and_survives_restart(node_manager, reopen):
+    task_groups = [{"name": "web", "tasks": [{"name": "nginx", "resources": REQUIRED, "config": {}}]}]
+    spread_job_id, _ = node_manager.submit_job({"task_groups": task_groups, "constraints": {}, "scoring": "spread"})
+    default_job_id, _ = node_manager.submit_job({"task_groups": task_groups, "constraints": {}})
+    assert node_manager.get_job(default_job_id)["spec_hash"] != node_manager.get_job(spread_job_id)["spec_hash"]
+
+    node_manager = reopen()
+    job = node_manager.get_job_model(spread_job_id)
+    assert job.scoring == "spread"
+    planner = SchedulerPlanner("eval-1", TriggerEvent.JOB_SUBMIT, job, NODES, scoring="binpack")
+    assert planner.process(NoAllocations())["plan"][0].node_id == "empty"
+    planner = SchedulerPlanner("eval-2", TriggerEvent.JOB_SUBMIT, node_manager.get_job_model(default_job_id), NODES, scoring="binpack")
+    assert planner.process(NoAllocations())["plan"][0].node_id == "full"
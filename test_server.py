@@ -0,0 +1,42 @@
+"""服务器API的测试
+
+运行: python -m pytest -q test_server.py
+"""
+import os
+import pytest
+from testutil import job_data, wait_until
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    cwd = os.getcwd()
+    # server在当前目录创建nomad.db，各线程的数据库连接按相对路径打开，测试期间保持在临时目录
+    os.chdir(tmp_path_factory.mktemp("server"))
+    try:
+        import server
+    except Exception:
+        os.chdir(cwd)
+        raise
+    communicator = server.allocation_executor.agent_communicator
+    communicator.send_allocation = lambda allocation: {"status": "ok"}
+    communicator.stop_allocation = lambda node_id, allocation_id: True
+    server.node_manager.register_node({"node_id": "node-1", "ip_address": "10.0.0.1",
+                                       "resources": {"cpu": 1000, "memory": 4096}, "healthy": True})
+    yield server
+    server.scheduler.stop()
+    server.allocation_executor.stop()
+    server.node_manager.journal.close()
+    server.node_manager.storage.close()
+    os.chdir(cwd)
+
+def test_restart_keeps_job_spec(server):
+    client = server.app.test_client()
+    job_id = client.post("/jobs", json=dict(job_data(), scoring="spread", priority=70)).get_json()["job_id"]
+    assert wait_until(lambda: client.get(f"/jobs/{job_id}").get_json()["status"] == "running")
+    before = client.get(f"/jobs/{job_id}").get_json()
+
+    assert client.delete(f"/jobs/{job_id}").status_code == 200
+    assert client.get(f"/jobs/{job_id}").get_json()["status"] == "dead"
+    assert client.post(f"/jobs/{job_id}/restart").status_code == 200
+    assert wait_until(lambda: client.get(f"/jobs/{job_id}").get_json()["status"] == "running")
+    after = client.get(f"/jobs/{job_id}").get_json()
+    assert (after["scoring"], after["priority"], after["version"]) == ("spread", 70, before["version"])
@@ -0,0 +1,57 @@
+"""离线调度模拟器的测试
+
+运行: python -m pytest -q test_simulator.py
+"""
+import json
+from simulator import SimulatedNodeManager, build_nodes, generate_trace, simulate
+
+def _spec(cpu, count=1, constraints=None):
+    return {"task_groups": [{"name": "web", "count": count,
+                             "tasks": [{"name": "task", "resources": {"cpu": cpu, "memory": 128}, "config": {}}]}],
+            "constraints": constraints or {}}
+
+def test_trace_is_reproducible_and_targets_live_jobs():
+    trace = generate_trace(200, update_ratio=0.2, stop_ratio=0.2, seed=3, racks=4, classes=["compute"])
+    assert trace == generate_trace(200, update_ratio=0.2, stop_ratio=0.2, seed=3, racks=4, classes=["compute"])
+    live = set()
+    for event in trace:
+        if event["op"] == "submit":
+            live.add(event["job"])
+        else:
+            assert event["job"] in live
+            if event["op"] == "stop":
+                live.remove(event["job"])
+    assert sum(event["op"] == "submit" for event in trace) == 200
+
+def test_node_attributes_are_visible_to_constraints(tmp_path):
+    node_manager = SimulatedNodeManager(str(tmp_path / "nomad.db"))
+    try:
+        for node in build_nodes(4, cpu=1000, memory=4096, racks=2, classes=["compute", "memory"]):
+            node_manager.register_node(node)
+        nodes = {node["node_id"]: node for node in node_manager.get_cluster_snapshot().nodes}
+        assert nodes["node-3"]["rack"] == "rack-1" and nodes["node-3"]["class"] == "memory"
+    finally:
+        node_manager.journal.close()
+        node_manager.storage.close()
+
+def test_simulation_reports_throughput_utilization_and_failures():
+    nodes = build_nodes(2, cpu=1000, memory=4096, racks=1, classes=["compute"])
+    trace = [
+        {"op": "submit", "job": "web", "spec": _spec(400, count=2)},
+        {"op": "submit", "job": "gpu", "spec": _spec(100, constraints=[{"attribute": "class", "operator": "=", "value": "gpu"}])},
+        {"op": "submit", "job": "batch", "spec": _spec(300)},
+        {"op": "update", "job": "web", "spec": _spec(400, count=3)},
+        {"op": "stop", "job": "batch"}
+    ]
+    result = simulate(nodes, trace, workers=2)
+    json.dumps(result)
+    assert result["completed"] and result["events"] == {"submit": 3, "update": 1, "stop": 1}
+    assert result["evaluations"] >= 4 and result["evals_per_sec"] > 0
+    assert result["eval_latency_ms"]["p99"] >= result["eval_latency_ms"]["p50"] > 0
+    # web的3个实例共1200 cpu，batch已停止
+    assert result["utilization"]["cpu"] == 0.6
+    assert result["allocations"]["running"] == 3
+    # 没有class为gpu的节点
+    assert result["placement_failures"]["failed_evaluations"] == 1
+    assert result["placement_failures"]["blocked_jobs"] == 1
+    assert result["job_statuses"] == {"running": 1, "blocked": 1, "dead": 1}
@@ -0,0 +1,188 @@
+"""内存状态存储与写后日志的测试
+
+运行: python -m pytest -q test_state_store.py
+"""
+import time
+import pytest
+from models import Job, JobStatus, Allocation, AllocationStatus, derive_job_status
+from testutil import register_node
+
+JOB_SPEC = {
+    "task_groups": [
+        {"name": "web", "tasks": [{"name": "nginx", "resources": {"cpu": 100, "memory": 128}, "config": {}}]}
+    ],
+    "constraints": {}
+}
+
+def _run_allocation(node_manager, job_id, node_id="node-1"):
+    job = Job(job_id, JOB_SPEC["task_groups"], {})
+    allocation = Allocation("alloc-1", job_id, node_id, job.task_groups[0])
+    allocation.status = AllocationStatus.RUNNING
+    node_manager.update_allocation(allocation)
+    return allocation
+
+def test_reads_are_served_from_memory_and_copied(node_manager):
+    register_node(node_manager, "node-1", memory=2048)
+    job_id, _ = node_manager.submit_job(dict(JOB_SPEC))
+    _run_allocation(node_manager, job_id)
+
+    assert node_manager.get_job(job_id)["status"] == "running"
+    assert node_manager.get_job_allocations(job_id)[0]["node_id"] == "node-1"
+
+    nodes = node_manager.get_all_nodes()
+    nodes[0]["allocations"] = []
+    nodes[0]["resources"]["cpu"] = 0
+    assert "allocations" not in node_manager.get_all_nodes()[0]
+    assert node_manager.get_healthy_nodes()[0]["resources"]["cpu"] == 1000
+
+def test_state_is_rebuilt_from_disk(node_manager, reopen):
+    register_node(node_manager, "node-1", memory=2048)
+    job_id, _ = node_manager.submit_job(dict(JOB_SPEC))
+    _run_allocation(node_manager, job_id)
+    node_manager.update_heartbeat({
+        "node_id": "node-1",
+        "resources": {"cpu": 900, "memory": 1024},
+        "healthy": True,
+        "timestamp": time.time(),
+        "allocations": {
+            "alloc-1": {
+                "status": "running", "start_time": 1.0, "end_time": None,
+                "tasks": {"nginx": {"status": "running", "start_time": 1.0, "end_time": None, "message": "ok"}}
+            }
+        }
+    })
+
+    reopened = reopen()
+    job = reopened.get_all_jobs()[0]
+    assert job["job_id"] == job_id
+    assert job["status"] == "running"
+    assert job["allocations"][0]["tasks"]["nginx"]["message"] == "ok"
+    assert reopened.get_healthy_nodes()[0]["resources"]["cpu"] == 900
+
+def test_deletes_are_persisted(node_manager, reopen):
+    register_node(node_manager, "node-1", memory=2048)
+    job_id, _ = node_manager.submit_job(dict(JOB_SPEC))
+    _run_allocation(node_manager, job_id)
+    assert node_manager.clean_job_data(job_id)
+
+    reopened = reopen()
+    assert reopened.get_job(job_id) is None
+    assert reopened.get_node_allocations("node-1") == []
+
+def test_lost_allocations_on_unhealthy_nodes(node_manager):
+    register_node(node_manager, "node-1", memory=2048)
+    job_id, _ = node_manager.submit_job(dict(JOB_SPEC))
+    _run_allocation(node_manager, job_id)
+
+    assert node_manager.mark_unhealthy_nodes(time.time() + 1) == ["node-1"]
+    lost = node_manager.mark_lost_allocations()
+    assert [alloc["allocation_id"] for alloc in lost] == ["alloc-1"]
+    assert node_manager.get_allocation_status_counts(job_id) == {"lost": 1}
+    assert node_manager.update_job_status(job_id)
+    assert node_manager.get_job(job_id)["status"] == "lost"
+    assert node_manager.get_healthy_nodes() == []
+
+def test_list_jobs_pages_by_cursor(node_manager):
+    job_ids = sorted(node_manager.submit_job(dict(JOB_SPEC))[0] for _ in range(5))
+    node_manager.set_job_status(job_ids[1], "blocked")
+
+    seen, cursor = [], None
+    while True:
+        jobs, cursor, total = node_manager.list_jobs(limit=2, cursor=cursor)
+        assert total == 5
+        seen.extend(job["job_id"] for job in jobs)
+        if cursor is None:
+            break
+    assert seen == job_ids
+
+    jobs, cursor, total = node_manager.list_jobs(limit=10, status="blocked")
+    assert [job["job_id"] for job in jobs] == [job_ids[1]] and cursor is None and total == 1
+
+    # 翻页期间删除游标之前的作业不影响后续页
+    first_page, cursor, _ = node_manager.list_jobs(limit=2)
+    node_manager.delete_job(job_ids[0])
+    jobs, _, _ = node_manager.list_jobs(limit=10, cursor=cursor)
+    assert [job["job_id"] for job in jobs] == job_ids[2:]
+
+def test_allocation_status_counts_follow_transitions(node_manager):
+    register_node(node_manager, "node-1", memory=2048)
+    job_id, _ = node_manager.submit_job(dict(JOB_SPEC))
+    _run_allocation(node_manager, job_id)
+    job = Job(job_id, JOB_SPEC["task_groups"], {})
+    second = Allocation("alloc-2", job_id, "node-1", job.task_groups[0])
+    second.status = AllocationStatus.RUNNING
+    node_manager.update_allocation(second)
+    assert node_manager.get_allocation_status_counts(job_id) == {"running": 2}
+
+    # 心跳带来的状态变化同样经状态机推导作业状态
+    node_manager.update_heartbeat({
+        "node_id": "node-1", "resources": {"cpu": 1000, "memory": 2048}, "healthy": True,
+        "timestamp": time.time(),
+        "allocations": {"alloc-2": {"status": "failed", "start_time": 1.0, "end_time": 2.0, "tasks": {}}}
+    })
+    assert node_manager.get_allocation_status_counts(job_id) == {"running": 1, "failed": 1}
+    assert node_manager.get_job(job_id)["status"] == "degraded"
+
+    node_manager.delete_allocation("alloc-1", notify_agent=False)
+    assert node_manager.get_allocation_status_counts(job_id) == {"failed": 1}
+    assert node_manager.update_job_status(job_id)
+    assert node_manager.get_job(job_id)["status"] == "failed"
+
+@pytest.mark.parametrize("counts, expected", [
+    ({}, None),
+    ({"running": 2}, JobStatus.RUNNING),
+    ({"running": 1, "lost": 1}, JobStatus.DEGRADED),
+    ({"pending": 1, "complete": 1}, JobStatus.PENDING),
+    ({"complete": 1, "stopped": 1}, JobStatus.COMPLETE),
+    ({"complete": 1, "lost": 1}, JobStatus.LOST),
+    ({"failed": 1, "lost": 1}, JobStatus.FAILED),
+])
+def test_derive_job_status(counts, expected):
+    assert derive_job_status(counts, lambda: True) == expected
+
+def test_all_pending_job_checks_capacity_lazily():
+    calls = []
+    def has_capacity():
+        calls.append(True)
+        return False
+    assert derive_job_status({"running": 1}, has_capacity) == JobStatus.RUNNING
+    assert calls == []
+    assert derive_job_status({"pending": 3}, has_capacity) == JobStatus.BLOCKED
+    assert calls == [True]
+
+def test_allocated_ledger_tracks_create_stop_and_loss(node_manager, reopen):
+    register_node(node_manager, "node-1", memory=2048)
+    job_id, _ = node_manager.submit_job(dict(JOB_SPEC))
+    _run_allocation(node_manager, job_id)
+    assert node_manager.state.allocated_resources("node-1") == {"cpu": 100, "memory": 128}
+    node_manager.flush()
+
+    # 重启后由任务资源重建台账
+    node_manager = reopen()
+    assert node_manager.state.allocated_resources("node-1") == {"cpu": 100, "memory": 128}
+
+    node_manager.mark_unhealthy_nodes(time.time() + 1)
+    node_manager.mark_lost_allocations()
+    assert node_manager.state.allocated_resources("node-1") == {"cpu": 0, "memory": 0}
+
+    _run_allocation(node_manager, job_id)
+    node_manager.delete_allocation("alloc-1", notify_agent=False)
+    assert node_manager.state.allocated_resources("node-1") == {"cpu": 0, "memory": 0}
+
+def test_explain_job_fit_reports_blocking_dimension(node_manager):
+    register_node(node_manager, "node-1", memory=2048)
+    register_node(node_manager, "node-2", memory=2048)
+    job_id, _ = node_manager.submit_job({
+        "task_groups": [
+            {"name": "small", "tasks": [{"name": "a", "resources": {"cpu": 100, "memory": 128}, "config": {}}]},
+            {"name": "big", "tasks": [{"name": "b", "resources": {"cpu": 100, "memory": 4096}, "config": {}}]}
+        ],
+        "constraints": {}
+    })
+    report = node_manager.explain_job_fit(job_id)
+    assert report["small"]["fits"] and report["small"]["blocked_by"] == []
+    assert not report["big"]["fits"]
+    assert report["big"]["blocked_by"] == ["memory"]
+    assert report["big"]["dimension_exhausted"] == {"memory": 2}
+    assert not node_manager._has_sufficient_resources(job_id)
+    assert node_manager.explain_job_fit("missing") is None
@@ -0,0 +1,124 @@
+"""任务组多实例(count)放置与差异调整的测试
+
+运行: python -m pytest -q test_task_group_count.py
+"""
+import random
+import time
+import pytest
+from capacity_matrix import NodeCapacityMatrix
+from models import AllocationStatus, Job, TriggerEvent, invalid_task_group_count
+from scheduler_planner import SchedulerPlanner
+from scoring import make_scorer
+from testutil import NoAllocations, job_data, register_node, wait_until
+
+def _group(count, cpu=100, command="sleep 1"):
+    return {"name": "web", "count": count,
+            "tasks": [{"name": "task", "resources": {"cpu": cpu, "memory": 128}, "config": {"command": command}}]}
+
+@pytest.fixture
+def node_manager(node_manager):
+    for index in range(4):
+        register_node(node_manager, f"node-{index}", ip_address=f"10.0.0.{index}")
+    return node_manager
+
+def _evaluate(node_manager, job_id, task_groups):
+    """提交作业并生成计划，删除和新分配直接写入状态（不经过Agent）"""
+    existing_job = node_manager.get_job(job_id)
+    node_manager.submit_job({"job_id": job_id, "task_groups": task_groups, "constraints": {}})
+    snapshot, credits = node_manager.get_evaluation_view(job_id)
+    planner = SchedulerPlanner("eval", TriggerEvent.JOB_UPDATE if existing_job else TriggerEvent.JOB_SUBMIT,
+                               node_manager.get_job_model(job_id), snapshot, existing_job=existing_job,
+                               resource_credits=credits)
+    result = planner.process(node_manager)
+    for allocation_id in result["allocations_to_delete"]:
+        node_manager.delete_allocation(allocation_id, notify_agent=False)
+    for allocation in result["plan"]:
+        allocation.status = AllocationStatus.RUNNING
+        node_manager.update_allocation(allocation)
+    return result
+
+def _instances(node_manager, job_id):
+    return sorted((alloc["alloc_index"], alloc["allocation_id"]) for alloc in node_manager.get_job_allocations(job_id))
+
+@pytest.mark.parametrize("scoring", ["binpack", "spread", "worst-fit", {"binpack": 1, "spread": 1}])
+def test_select_many_matches_repeated_select(scoring):
+    rng = random.Random(7)
+    nodes = [{"node_id": f"node-{i}", "resources": {"cpu": rng.choice([500, 1000, 2000]), "memory": rng.choice([1024, 4096])},
+              "capacity": {"cpu": 2000, "memory": 4096}, "healthy": rng.random() > 0.1} for i in range(100)]
+    required = {"cpu": 100, "memory": 256}
+    scorer = make_scorer(scoring)
+    batch = NodeCapacityMatrix(nodes)
+    batch.deduct("node-3", {"cpu": 300, "memory": 0})
+    rows = batch.select_many(batch.feasible_mask(required), required, 400, scorer)
+
+    single = NodeCapacityMatrix(nodes)
+    single.deduct("node-3", {"cpu": 300, "memory": 0})
+    expected = []
+    while len(expected) < 400:
+        row = single.select(single.feasible_mask(required), required, scorer)
+        if row is None:
+            break
+        expected.append(row)
+        single.deduct(nodes[row]["node_id"], required)
+    assert rows == expected
+
+def test_count_places_indexed_instances(node_manager):
+    result = _evaluate(node_manager, "job-1", [_group(4, cpu=600)])
+    assert result["success"]
+    assert sorted(allocation.index for allocation in result["plan"]) == list(range(4))
+    # 每个节点只能放下一个600 cpu的实例，4个节点已满
+    assert len({allocation.node_id for allocation in result["plan"]}) == 4
+    assert not _evaluate(node_manager, "job-2", [_group(1, cpu=600)])["success"]
+
+def test_updates_reconcile_only_the_count_difference(node_manager):
+    _evaluate(node_manager, "job-1", [_group(3)])
+    before = _instances(node_manager, "job-1")
+
+    result = _evaluate(node_manager, "job-1", [_group(5)])
+    assert result["allocations_to_delete"] == []
+    assert sorted(allocation.index for allocation in result["plan"]) == [3, 4]
+    assert _instances(node_manager, "job-1")[:3] == before
+
+    result = _evaluate(node_manager, "job-1", [_group(2)])
+    assert result["plan"] == []
+    assert _instances(node_manager, "job-1") == before[:2]
+
+    # 任务配置变化时替换全部实例
+    result = _evaluate(node_manager, "job-1", [_group(2, command="sleep 2")])
+    assert len(result["allocations_to_delete"]) == 2
+    assert sorted(allocation.index for allocation in result["plan"]) == [0, 1]
+
+def test_instance_index_survives_restart(node_manager, reopen):
+    _evaluate(node_manager, "job-1", [_group(3)])
+    instances = _instances(node_manager, "job-1")
+    assert _instances(reopen(), "job-1") == instances
+
+def test_ten_thousand_instances_in_one_evaluation():
+    nodes = [{"node_id": f"node-{i}", "resources": {"cpu": 4000, "memory": 16384}, "healthy": True} for i in range(2000)]
+    job = Job("job-1", [_group(10000, cpu=50)], {})
+    start = time.perf_counter()
+    result = SchedulerPlanner("eval", TriggerEvent.JOB_SUBMIT, job, nodes).process(NoAllocations())
+    assert time.perf_counter() - start < 1.0
+    assert result["success"] and len(result["plan"]) == 10000
+
+@pytest.mark.parametrize("count", [-1, 1.5, "3", True])
+def test_invalid_count_is_rejected(count):
+    assert invalid_task_group_count([_group(count)])
+    assert invalid_task_group_count([_group(0)]) is None
+
+def test_partial_placement_is_applied_and_only_the_rest_is_blocked(cluster):
+    node_manager, scheduler, executor = cluster
+    evaluation = scheduler.create_evaluation(job_data(400, count=10))
+    job_id = evaluation.job.id
+    # 4个节点各放下2个实例：放得下的8个实例照常创建，剩余2个实例被阻塞
+    assert wait_until(lambda: node_manager.get_evaluation(evaluation.id)["status"] == "blocked")
+    assert node_manager.get_evaluation(evaluation.id)["plan"]["created"] == 8
+    assert len(node_manager.get_job_allocations(job_id)) == 8
+    metric = scheduler.blocked_placement(job_id)["alloc_metrics"]["web"]
+    assert (metric["instances"], metric["placed"]) == (10, 8)
+
+    # 新节点加入后重新评估只放置剩余的实例
+    register_node(node_manager, "node-4", ip_address="10.0.0.4")
+    assert wait_until(lambda: len(node_manager.get_job_allocations(job_id)) == 10)
+    assert sorted(alloc["alloc_index"] for alloc in node_manager.get_job_allocations(job_id)) == list(range(10))
+    assert wait_until(lambda: node_manager.get_job(job_id)["status"] == "running")
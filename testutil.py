@@ -0,0 +1,37 @@
+"""测试共用的替身对象和辅助函数（fixture见conftest.py）"""
+import time
+from typing import Callable, Dict, List, Optional
+
+class NoAllocations:
+    """规划器所需的最小状态读取对象：作业没有现有分配"""
+
+    def get_job_allocations(self, job_id):
+        return []
+
+    def preemptible_allocations(self, node_ids, max_priority, exclude_job_id=None):
+        return {}
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5) -> bool:
+    """轮询直到条件成立或超时，返回最后一次检查的结果"""
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def register_node(node_manager, node_id: str, cpu: int = 1000, memory: int = 4096, ip_address: str = "10.0.0.1"):
+    node_manager.register_node({
+        "node_id": node_id,
+        "ip_address": ip_address,
+        "resources": {"cpu": cpu, "memory": memory},
+        "healthy": True
+    })
+
+def job_data(cpu: int = 100, count: int = 1, priority: Optional[int] = None,
+             constraints: Optional[List[Dict]] = None, memory: int = 128) -> Dict:
+    """只有一个任务组web（一个任务）的作业规范"""
+    data = {"task_groups": [{"name": "web", "count": count, "constraints": constraints or [],
+                             "tasks": [{"name": "task", "resources": {"cpu": cpu, "memory": memory}, "config": {}}]}],
+            "constraints": {}}
+    if priority is not None:
+        data["priority"] = priority
+    return data